@@ -1,122 +1,640 @@
-from langchain_community.chat_models import ChatOpenAI
-from langchain.schema import HumanMessage, SystemMessage
 import os
+import asyncio
 import logging
+import threading
+import time
+from typing import List
+from pydantic import BaseModel, Field, ValidationError
+from response_cache import get_response_cache, RESPONSE_CACHE_MIN_CONFIDENCE
+from metrics import span, record_tokens
+from prompts import (GUIDELINES, SYSTEM_PROMPT, STREAMING_PROMPT, STRUCTURED_PROMPT, SUMMARY_PROMPT,
+                     FOLLOWUP_PROMPT, build_user_prompt)
+from routing import (ROUTING_RULES_CONFIDENCE, ROUTING_ESCALATION_THRESHOLD, match_playbook,
+                     estimate_cost, token_usage, usage_handler, attach_usage, get_routing_stats)
+from resilience import (CircuitBreaker, CircuitOpenError, LLMCallGuard, LLM_CALL_DEADLINE, DEGRADED_CATEGORY,
+                        degraded_response)
 
 logger = logging.getLogger(__name__)
 
-class ITSupportAgent:
+# HTTP client settings shared by every LLM call in this process. Retries
+# and hedging are done by the call guard within LLM_CALL_DEADLINE, so the
+# client itself doesn't retry by default
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", str(LLM_CALL_DEADLINE)))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "0"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "10"))
+LLM_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_KEEPALIVE_CONNECTIONS", "8"))
+# In-flight LLM calls allowed on the async (ASGI) path, per process
+LLM_ASYNC_MAX_CONCURRENCY = int(os.getenv("LLM_ASYNC_MAX_CONCURRENCY", "200"))
+
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+# Stronger model for low-confidence analyses; empty disables escalation
+LLM_ESCALATION_MODEL = os.getenv("LLM_ESCALATION_MODEL", "gpt-4o")
+
+# Single JSON completion per analysis; set to false for the legacy two-call path
+LLM_STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "true").lower() == "true"
+
+TICKET_CATEGORIES = ('network', 'hardware', 'software', 'access', 'other')
+
+
+class TicketAnalysis(BaseModel):
+    """
+    Schema for the structured analysis returned by the model
+    """
+    category: str = 'other'
+    confidence: float = Field(default=0.0, ge=0.0, le=1.0)
+    needs_followup: bool = True
+    understanding: str = ''
+    diagnosis: str = ''
+    initial_questions: str = ''
+    steps: List[str] = Field(default_factory=list)
+    additional_notes: str = ''
+    next_steps: str = ''
+
+    def normalized_category(self):
+        category = self.category.strip().lower()
+        return category if category in TICKET_CATEGORIES else 'other'
+
+    def response_lines(self):
+        """
+        Render the sections in the same layout as the text response format
+        """
+        lines = []
+        if self.understanding:
+            lines.append(f"Understanding: {self.understanding}")
+        if self.diagnosis:
+            lines.append(f"Diagnosis: {self.diagnosis}")
+        if self.initial_questions:
+            lines.append(f"Initial Questions: {self.initial_questions}")
+        if self.steps:
+            lines.append("Steps to Resolve:")
+            lines.extend(f"{i}. {step}" for i, step in enumerate(self.steps, 1))
+        if self.additional_notes:
+            lines.append(f"Additional Notes: {self.additional_notes}")
+        if self.next_steps:
+            lines.append(f"Next Steps: {self.next_steps}")
+        return lines
+
+
+class StreamingResponseParser:
+    """
+    Incrementally parse a streamed completion in the text response format.
+    Header lines (CATEGORY, CONFIDENCE, FOLLOWUP) are reported as soon as they
+    are complete; everything after RESPONSE: is passed through as it arrives.
+    """
+
     def __init__(self):
-        self.llm = ChatOpenAI(
-            temperature=0,
-            model_name="gpt-4o-mini",
-            openai_api_key=os.getenv("OPENAI_API_KEY")
-        )
-
-        self.system_prompt = """
-        You are an experienced IT support professional. Your role is to:
-        1. Analyze IT support tickets thoroughly
-        2. Ask relevant follow-up questions when needed
-        3. Provide detailed troubleshooting steps
-        4. Track issue resolution progress
-        5. Always respond in english as default, unless the user asks in spanish.
-
-        Important Guidelines:
-        - Always acknowledge the user's problem first
-        - Ask follow-up questions when:
-          * The issue description is vague
-          * More technical details are needed
-          * Previous steps didn't resolve the issue
-        - For each solution:
-          * Start with simple steps
-          * Progress to more complex solutions
-          * Include expected outcomes
-          * Mention potential risks or warnings
-
-        When responding, follow this format:
-        CATEGORY: <network|hardware|software|access|other>
-        CONFIDENCE: <score between 0 and 1>
-        RESPONSE:
-        Understanding: <brief summary of the issue>
-        Diagnosis: <likely cause based on symptoms>
-        Initial Questions: <if more information is needed>
-        Steps to Resolve:
-        1. <first step with expected outcome>
-        2. <second step with expected outcome>
-        3. <additional steps as needed>
-        Additional Notes: <warnings, alternative solutions, or escalation criteria>
-        Next Steps: <what to do if these steps don't resolve the issue>
+        self.category = None
+        self.confidence = 0.0
+        self.needs_followup = None
+        self.in_response = False
+        self._buffer = ''
+        self._response = []
+
+    def _parse_header_line(self, line):
+        line = line.strip()
+        if line.startswith('CATEGORY:'):
+            self.category = line.replace('CATEGORY:', '').strip().lower()
+            return {'category': self.category}
+        if line.startswith('CONFIDENCE:'):
+            try:
+                self.confidence = float(line.replace('CONFIDENCE:', '').strip())
+            except ValueError:
+                self.confidence = 0.0
+            return {'confidence': self.confidence}
+        if line.startswith('FOLLOWUP:'):
+            self.needs_followup = 'true' in line.lower()
+            return {'needs_followup': self.needs_followup}
+        if line.startswith('RESPONSE:'):
+            self.in_response = True
+        return None
+
+    def feed(self, chunk):
+        """
+        Consume a chunk and return a list of (event, data) tuples
+        """
+        events = []
+        if self.in_response:
+            self._response.append(chunk)
+            return [('token', chunk)]
+
+        self._buffer += chunk
+        while '\n' in self._buffer and not self.in_response:
+            line, self._buffer = self._buffer.split('\n', 1)
+            meta = self._parse_header_line(line)
+            if meta:
+                events.append(('meta', meta))
+
+        if self.in_response and self._buffer:
+            text, self._buffer = self._buffer, ''
+            self._response.append(text)
+            events.append(('token', text))
+        return events
+
+    def response_lines(self):
+        text = ''.join(self._response)
+        if not self.in_response:
+            # The model skipped the RESPONSE: marker; keep whatever is buffered
+            text = self._buffer
+        return [line.strip() for line in text.split('\n') if line.strip()]
+
+
+def _build_clients():
+    """
+    Sync and async OpenAI clients on pooled, keep-alive HTTP connections so
+    TLS setup is paid once per connection. Shared by every model tier.
+    """
+    # Imported here so that starting the app doesn't pay for the OpenAI SDK
+    import httpx
+    import openai
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    timeout = httpx.Timeout(LLM_REQUEST_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+    limits = httpx.Limits(
+        max_connections=LLM_MAX_CONCURRENCY,
+        max_keepalive_connections=LLM_KEEPALIVE_CONNECTIONS
+    )
+    client = openai.OpenAI(
+        api_key=api_key,
+        timeout=timeout,
+        max_retries=LLM_MAX_RETRIES,
+        http_client=httpx.Client(timeout=timeout, limits=limits)
+    )
+    async_client = openai.AsyncOpenAI(
+        api_key=api_key,
+        timeout=timeout,
+        max_retries=LLM_MAX_RETRIES,
+        http_client=httpx.AsyncClient(timeout=timeout, limits=httpx.Limits(
+            max_connections=LLM_ASYNC_MAX_CONCURRENCY,
+            max_keepalive_connections=LLM_KEEPALIVE_CONNECTIONS
+        ))
+    )
+    return client, async_client
+
+
+def _build_llm(model_name, clients):
+    from langchain_community.chat_models import ChatOpenAI
+
+    client, async_client = clients
+    return ChatOpenAI(
+        temperature=0,
+        model_name=model_name,
+        openai_api_key=client.api_key,
+        request_timeout=LLM_REQUEST_TIMEOUT,
+        max_retries=LLM_MAX_RETRIES,
+        client=client.chat.completions,
+        async_client=async_client.chat.completions
+    )
+
+
+def _chat_messages(system_prompt, user_prompt):
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    return [SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)]
+
+
+class ITSupportAgent:
+    def __init__(self, llm=None, escalation_llm=None):
+        if llm is None:
+            clients = _build_clients()
+            llm = _build_llm(LLM_MODEL, clients)
+            if escalation_llm is None and LLM_ESCALATION_MODEL:
+                escalation_llm = _build_llm(LLM_ESCALATION_MODEL, clients)
+        self.llm = llm
+        # Stronger model re-asked when the default model is unsure; None disables
+        self.escalation_llm = escalation_llm
+
+        # Bounds the number of in-flight LLM calls from this agent
+        self._slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+        # Created on first async use, inside the server's event loop
+        self._async_slots = None
+        # Deadlines, hedged retries and the circuit breaker for every call
+        self.breaker = CircuitBreaker()
+        self._guard = LLMCallGuard(self.breaker, max_workers=LLM_MAX_CONCURRENCY)
+
+        self.guidelines = GUIDELINES
+        self.system_prompt = SYSTEM_PROMPT
+        self.streaming_prompt = STREAMING_PROMPT
+        self.structured_prompt = STRUCTURED_PROMPT
+
+    def _invoke(self, messages, llm=None, **kwargs):
+        """
+        Call the LLM (the default model unless another is given), waiting at
+        most LLM_QUEUE_TIMEOUT seconds for a free slot and LLM_CALL_DEADLINE
+        seconds for the answer
+        """
+        if not self._slots.acquire(timeout=LLM_QUEUE_TIMEOUT):
+            raise RuntimeError("Timed out waiting for an LLM slot")
+        def attempt():
+            handler = usage_handler()
+            return attach_usage((llm or self.llm).invoke(messages, config={'callbacks': [handler]}, **kwargs), handler)
+
+        try:
+            with span('llm_call'):
+                return self._guard.call(attempt)
+        finally:
+            self._slots.release()
+
+    async def _ainvoke(self, messages, llm=None, **kwargs):
+        """
+        Async counterpart of _invoke for the ASGI request path. Waiting
+        requests hold no thread, so the limit can be far higher.
+        """
+        if self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(LLM_ASYNC_MAX_CONCURRENCY)
+        try:
+            await asyncio.wait_for(self._async_slots.acquire(), LLM_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise RuntimeError("Timed out waiting for an LLM slot")
+        async def attempt():
+            handler = usage_handler()
+            return attach_usage(await (llm or self.llm).ainvoke(messages, config={'callbacks': [handler]}, **kwargs),
+                                handler)
+
+        try:
+            with span('llm_call'):
+                return await self._guard.acall(attempt)
+        finally:
+            self._async_slots.release()
+
+    def _stream(self, messages):
+        """
+        Stream completion chunks, holding an LLM slot until the stream ends
+        """
+        if not self._slots.acquire(timeout=LLM_QUEUE_TIMEOUT):
+            raise RuntimeError("Timed out waiting for an LLM slot")
+        try:
+            with span('llm_stream'):
+                for chunk in self._guard.stream(self.llm.stream(messages)):
+                    if chunk.content:
+                        yield chunk.content
+        finally:
+            self._slots.release()
+
+    def _build_prompt(self, system_prompt, description, conversation_history=None):
+        """
+        User message for an analysis, trimmed so the call fits LLM_INPUT_TOKEN_BUDGET
+        """
+        return build_user_prompt(system_prompt, description, conversation_history)
+
+    def _adjust_confidence(self, confidence, response_text):
+        # Adjust confidence based on response completeness
+        if len(response_text) < 5:  # If response is too short
+            confidence = min(confidence, 0.5)
+
+        # Reduce confidence if key sections are missing
+        required_sections = ['Understanding:', 'Diagnosis:', 'Steps to Resolve:']
+        for section in required_sections:
+            if not any(section in line for line in response_text):
+                confidence = min(confidence, 0.6)
+        return confidence
+
+    def _parse_legacy_response(self, content):
+        """
+        Parse the CATEGORY:/CONFIDENCE:/RESPONSE: text format
+        """
+        lines = content.split('\n')
+        category = None
+        confidence = 0.0
+        response_text = []
+
+        current_section = None
+        for line in lines:
+            line = line.strip()
+            if line.startswith('CATEGORY:'):
+                category = line.replace('CATEGORY:', '').strip().lower()
+            elif line.startswith('CONFIDENCE:'):
+                confidence = float(line.replace('CONFIDENCE:', '').strip())
+            elif line.startswith('RESPONSE:'):
+                current_section = 'response'
+            elif current_section == 'response' and line:
+                response_text.append(line)
+
+        confidence = self._adjust_confidence(confidence, response_text)
+        return '\n'.join(response_text), confidence, category
+
+    def _parse_structured_response(self, content):
+        """
+        Parse a JSON completion against the TicketAnalysis schema
+        """
+        content = content.strip()
+        if content.startswith('```'):
+            content = content.strip('`')
+            content = content[content.index('{'):] if '{' in content else content
+
+        analysis = TicketAnalysis.model_validate_json(content)
+        response_text = analysis.response_lines()
+        confidence = self._adjust_confidence(analysis.confidence, response_text)
+        return '\n'.join(response_text), confidence, analysis.normalized_category(), analysis.needs_followup
+
+    def _analysis_request(self, description, conversation_history=None):
+        """
+        Messages and invoke kwargs for an analysis in the configured format
+        """
+        if not LLM_STRUCTURED_OUTPUT:
+            prompt = self._build_prompt(self.system_prompt, description, conversation_history)
+            return _chat_messages(self.system_prompt, prompt), {}
+        prompt = self._build_prompt(self.structured_prompt, description, conversation_history)
+        messages = _chat_messages(self.structured_prompt, prompt)
+        return messages, {'response_format': {"type": "json_object"}}
+
+    def _parse_analysis(self, content):
+        """
+        Parse a completion into (response, confidence, category, needs_followup).
+        needs_followup is None when the legacy text format is used.
+        """
+        with span('response_parse'):
+            return self._parse_completion(content)
+
+    def _parse_completion(self, content):
+        if not LLM_STRUCTURED_OUTPUT:
+            return (*self._parse_legacy_response(content), None)
+        try:
+            return self._parse_structured_response(content)
+        except (ValidationError, ValueError) as e:
+            logger.warning(f"Structured response did not match schema, falling back to text parser: {str(e)}")
+            return (*self._parse_legacy_response(content), None)
+
+    def _playbook_analysis(self, description, conversation_history):
+        """
+        Answer an obvious first-contact issue from the local playbook
+        """
+        if conversation_history:
+            return None
+        started = time.perf_counter()
+        playbook = match_playbook(description)
+        if playbook is None:
+            return None
+        get_routing_stats().record('rules', time.perf_counter() - started)
+        return '\n'.join(playbook.lines), ROUTING_RULES_CONFIDENCE, playbook.category, False
+
+    def _degraded_analysis(self, description, conversation_history=None):
+        """
+        Keyword-based answer used when the LLM can't be reached. Confidence is
+        None: the answer says nothing about whether the ticket needs a human.
+        """
+        return degraded_response(description, reanalyze=not conversation_history), None, DEGRADED_CATEGORY
+
+    def retry_after(self):
+        """
+        Seconds until the LLM is worth asking again; 0 unless the breaker is open
         """
+        return self.breaker.retry_after()
+
+    def _record_tier(self, tier, llm, messages, response, seconds):
+        prompt_tokens, completion_tokens, estimated = token_usage(messages, response)
+        cost = estimate_cost(getattr(llm, 'model_name', None), prompt_tokens, completion_tokens)
+        get_routing_stats().record(tier, seconds, prompt_tokens, completion_tokens, cost, estimated)
+        record_tokens(tier, prompt_tokens, completion_tokens, estimated)
+
+    def _should_escalate(self, result):
+        return self.escalation_llm is not None and result[1] < ROUTING_ESCALATION_THRESHOLD
+
+    def _pick_escalated(self, result, escalated):
+        """
+        Keep the stronger model's answer unless it is less confident
+        """
+        get_routing_stats().record_escalation(escalated[1] >= ROUTING_ESCALATION_THRESHOLD)
+        return escalated if escalated[1] >= result[1] else result
+
+    def _analyze_tier(self, tier, llm, messages, kwargs):
+        started = time.perf_counter()
+        response = self._invoke(messages, llm=llm, **kwargs)
+        self._record_tier(tier, llm, messages, response, time.perf_counter() - started)
+        return self._parse_analysis(response.content)
+
+    async def _aanalyze_tier(self, tier, llm, messages, kwargs):
+        started = time.perf_counter()
+        response = await self._ainvoke(messages, llm=llm, **kwargs)
+        self._record_tier(tier, llm, messages, response, time.perf_counter() - started)
+        return self._parse_analysis(response.content)
+
+    def _analyze(self, description, conversation_history=None):
+        """
+        Route an analysis: the local playbook for obvious issues, then the
+        default model, re-asking the escalation model when confidence is low
+        """
+        result = self._playbook_analysis(description, conversation_history)
+        if result is not None:
+            return result
+
+        messages, kwargs = self._analysis_request(description, conversation_history)
+        result = self._analyze_tier('default', self.llm, messages, kwargs)
+        if self._should_escalate(result):
+            try:
+                escalated = self._analyze_tier('escalation', self.escalation_llm, messages, kwargs)
+                result = self._pick_escalated(result, escalated)
+            except Exception as e:
+                logger.error(f"Escalation model failed, keeping the default model's analysis: {str(e)}")
+        return result
+
+    async def _aanalyze(self, description, conversation_history=None):
+        result = self._playbook_analysis(description, conversation_history)
+        if result is not None:
+            return result
+
+        messages, kwargs = self._analysis_request(description, conversation_history)
+        result = await self._aanalyze_tier('default', self.llm, messages, kwargs)
+        if self._should_escalate(result):
+            try:
+                escalated = await self._aanalyze_tier('escalation', self.escalation_llm, messages, kwargs)
+                result = self._pick_escalated(result, escalated)
+            except Exception as e:
+                logger.error(f"Escalation model failed, keeping the default model's analysis: {str(e)}")
+        return result
 
     def analyze_ticket(self, description, conversation_history=None):
         try:
-            # Include conversation history in the prompt if available
-            prompt = description
-            if conversation_history:
-                prompt = f"""
-                Previous Conversation:
-                {conversation_history}
-
-                Current Message:
-                {description}
-
-                Provide a response that takes into account the previous conversation and any steps already attempted.
-                """
-
-            messages = [
-                SystemMessage(content=self.system_prompt),
-                HumanMessage(content=prompt)
-            ]
-
-            response = self.llm.invoke(messages)
-
-            # Parse the response
-            lines = response.content.split('\n')
-            category = None
-            confidence = 0.0
-            response_text = []
-
-            current_section = None
-            for line in lines:
-                line = line.strip()
-                if line.startswith('CATEGORY:'):
-                    category = line.replace('CATEGORY:', '').strip().lower()
-                elif line.startswith('CONFIDENCE:'):
-                    confidence = float(line.replace('CONFIDENCE:', '').strip())
-                elif line.startswith('RESPONSE:'):
-                    current_section = 'response'
-                elif current_section == 'response' and line:
-                    response_text.append(line)
-
-            # Adjust confidence based on response completeness
-            if len(response_text) < 5:  # If response is too short
-                confidence = min(confidence, 0.5)
-
-            # Reduce confidence if key sections are missing
-            required_sections = ['Understanding:', 'Diagnosis:', 'Steps to Resolve:']
-            for section in required_sections:
-                if not any(section in line for line in response_text):
-                    confidence = min(confidence, 0.6)
-
-            final_response = '\n'.join(response_text)
-            return final_response, confidence, category
+            # Only first-contact analyses are reusable; chat turns depend on history
+            cache = get_response_cache() if not conversation_history else None
+            if cache is not None:
+                cached = cache.get(description)
+                if cached is not None:
+                    return cached
+
+            started = time.perf_counter()
+            response, confidence, category, _ = self._analyze(description, conversation_history)
+
+            if cache is not None:
+                cache.record_llm_latency(time.perf_counter() - started)
+                if confidence >= RESPONSE_CACHE_MIN_CONFIDENCE:
+                    cache.put(description, (response, confidence, category))
+            return response, confidence, category
+
+        except CircuitOpenError:
+            return self._degraded_analysis(description, conversation_history)
+        except Exception as e:
+            logger.error(f"Error in AI analysis: {str(e)}")
+            return self._degraded_analysis(description, conversation_history)
+
+    def analyze_ticket_with_followup(self, description, conversation_history=None):
+        """
+        Analyze a message and decide whether follow-up questions are needed.
+        Uses a single completion in structured mode and two calls otherwise.
+        """
+        try:
+            response, confidence, category, needs_followup = self._analyze(description, conversation_history)
+        except CircuitOpenError:
+            return (*self._degraded_analysis(description, conversation_history), True)
+        except Exception as e:
+            logger.error(f"Error in AI analysis: {str(e)}")
+            return (*self._degraded_analysis(description, conversation_history), True)
+
+        if needs_followup is None:
+            needs_followup = self.needs_followup(description)
+        return response, confidence, category, needs_followup
+
+    async def analyze_ticket_async(self, description, conversation_history=None):
+        """
+        Async counterpart of analyze_ticket
+        """
+        try:
+            cache = get_response_cache() if not conversation_history else None
+            if cache is not None:
+                cached = cache.get(description)
+                if cached is not None:
+                    return cached
+
+            started = time.perf_counter()
+            response, confidence, category, _ = await self._aanalyze(description, conversation_history)
+
+            if cache is not None:
+                cache.record_llm_latency(time.perf_counter() - started)
+                if confidence >= RESPONSE_CACHE_MIN_CONFIDENCE:
+                    cache.put(description, (response, confidence, category))
+            return response, confidence, category
 
+        except CircuitOpenError:
+            return self._degraded_analysis(description, conversation_history)
+        except Exception as e:
+            logger.error(f"Error in AI analysis: {str(e)}")
+            return self._degraded_analysis(description, conversation_history)
+
+    async def analyze_ticket_with_followup_async(self, description, conversation_history=None):
+        """
+        Async counterpart of analyze_ticket_with_followup
+        """
+        try:
+            response, confidence, category, needs_followup = await self._aanalyze(description, conversation_history)
+        except CircuitOpenError:
+            return (*self._degraded_analysis(description, conversation_history), True)
         except Exception as e:
             logger.error(f"Error in AI analysis: {str(e)}")
-            return "I apologize, but I'm having trouble analyzing this ticket.", 0.0, "error"
+            return (*self._degraded_analysis(description, conversation_history), True)
+
+        if needs_followup is None:
+            needs_followup = await self.needs_followup_async(description)
+        return response, confidence, category, needs_followup
+
+    def stream_analysis(self, description, conversation_history=None):
+        """
+        Stream the analysis as ('meta', dict) and ('token', str) events, ending
+        with a ('done', dict) event holding the parsed response, confidence,
+        category and needs_followup.
+        """
+        parser = StreamingResponseParser()
+        try:
+            messages = _chat_messages(
+                self.streaming_prompt,
+                self._build_prompt(self.streaming_prompt, description, conversation_history)
+            )
+            for chunk in self._stream(messages):
+                yield from parser.feed(chunk)
+
+            response_text = parser.response_lines()
+            confidence = self._adjust_confidence(parser.confidence, response_text)
+            needs_followup = parser.needs_followup
+            if needs_followup is None:
+                needs_followup = True
+            yield ('done', {
+                'response': '\n'.join(response_text),
+                'confidence': confidence,
+                'category': parser.category,
+                'needs_followup': needs_followup
+            })
+
+        except Exception as e:
+            if not isinstance(e, CircuitOpenError):
+                logger.error(f"Error in streamed AI analysis: {str(e)}")
+            # 'done' replaces anything streamed before the failure
+            response, confidence, category = self._degraded_analysis(description, conversation_history)
+            yield ('done', {
+                'response': response,
+                'confidence': confidence,
+                'category': category,
+                'needs_followup': True
+            })
+
+    def _summary_messages(self, previous_summary, transcript):
+        return _chat_messages(SUMMARY_PROMPT, build_user_prompt(
+            SUMMARY_PROMPT, f"Current summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"))
+
+    def summarize_conversation(self, previous_summary, transcript):
+        """
+        Extend a running conversation summary with newer turns
+        """
+        response = self._invoke(self._summary_messages(previous_summary, transcript))
+        return response.content.strip()
+
+    async def summarize_conversation_async(self, previous_summary, transcript):
+        response = await self._ainvoke(self._summary_messages(previous_summary, transcript))
+        return response.content.strip()
+
+    def _followup_messages(self, description):
+        return _chat_messages(FOLLOWUP_PROMPT, build_user_prompt(
+            FOLLOWUP_PROMPT, f"Does this IT support issue need follow-up questions? Issue: {description}"))
 
     def needs_followup(self, description):
         """
         Analyze if the issue description needs follow-up questions
         """
         try:
-            messages = [
-                SystemMessage(content="You are an IT support analyst. Determine if this issue description needs follow-up questions. Respond with only 'true' or 'false'."),
-                HumanMessage(content=f"Does this IT support issue need follow-up questions? Issue: {description}")
-            ]
+            response = self._invoke(self._followup_messages(description))
+            return 'true' in response.content.lower()
+        except Exception as e:
+            logger.error(f"Error checking follow-up need: {str(e)}")
+            return True  # Default to needing follow-up if there's an error
 
-            response = self.llm.invoke(messages)
+    async def needs_followup_async(self, description):
+        try:
+            response = await self._ainvoke(self._followup_messages(description))
             return 'true' in response.content.lower()
         except Exception as e:
             logger.error(f"Error checking follow-up need: {str(e)}")
-            return True  # Default to needing follow-up if there's an error
\ No newline at end of file
+            return True
+
+
+_agent = None
+_agent_pid = None
+_agent_lock = threading.Lock()
+
+
+def get_support_agent():
+    """
+    Return the process-wide ITSupportAgent, creating it on first use.
+    The agent is rebuilt after a fork so workers never share HTTP connections.
+    """
+    global _agent, _agent_pid
+    if _agent is not None and _agent_pid == os.getpid():
+        return _agent
+    with _agent_lock:
+        if _agent is None or _agent_pid != os.getpid():
+            _agent = ITSupportAgent()
+            _agent_pid = os.getpid()
+    return _agent
+
+
+def warm_support_agent():
+    """
+    Build the shared agent ahead of the first request.
+    Set LLM_WARM_PING=true to also open a connection to the API.
+    """
+    try:
+        agent = get_support_agent()
+        if os.getenv("LLM_WARM_PING", "false").lower() == "true":
+            from langchain_core.messages import HumanMessage
+            agent.llm.invoke([HumanMessage(content="ping")], max_tokens=1)
+        logger.info("IT support agent warmed")
+    except Exception as e:
+        logger.error(f"Error warming IT support agent: {str(e)}")
@@ -0,0 +1,278 @@
+import os
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import or_, and_, update
+
+from app import db
+from models import Ticket, AnalysisJob
+from agent import get_support_agent
+from notifications import notify_support_team
+from incidents import find_incident, join_incident
+from resilience import DEGRADED_CATEGORY
+
+logger = logging.getLogger(__name__)
+
+# "sync" analyzes inside the request, "queued" hands tickets to background workers
+TICKET_INGESTION_MODE = os.getenv("TICKET_INGESTION_MODE", "sync").lower()
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+# Workers started in sync mode on the first ticket answered while the LLM
+# was down, to re-analyze such tickets once it's back
+DEFERRED_ANALYSIS_WORKERS = int(os.getenv("DEFERRED_ANALYSIS_WORKERS", "1"))
+ANALYSIS_POLL_INTERVAL = float(os.getenv("ANALYSIS_POLL_INTERVAL", "2"))
+ANALYSIS_MAX_ATTEMPTS = int(os.getenv("ANALYSIS_MAX_ATTEMPTS", "3"))
+ANALYSIS_RETRY_DELAY = int(os.getenv("ANALYSIS_RETRY_DELAY", "30"))
+# Running jobs older than this are assumed to belong to a dead worker
+ANALYSIS_JOB_LEASE = int(os.getenv("ANALYSIS_JOB_LEASE", "300"))
+
+CONFIDENCE_THRESHOLD = 0.7
+
+_wakeup = threading.Event()
+_workers = []
+_workers_pid = None
+_workers_lock = threading.Lock()
+
+
+def queued_ingestion_enabled():
+    # Queued tickets need a worker; without background workers they are
+    # analyzed in the request instead
+    from app import BACKGROUND_WORKERS
+    return TICKET_INGESTION_MODE == "queued" and BACKGROUND_WORKERS
+
+
+def enqueue_analysis(ticket, session=None):
+    """
+    Add a queue entry for the ticket to the session (the Flask-SQLAlchemy
+    one by default). The caller commits the session.
+    """
+    job = AnalysisJob(ticket_id=ticket.id, status='queued')
+    (session or db.session).add(job)
+    return job
+
+
+def _retry_at(attempts=1):
+    # No sooner than the breaker will let a call through again
+    delay = max(get_support_agent().retry_after(), ANALYSIS_RETRY_DELAY * max(attempts, 1))
+    return datetime.utcnow() + timedelta(seconds=delay)
+
+
+def defer_analysis(ticket, session=None):
+    """
+    Queue a full analysis for a ticket that was given a degraded-mode
+    answer, to run once the LLM is expected to be back. The caller commits.
+    """
+    job = AnalysisJob(ticket_id=ticket.id, status='queued', available_at=_retry_at())
+    (session or db.session).add(job)
+    _start_deferred_workers()
+    return job
+
+
+def _start_deferred_workers():
+    # Imported here: app imports this module before defining these
+    from app import app, BACKGROUND_WORKERS
+    if BACKGROUND_WORKERS and not queued_ingestion_enabled():
+        _start_workers(app, DEFERRED_ANALYSIS_WORKERS)
+
+
+def notify_workers():
+    """
+    Wake local workers so a new job doesn't wait for the next poll
+    """
+    _wakeup.set()
+
+
+def claim_next_job(import_batch_id=None):
+    """
+    Atomically move the oldest available job to 'running', optionally only
+    from one import batch. The conditional UPDATE makes this safe across
+    threads and processes.
+    """
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=ANALYSIS_JOB_LEASE)
+    claimable = or_(
+        and_(AnalysisJob.status == 'queued', AnalysisJob.available_at <= now),
+        and_(AnalysisJob.status == 'running', AnalysisJob.locked_at < stale_before,
+             AnalysisJob.attempts < ANALYSIS_MAX_ATTEMPTS)
+    )
+
+    if import_batch_id is not None:
+        claimable = and_(AnalysisJob.import_batch_id == import_batch_id, claimable)
+
+    candidate = db.session.query(AnalysisJob.id).filter(claimable).order_by(AnalysisJob.id).first()
+    if candidate is None:
+        return None
+
+    result = db.session.execute(
+        update(AnalysisJob)
+        .where(AnalysisJob.id == candidate.id, claimable)
+        .values(status='running', locked_at=now, attempts=AnalysisJob.attempts + 1)
+    )
+    db.session.commit()
+    if result.rowcount != 1:
+        return None  # another worker got there first
+    return db.session.get(AnalysisJob, candidate.id)
+
+
+def apply_analysis(ticket, response, confidence, category, keep_status=False):
+    """
+    Store the AI analysis on the ticket and return True if it needs a human.
+    keep_status leaves the status of an imported ticket that arrived with
+    one alone; such a ticket never needs a human.
+    """
+    requires_human = confidence < CONFIDENCE_THRESHOLD
+    ticket.ai_response = response
+    ticket.confidence_score = confidence
+    ticket.category = category or ticket.category
+    if keep_status:
+        return False
+    ticket.requires_human_attention = requires_human
+    ticket.status = "pending_review" if requires_human else "open"
+    return requires_human
+
+
+def process_job(job):
+    """
+    Analyze the job's ticket. Returns False if the LLM call failed.
+    """
+    ticket = db.session.get(Ticket, job.ticket_id)
+    if ticket is None:
+        job.status = 'failed'
+        job.last_error = 'Ticket no longer exists'
+        db.session.commit()
+        return True
+
+    # Imported tickets are history: they neither join incidents nor notify
+    # anyone, and keep the status they were imported with
+    imported = job.import_batch_id is not None
+    keep_status = imported and ticket.status != 'queued'
+
+    # A ticket about an ongoing incident shares its analysis and notification
+    incident = find_incident(ticket.description) if not imported else None
+    if incident is not None:
+        apply_analysis(ticket, incident.ai_response, incident.confidence_score, incident.category)
+        join_incident(incident, ticket)
+        job.status = 'done'
+        job.completed_at = datetime.utcnow()
+        db.session.commit()
+        return True
+
+    support_agent = get_support_agent()
+    response, confidence, category = support_agent.analyze_ticket(ticket.description)
+
+    # analyze_ticket falls back to a degraded-mode answer when the LLM call
+    # fails. Show it meanwhile and retry; attempts are only used up while
+    # the breaker is closed, so an outage doesn't fail every queued ticket.
+    if category == DEGRADED_CATEGORY:
+        if support_agent.breaker.is_open:
+            job.attempts -= 1
+        if job.attempts < ANALYSIS_MAX_ATTEMPTS:
+            ticket.ai_response = response
+            job.status = 'queued'
+            job.last_error = 'AI analysis failed'
+            job.available_at = _retry_at(job.attempts)
+            db.session.commit()
+            logger.warning(f"Analysis for ticket #{ticket.id} failed, retry {job.attempts}/{ANALYSIS_MAX_ATTEMPTS}")
+            return False
+
+        # Keeps failing while the LLM is up: a person takes it from here
+        requires_human = apply_analysis(ticket, response, 0.0, None, keep_status)
+        job.status = 'failed'
+    else:
+        requires_human = apply_analysis(ticket, response, confidence, category, keep_status)
+        job.status = 'done'
+    job.completed_at = datetime.utcnow()
+    if requires_human and not imported:
+        notify_support_team(ticket)
+    db.session.commit()
+    return job.status == 'done'
+
+
+def fail_abandoned_jobs():
+    """
+    Fail running jobs whose worker died during their last attempt, which
+    claim_next_job no longer hands out, and pass their tickets to a person
+    as process_job does after the last retry. Returns the number failed.
+    """
+    now = datetime.utcnow()
+    abandoned = and_(AnalysisJob.status == 'running',
+                     AnalysisJob.locked_at < now - timedelta(seconds=ANALYSIS_JOB_LEASE),
+                     AnalysisJob.attempts >= ANALYSIS_MAX_ATTEMPTS)
+    failed = 0
+    for job in AnalysisJob.query.filter(abandoned).order_by(AnalysisJob.id).all():
+        result = db.session.execute(
+            update(AnalysisJob)
+            .where(AnalysisJob.id == job.id, abandoned)
+            .values(status='failed', last_error='Worker lost during the last attempt', completed_at=now)
+        )
+        if result.rowcount != 1:
+            continue  # another worker got there first
+        ticket = db.session.get(Ticket, job.ticket_id)
+        if ticket is not None and ticket.status == 'queued':
+            apply_analysis(ticket, ticket.ai_response, 0.0, None)
+            if job.import_batch_id is None:
+                notify_support_team(ticket)
+        db.session.commit()
+        failed += 1
+        logger.warning(f"Analysis job {job.id} for ticket #{job.ticket_id} was abandoned on its last attempt")
+    return failed
+
+
+def run_pending_jobs(limit=None):
+    """
+    Process queued jobs in the current app context until the queue is empty.
+    Returns the number of jobs processed.
+    """
+    fail_abandoned_jobs()
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_next_job()
+        if job is None:
+            break
+        try:
+            process_job(job)
+        except Exception as e:
+            logger.error(f"Error processing analysis job {job.id}: {str(e)}")
+            db.session.rollback()
+        processed += 1
+    return processed
+
+
+def _worker_loop(app, stop_event):
+    while not stop_event.is_set():
+        try:
+            with app.app_context():
+                processed = run_pending_jobs()
+        except Exception as e:
+            logger.error(f"Analysis worker error: {str(e)}")
+            processed = 0
+        if not processed:
+            _wakeup.wait(ANALYSIS_POLL_INTERVAL)
+            _wakeup.clear()
+
+
+def start_analysis_workers(app, count=None):
+    """
+    Start background analysis threads for this process when queued ingestion
+    is enabled. Safe to call more than once and again after a fork.
+    """
+    if not queued_ingestion_enabled():
+        return
+    _start_workers(app, ANALYSIS_WORKERS if count is None else count)
+
+
+def _start_workers(app, count):
+    global _workers, _workers_pid
+    if count <= 0:
+        return
+    with _workers_lock:
+        if _workers_pid == os.getpid():
+            return
+        stop_event = threading.Event()
+        _workers = [
+            threading.Thread(target=_worker_loop, args=(app, stop_event), name=f"analysis-worker-{i}", daemon=True)
+            for i in range(count)
+        ]
+        for worker in _workers:
+            worker.start()
+        _workers_pid = os.getpid()
+        logger.info(f"Started {count} analysis workers")
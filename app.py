@@ -1,20 +1,29 @@
 import os
 import logging
-from flask import Flask, render_template, request, flash, redirect, url_for, jsonify, send_file
+from flask import Flask, render_template, request, flash, redirect, url_for, jsonify, Response, stream_with_context, session, abort
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from datetime import datetime, timedelta
 import re
-from sqlalchemy import func
-import csv
-import io
+from sqlalchemy import func, case, tuple_
+from sqlalchemy.orm import load_only
+import json
 from datetime import datetime
 import logging
+import io
+import time
+import hmac
+import threading
+import click
 
 # Configure logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
+# Serverless deployments start a fresh process on a cold request, so skip
+# startup work the first request doesn't need. Vercel sets VERCEL=1.
+FAST_STARTUP = os.environ.get("FAST_STARTUP", "true" if os.environ.get("VERCEL") else "false").lower() == "true"
+
 class Base(DeclarativeBase):
     pass
 
@@ -38,9 +47,35 @@ def nl2br(value):
 
 db.init_app(app)
 
-from models import Ticket
-from agent import ITSupportAgent
-from notifications import notify_support_team
+from models import Ticket, Message, ConversationSummary, ImportBatch
+from agent import get_support_agent, warm_support_agent
+from notifications import notify_support_team, start_notification_dispatcher, drain_notifications
+from response_cache import get_response_cache
+from routing import get_routing_stats
+import metrics
+from conversation import build_conversation_history, record_message, get_message_page
+from exports import parse_columns, stream_csv, stream_parquet, parquet_available
+from schema import upgrade_schema
+from bulk_import import import_tickets, batch_progress, start_bulk_analysis, run_bulk_analysis, IMPORT_CONCURRENCY
+from changefeed import subscribe_ticket_changes
+from incidents import find_incident, join_incident, get_incident_index
+from render_cache import cached_fragment, get_render_cache
+from archive import find_ticket, archive_resolved_tickets, ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE
+from search import search_tickets, setup_search_index, rebuild_search_index
+from stats import (USE_STATS_ROLLUP, AGE_BINS, AGE_LABELS, rollup_metrics, rollup_age_distribution,
+                   rollup_resolution_trend, rebuild_ticket_stats, ensure_ticket_stats)
+from analysis_queue import (queued_ingestion_enabled, enqueue_analysis, defer_analysis, notify_workers,
+                            start_analysis_workers, run_pending_jobs)
+from resilience import DEGRADED_CATEGORY
+
+metrics.init_app(app)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    Request, stage and token metrics in the Prometheus text format
+    """
+    return Response(metrics.render_metrics(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/')
 def index():
@@ -58,11 +93,52 @@ def submit_ticket():
             flash('Please fill in all required fields.', 'error')
             return redirect(url_for('index'))
 
-        # Initialize IT Support Agent
-        support_agent = ITSupportAgent()
-
-        # Get agent's response and confidence
-        response, confidence, auto_category = support_agent.analyze_ticket(description)
+        # Persist the ticket now and let a background worker analyze it
+        if queued_ingestion_enabled():
+            ticket = Ticket(
+                name=name,
+                email=email,
+                description=description,
+                category=category,
+                status="queued",
+                requires_human_attention=False
+            )
+            db.session.add(ticket)
+            db.session.flush()
+            enqueue_analysis(ticket)
+            db.session.commit()
+            notify_workers()
+            return redirect(url_for('chat_view', ticket_id=ticket.id))
+
+        # Tickets about an ongoing incident share its analysis and notification
+        incident = find_incident(description)
+        if incident is not None:
+            response, confidence, auto_category = incident.ai_response, incident.confidence_score, incident.category
+        else:
+            # Reuse the process-wide IT Support Agent
+            support_agent = get_support_agent()
+
+            # Get agent's response and confidence
+            response, confidence, auto_category = support_agent.analyze_ticket(description)
+
+            # The LLM is unavailable: show the general answer now and analyze
+            # the ticket once it's back, rather than escalating it
+            if auto_category == DEGRADED_CATEGORY:
+                ticket = Ticket(
+                    name=name,
+                    email=email,
+                    description=description,
+                    category=category,
+                    status="queued",
+                    ai_response=response,
+                    requires_human_attention=False
+                )
+                db.session.add(ticket)
+                db.session.flush()
+                defer_analysis(ticket)
+                db.session.commit()
+                flash('Our AI assistant is busy right now; a full analysis of your ticket will follow shortly.', 'info')
+                return redirect(url_for('chat_view', ticket_id=ticket.id))
 
         # Determine if human attention is needed based on confidence
         requires_human = confidence < 0.7
@@ -80,11 +156,17 @@ def submit_ticket():
         )
 
         db.session.add(ticket)
+        if incident is not None:
+            join_incident(incident, ticket)
+        elif requires_human:
+            # Notify support team if confidence is low
+            db.session.flush()
+            notify_support_team(ticket)
         db.session.commit()
 
-        # Notify support team if confidence is low
-        if requires_human:
-            notify_support_team(ticket)
+        if incident is not None:
+            flash('Your ticket has been linked to an ongoing incident our team is already handling.', 'info')
+        elif requires_human:
             flash('Your ticket has been escalated to our support team.', 'info')
 
         # Redirect to chat interface
@@ -96,20 +178,127 @@ def submit_ticket():
         flash('An error occurred while processing your request.', 'error')
         return redirect(url_for('index'))
 
+def cached_ticket_response(ticket_id, fragment, render, mimetype='text/html'):
+    """
+    Serve a ticket's page or payload from the render cache with an ETag, so
+    a client polling an unchanged ticket gets a 304 without a DB query
+    """
+    etag, body = cached_fragment(ticket_id, fragment, render)
+    response = Response(body, mimetype=mimetype)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+def find_ticket_or_404(ticket_id):
+    """
+    The ticket, or a read-only view of it from the archive, and the archived
+    chat messages (None for live tickets)
+    """
+    ticket, archived_messages = find_ticket(ticket_id)
+    if ticket is None:
+        abort(404)
+    return ticket, archived_messages
+
+def render_chat_page(ticket_id):
+    ticket, archived_messages = find_ticket_or_404(ticket_id)
+    if archived_messages is not None:
+        return render_template('chat.html', ticket=ticket, messages=archived_messages, next_before=None,
+                               archived=True)
+    messages, next_before = get_message_page(ticket.id)
+    return render_template('chat.html', ticket=ticket, messages=messages, next_before=next_before)
+
 @app.route('/chat/<int:ticket_id>')
 def chat_view(ticket_id):
     try:
-        ticket = Ticket.query.get_or_404(ticket_id)
-        return render_template('chat.html', ticket=ticket)
+        # Pages carrying this visitor's flash messages must not be shared
+        if session.get('_flashes'):
+            return render_chat_page(ticket_id)
+        return cached_ticket_response(ticket_id, 'chat', lambda: render_chat_page(ticket_id))
     except Exception as e:
         logger.error(f"Error accessing chat view: {str(e)}")
         flash('Error accessing chat interface.', 'error')
         return redirect(url_for('index'))
 
+def render_status_page(ticket_id):
+    ticket, _ = find_ticket_or_404(ticket_id)
+    return render_template('ticket_status.html', ticket=ticket)
+
+@app.route('/ticket/<int:ticket_id>')
+def ticket_status(ticket_id):
+    if session.get('_flashes'):
+        return render_status_page(ticket_id)
+    return cached_ticket_response(ticket_id, 'status', lambda: render_status_page(ticket_id))
+
+@app.route('/chat/<int:ticket_id>/messages')
+def chat_messages(ticket_id):
+    """
+    Older chat turns for the chat page, newest first by keyset on message id
+    """
+    before_id = request.args.get('before', type=int)
+    messages, next_before = get_message_page(ticket_id, before_id=before_id)
+    return jsonify({
+        'messages': [message.to_dict() for message in messages],
+        'next_before': next_before
+    })
+
+@app.route('/ticket/<int:ticket_id>/analysis')
+def ticket_analysis(ticket_id):
+    """
+    Polled by the chat page while a queued ticket waits for its analysis
+    """
+    def render():
+        ticket, _ = find_ticket_or_404(ticket_id)
+        return json.dumps({
+            'status': ticket.status,
+            'category': ticket.category,
+            'ai_response': ticket.ai_response,
+            'confidence_score': ticket.confidence_score,
+            'requires_human_attention': ticket.requires_human_attention
+        })
+    return cached_ticket_response(ticket_id, 'analysis', render, mimetype='application/json')
+
+def update_chat_confidence(ticket, confidence):
+    """
+    Lower the ticket's confidence after a chat turn. Returns True if the
+    ticket was newly escalated and the support team should be notified.
+    """
+    if confidence is None:
+        return False  # a degraded-mode answer, not a judgement of the ticket
+    if ticket.confidence_score is None or confidence < ticket.confidence_score:
+        ticket.confidence_score = confidence
+        if confidence < 0.7 and not ticket.requires_human_attention:
+            ticket.requires_human_attention = True
+            ticket.status = 'pending_review'
+            return True
+    return False
+
+def add_followup_prompts(response, user_message, needs_followup):
+    """
+    Append follow-up questions if the agent asked for more details
+    """
+    if needs_followup:
+        response += "\n\nTo better assist you, could you please provide more details about:"
+        if 'error message' in user_message.lower():
+            response += "\n- The exact error message you're seeing"
+        if 'not working' in user_message.lower():
+            response += "\n- When did this issue start?"
+            response += "\n- Have you made any recent changes to your system?"
+    return response
+
+def apply_chat_result(ticket, user_message, response, confidence, needs_followup):
+    """
+    Update the ticket after a chat turn and return the response shown to the user
+    """
+    if update_chat_confidence(ticket, confidence):
+        notify_support_team(ticket)
+    return add_followup_prompts(response, user_message, needs_followup)
+
 @app.route('/chat_message', methods=['POST'])
 def chat_message():
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Missing request body'}), 400
         ticket_id = data.get('ticket_id')
         user_message = data.get('message')
 
@@ -118,40 +307,19 @@ def chat_message():
 
         ticket = Ticket.query.get_or_404(ticket_id)
 
-        # Initialize IT Support Agent
-        support_agent = ITSupportAgent()
+        # Reuse the process-wide IT Support Agent
+        support_agent = get_support_agent()
 
-        # Build conversation history
-        conversation_history = f"""
-        Initial Issue: {ticket.description}
-        Initial AI Response: {ticket.ai_response}
-        Current Status: {ticket.status}
-        """
-
-        # Get agent's response with conversation history
-        response, confidence, _ = support_agent.analyze_ticket(
+        # Get agent's response and follow-up decision with conversation history
+        response, confidence, _, needs_followup = support_agent.analyze_ticket_with_followup(
             user_message,
-            conversation_history=conversation_history
+            conversation_history=build_conversation_history(ticket, support_agent)
         )
 
-        # Update ticket's confidence score and status
-        if confidence < ticket.confidence_score:
-            ticket.confidence_score = confidence
-            if confidence < 0.7 and not ticket.requires_human_attention:
-                ticket.requires_human_attention = True
-                ticket.status = 'pending_review'
-                notify_support_team(ticket)
-
-        # Check if follow-up questions are needed
-        needs_followup = support_agent.needs_followup(user_message)
-        if needs_followup:
-            response += "\n\nTo better assist you, could you please provide more details about:"
-            if 'error message' in user_message.lower():
-                response += "\n- The exact error message you're seeing"
-            if 'not working' in user_message.lower():
-                response += "\n- When did this issue start?"
-                response += "\n- Have you made any recent changes to your system?"
+        response = apply_chat_result(ticket, user_message, response, confidence, needs_followup)
 
+        record_message(ticket.id, 'user', user_message)
+        record_message(ticket.id, 'assistant', response)
         db.session.commit()
         return jsonify({'response': response})
 
@@ -159,6 +327,105 @@ def chat_message():
         logger.error(f"Error processing chat message: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/chat_message_stream', methods=['POST'])
+def chat_message_stream():
+    """
+    Server-sent events variant of chat_message: 'meta' events carry the
+    category/confidence as soon as they are parsed, 'token' events carry
+    response text, and 'done' carries the final response once the ticket
+    has been committed.
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Missing request body'}), 400
+        ticket_id = data.get('ticket_id')
+        user_message = data.get('message')
+
+        if not all([ticket_id, user_message]):
+            return jsonify({'error': 'Missing required fields'}), 400
+
+        ticket = db.session.get(Ticket, ticket_id)
+        if ticket is None:
+            return jsonify({'error': 'Ticket not found'}), 404
+        support_agent = get_support_agent()
+        conversation_history = build_conversation_history(ticket, support_agent)
+        ticket_pk = ticket.id
+        # Persist any summary update before the view returns and the session closes
+        db.session.commit()
+
+    except Exception as e:
+        logger.error(f"Error starting chat message stream: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Internal server error'}), 500
+
+    def generate():
+        for event, payload in support_agent.stream_analysis(user_message, conversation_history):
+            if event == 'done':
+                try:
+                    # The request's session was closed when the view returned
+                    current_ticket = db.session.get(Ticket, ticket_pk)
+                    payload['response'] = apply_chat_result(
+                        current_ticket, user_message, payload['response'],
+                        payload['confidence'], payload['needs_followup']
+                    )
+                    record_message(current_ticket.id, 'user', user_message)
+                    record_message(current_ticket.id, 'assistant', payload['response'])
+                    db.session.commit()
+                except Exception as e:
+                    logger.error(f"Error saving streamed chat message: {str(e)}")
+                    db.session.rollback()
+                    yield sse_event('error', {'error': 'Internal server error'})
+                    return
+            yield sse_event(event, payload)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/cache_stats')
+def cache_stats():
+    cache = get_response_cache()
+    if cache is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **cache.stats()})
+
+@app.route('/render_cache_stats')
+def render_cache_stats():
+    cache = get_render_cache()
+    if cache is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **cache.stats()})
+
+@app.route('/routing_stats')
+def routing_stats():
+    """
+    Per-tier call counts, latency and estimated cost of ticket analyses
+    """
+    return jsonify(get_routing_stats().stats())
+
+@app.route('/llm_stats')
+def llm_stats():
+    """
+    Circuit breaker state of the LLM call layer
+    """
+    return jsonify(get_support_agent().breaker.stats())
+
+@app.route('/incident_stats')
+def incident_stats():
+    """
+    Duplicate-detection lookups and how often they matched an open incident
+    """
+    index = get_incident_index()
+    if index is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **index.stats()})
+
 @app.route('/escalate_ticket', methods=['POST'])
 def escalate_ticket():
     try:
@@ -171,9 +438,8 @@ def escalate_ticket():
         ticket = Ticket.query.get_or_404(ticket_id)
         ticket.requires_human_attention = True
         ticket.status = 'pending_review'
-        db.session.commit()
-
         notify_support_team(ticket)
+        db.session.commit()
         return jsonify({'message': 'Ticket escalated successfully'})
 
     except Exception as e:
@@ -200,6 +466,76 @@ def resolve_ticket():
         logger.error(f"Error resolving ticket: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+DASHBOARD_PAGE_SIZE = int(os.environ.get("DASHBOARD_PAGE_SIZE", "50"))
+
+# Columns the dashboard table needs; the large text columns are never loaded
+DASHBOARD_COLUMNS = (Ticket.id, Ticket.name, Ticket.email, Ticket.category, Ticket.status,
+                     Ticket.created_at, Ticket.resolved_at, Ticket.confidence_score)
+
+def ticket_filter_conditions(args):
+    """
+    Build the status/category/date filter conditions shared by the dashboard views
+    """
+    status_filter = args.get('status', 'all')
+    category_filter = args.get('category', 'all')
+    start_date = args.get('start_date')
+    end_date = args.get('end_date')
+
+    conditions = []
+    if status_filter != 'all':
+        conditions.append(Ticket.status == status_filter)
+
+    if category_filter != 'all':
+        conditions.append(Ticket.category == category_filter)
+
+    if start_date:
+        start_datetime = datetime.strptime(start_date, '%Y-%m-%d')
+        conditions.append(Ticket.created_at >= start_datetime)
+
+    if end_date:
+        end_datetime = datetime.strptime(end_date, '%Y-%m-%d')
+        # Add one day to include the entire end date
+        end_datetime = end_datetime.replace(hour=23, minute=59, second=59)
+        conditions.append(Ticket.created_at <= end_datetime)
+
+    return conditions
+
+def encode_cursor(ticket):
+    return f"{ticket.created_at.isoformat()}_{ticket.id}"
+
+def decode_cursor(cursor):
+    created_at, ticket_id = cursor.rsplit('_', 1)
+    return datetime.fromisoformat(created_at), int(ticket_id)
+
+def get_ticket_page(conditions, cursor=None, limit=DASHBOARD_PAGE_SIZE):
+    """
+    Keyset-paginate tickets newest first on (created_at, id).
+    Returns (tickets, cursor for the next page or None).
+    """
+    query = Ticket.query.options(load_only(*DASHBOARD_COLUMNS)).filter(*conditions)
+    if cursor:
+        query = query.filter(tuple_(Ticket.created_at, Ticket.id) < decode_cursor(cursor))
+
+    tickets = query.order_by(Ticket.created_at.desc(), Ticket.id.desc()).limit(limit + 1).all()
+    has_more = len(tickets) > limit
+    tickets = tickets[:limit]
+    return tickets, encode_cursor(tickets[-1]) if has_more and tickets else None
+
+def get_ticket_metrics(conditions):
+    """
+    Compute the dashboard metrics in a single aggregate query
+    """
+    total, resolved, pending = db.session.query(
+        func.count(Ticket.id),
+        func.coalesce(func.sum(case((Ticket.status == 'resolved', 1), else_=0)), 0),
+        func.coalesce(func.sum(case((Ticket.status == 'pending_review', 1), else_=0)), 0)
+    ).filter(*conditions).one()
+    return {
+        'total_tickets': total,
+        'resolved_tickets': resolved,
+        'pending_tickets': pending
+    }
+
 @app.route('/dashboard')
 def dashboard():
     try:
@@ -209,39 +545,18 @@ def dashboard():
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
 
-        # Base query for tickets
-        query = Ticket.query
-
-        # Apply filters
-        if status_filter != 'all':
-            query = query.filter(Ticket.status == status_filter)
-
-        if category_filter != 'all':
-            query = query.filter(Ticket.category == category_filter)
-
-        if start_date:
-            start_datetime = datetime.strptime(start_date, '%Y-%m-%d')
-            query = query.filter(Ticket.created_at >= start_datetime)
-
-        if end_date:
-            end_datetime = datetime.strptime(end_date, '%Y-%m-%d')
-            # Add one day to include the entire end date
-            end_datetime = end_datetime.replace(hour=23, minute=59, second=59)
-            query = query.filter(Ticket.created_at <= end_datetime)
-
-        # Get tickets ordered by creation date
-        tickets = query.order_by(Ticket.created_at.desc()).all()
+        conditions = ticket_filter_conditions(request.args)
 
-        # Calculate metrics using the same filtered query
-        base_metrics_query = query
-        metrics = {
-            'total_tickets': query.count(),
-            'resolved_tickets': query.filter(Ticket.status == 'resolved').count(),
-            'pending_tickets': query.filter(Ticket.status == 'pending_review').count()
-        }
+        # First page of tickets; the rest are fetched from /api/tickets
+        tickets, next_cursor = get_ticket_page(conditions)
+        if USE_STATS_ROLLUP:
+            metrics = rollup_metrics(request.args)
+        else:
+            metrics = get_ticket_metrics(conditions)
 
         return render_template('dashboard.html', 
                              tickets=tickets, 
+                             next_cursor=next_cursor,
                              metrics=metrics,
                              status_filter=status_filter,
                              category_filter=category_filter,
@@ -253,65 +568,215 @@ def dashboard():
         flash('Error accessing dashboard.', 'error')
         return redirect(url_for('index'))
 
+# Streams end after this long and the browser reconnects, so a sync worker
+# is never held past the gunicorn timeout
+DASHBOARD_STREAM_SECONDS = int(os.environ.get("DASHBOARD_STREAM_SECONDS", "45"))
+DASHBOARD_STREAM_KEEPALIVE = 15
+# Each open stream holds a worker thread, so past this many per process new
+# streams get a 503 and the browser retries later rather than starving
+# ordinary requests; keep it below the worker's thread count
+DASHBOARD_MAX_STREAMS = int(os.environ.get("DASHBOARD_MAX_STREAMS", "4"))
+DASHBOARD_STREAM_RETRY_AFTER = 30
+_dashboard_streams = threading.BoundedSemaphore(DASHBOARD_MAX_STREAMS)
+
+def dashboard_changes(args, conditions, ticket_ids=None, since=None):
+    """
+    Rows matching the dashboard's filters among the changed tickets (or
+    those updated since a time), the changed ids that no longer match, and
+    the current metrics
+    """
+    query = Ticket.query.options(load_only(*DASHBOARD_COLUMNS, Ticket.updated_at)).filter(*conditions)
+    if ticket_ids is not None:
+        query = query.filter(Ticket.id.in_(ticket_ids))
+    else:
+        query = query.filter(Ticket.updated_at >= since).order_by(Ticket.updated_at.desc()).limit(DASHBOARD_PAGE_SIZE)
+    tickets = query.all()
+
+    now = datetime.utcnow()
+    matched = {ticket.id for ticket in tickets}
+    return {
+        'tickets': [ticket.to_summary_dict(now) for ticket in sorted(tickets, key=lambda t: (t.created_at, t.id))],
+        'removed': sorted(set(ticket_ids or ()) - matched),
+        'metrics': rollup_metrics(args) if USE_STATS_ROLLUP else get_ticket_metrics(conditions)
+    }
+
+@app.route('/dashboard/stream')
+def dashboard_stream():
+    """
+    Server-sent events for an open dashboard: each 'tickets' event carries
+    the new or changed rows for its filters plus updated metrics. A
+    reconnecting browser sends the last event id and receives the rows
+    updated since then.
+    """
+    try:
+        conditions = ticket_filter_conditions(request.args)
+    except ValueError:
+        return jsonify({'error': 'Invalid filter'}), 400
+    args = request.args.copy()
+    # Browsers only resend Last-Event-ID on their own reconnects; the
+    # dashboard passes it as a parameter after a refused stream
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+
+    if not _dashboard_streams.acquire(blocking=False):
+        return (jsonify({'error': 'Too many open dashboard streams'}), 503,
+                {'Retry-After': str(DASHBOARD_STREAM_RETRY_AFTER)})
+    try:
+        subscription = subscribe_ticket_changes(app)
+    except Exception:
+        _dashboard_streams.release()
+        raise
+
+    def generate():
+        # Event ids are the time the feed was last caught up to, so a
+        # reconnecting browser can ask for whatever it missed in between
+        deadline = time.monotonic() + DASHBOARD_STREAM_SECONDS
+        try:
+            yield "retry: 2000\n\n"
+            if last_event_id:
+                try:
+                    since = datetime.fromisoformat(last_event_id)
+                    caught_up = datetime.utcnow().isoformat()
+                    yield f"id: {caught_up}\n" + sse_event('tickets', dashboard_changes(args, conditions, since=since))
+                except ValueError:
+                    pass
+                finally:
+                    db.session.remove()
+
+            while time.monotonic() < deadline:
+                caught_up = datetime.utcnow().isoformat()
+                ticket_ids = subscription.get(timeout=min(DASHBOARD_STREAM_KEEPALIVE, max(deadline - time.monotonic(), 0.1)))
+                if ticket_ids is None:
+                    yield f"id: {caught_up}\n: keepalive\n\n"
+                    continue
+                if ticket_ids is False:
+                    # Changes were dropped for this viewer; start over
+                    yield sse_event('reload', {})
+                    return
+                try:
+                    payload = dashboard_changes(args, conditions, ticket_ids=ticket_ids)
+                finally:
+                    # Don't hold a pooled connection between events
+                    db.session.remove()
+                yield f"id: {caught_up}\n" + sse_event('tickets', payload)
+        finally:
+            subscription.close()
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # Runs when the server closes the response, even if it was never iterated
+    response.call_on_close(_dashboard_streams.release)
+    return response
+
+@app.route('/api/tickets')
+def api_tickets():
+    """
+    Next page of dashboard tickets for the given filters and cursor
+    """
+    try:
+        conditions = ticket_filter_conditions(request.args)
+        limit = min(request.args.get('limit', DASHBOARD_PAGE_SIZE, type=int), 500)
+        tickets, next_cursor = get_ticket_page(conditions, cursor=request.args.get('cursor'), limit=limit)
+
+        now = datetime.utcnow()
+        return jsonify({
+            'tickets': [ticket.to_summary_dict(now) for ticket in tickets],
+            'next_cursor': next_cursor
+        })
+
+    except ValueError:
+        return jsonify({'error': 'Invalid filter or cursor'}), 400
+    except Exception as e:
+        logger.error(f"Error listing tickets: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/search')
+def api_search():
+    """
+    Ranked full-text search over ticket descriptions and AI responses
+    """
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': 'Missing search query'}), 400
+        return jsonify(search_tickets(query, page=request.args.get('page', 1, type=int)))
+
+    except Exception as e:
+        logger.error(f"Error searching tickets: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/tickets/import', methods=['POST'])
+def api_import_tickets():
+    """
+    Bulk-insert tickets from an uploaded JSONL or CSV file (or the raw
+    request body) and analyze them in the background. analyze=false skips
+    the analysis.
+    """
+    try:
+        import_format = request.args.get('format', 'jsonl')
+        if import_format not in ('jsonl', 'csv'):
+            return jsonify({'error': 'format must be jsonl or csv'}), 400
+
+        upload = request.files.get('file')
+        if upload is not None:
+            source, raw = upload.filename or 'upload', upload.stream
+        else:
+            source, raw = 'request body', request.stream
+        stream = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+
+        analyze = request.args.get('analyze', 'true').lower() == 'true'
+        batch = import_tickets(stream, import_format, source, analyze=analyze)
+        if analyze:
+            start_bulk_analysis(app, batch.id)
+        return jsonify(batch_progress(batch)), 202
+
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': f'Invalid import data: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f"Error importing tickets: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/imports/<int:batch_id>')
+def api_import_progress(batch_id):
+    """
+    Insert and analysis progress of an import batch
+    """
+    batch = db.session.get(ImportBatch, batch_id)
+    if batch is None:
+        return jsonify({'error': 'Import not found'}), 404
+    return jsonify(batch_progress(batch))
+
 @app.route('/download_csv')
 def download_csv():
+    """
+    Stream the filtered tickets as CSV, or as Parquet with format=parquet.
+    columns=id,name,... limits the export to those columns.
+    """
     try:
         # Use the same filtering logic as the dashboard
-        status_filter = request.args.get('status', 'all')
-        category_filter = request.args.get('category', 'all')
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-
-        query = Ticket.query
-
-        if status_filter != 'all':
-            query = query.filter(Ticket.status == status_filter)
-
-        if category_filter != 'all':
-            query = query.filter(Ticket.category == category_filter)
-
-        if start_date:
-            start_datetime = datetime.strptime(start_date, '%Y-%m-%d')
-            query = query.filter(Ticket.created_at >= start_datetime)
-
-        if end_date:
-            end_datetime = datetime.strptime(end_date, '%Y-%m-%d')
-            end_datetime = end_datetime.replace(hour=23, minute=59, second=59)
-            query = query.filter(Ticket.created_at <= end_datetime)
-
-        tickets = query.order_by(Ticket.created_at.desc()).all()
-
-        # Create CSV in memory
-        output = io.StringIO()
-        writer = csv.writer(output)
-
-        # Write headers
-        writer.writerow(['ID', 'Name', 'Email', 'Category', 'Status', 'Created At', 
-                        'Resolved At', 'Updated At', 'Description', 'AI Response', 'Confidence Score'])
-
-        # Write ticket data
-        for ticket in tickets:
-            writer.writerow([
-                ticket.id,
-                ticket.name,
-                ticket.email,
-                ticket.category,
-                ticket.status,
-                ticket.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                ticket.resolved_at.strftime('%Y-%m-%d %H:%M:%S') if ticket.resolved_at else '',
-                ticket.updated_at.strftime('%Y-%m-%d %H:%M:%S'),
-                ticket.description,
-                ticket.ai_response,
-                ticket.confidence_score
-            ])
-
-        # Prepare the output
-        output.seek(0)
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8')),
+        conditions = ticket_filter_conditions(request.args)
+        columns = parse_columns(request.args.get('columns'))
+        export_format = request.args.get('format', 'csv')
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+        if export_format == 'parquet':
+            if not parquet_available():
+                flash('Parquet export requires pyarrow to be installed.', 'error')
+                return redirect(url_for('dashboard'))
+            return Response(
+                stream_with_context(stream_parquet(conditions, columns)),
+                mimetype='application/vnd.apache.parquet',
+                headers={'Content-Disposition': f'attachment; filename=tickets_{timestamp}.parquet'}
+            )
+
+        return Response(
+            stream_with_context(stream_csv(conditions, columns)),
             mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'tickets_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+            headers={'Content-Disposition': f'attachment; filename=tickets_{timestamp}.csv'}
         )
 
     except Exception as e:
@@ -319,60 +784,69 @@ def download_csv():
         flash('Error downloading CSV file.', 'error')
         return redirect(url_for('dashboard'))
 
+def days_between(end, start):
+    """
+    Portable SQL expression for the number of days from start to end
+    """
+    if db.engine.dialect.name == 'postgresql':
+        return func.extract('epoch', end - start) / 86400.0
+    return func.julianday(end) - func.julianday(start)
+
+def age_distribution(now):
+    """
+    Count tickets per age bin in one grouped query
+    """
+    age = days_between(func.coalesce(Ticket.resolved_at, now), Ticket.created_at)
+    bin_index = case(
+        *[(age <= upper_bound, i) for i, upper_bound in enumerate(AGE_BINS)],
+        else_=len(AGE_BINS)
+    ).label('bin')
+
+    counts = [0] * len(AGE_LABELS)
+    for index, count in db.session.query(bin_index, func.count()).group_by(bin_index):
+        counts[index] += count
+    return counts
+
+def resolution_time_trend(now, months=6):
+    """
+    Average resolution time in days for each 30-day window, oldest first,
+    in one grouped query
+    """
+    window_starts = [now - timedelta(days=30 * (i + 1)) for i in range(months - 1, -1, -1)]
+    window_index = case(
+        *[(Ticket.created_at >= start, i) for i, start in reversed(list(enumerate(window_starts)))]
+    ).label('window')
+
+    averages = dict(
+        db.session.query(window_index, func.avg(days_between(Ticket.resolved_at, Ticket.created_at)))
+        .filter(Ticket.created_at >= window_starts[0],
+                Ticket.created_at < now,
+                Ticket.resolved_at.isnot(None))
+        .group_by(window_index)
+        .all()
+    )
+
+    labels = [start.strftime('%Y-%m') for start in window_starts]
+    values = [round(float(averages.get(i) or 0), 1) for i in range(months)]
+    return labels, values
+
 @app.route('/chart_data')
 def chart_data():
     try:
         # Calculate current time for age calculations
         now = datetime.utcnow()
 
-        # Get all tickets
-        tickets = Ticket.query.all()
-
-        # Calculate age distribution
-        age_bins = [0, 1, 2, 3, 7, 14, 30, float('inf')]  # in days
-        age_labels = ['1 day', '2 days', '3 days', '1 week', '2 weeks', '1 month', '> 1 month']
-        age_counts = [0] * len(age_labels)
-
-        # Calculate resolution time trend (last 6 months)
-        months = 6
-        resolution_labels = []
-        resolution_values = []
-
-        for i in range(months-1, -1, -1):
-            start_date = datetime.now() - timedelta(days=30 * (i+1))
-            end_date = datetime.now() - timedelta(days=30 * i)
-            month_tickets = Ticket.query.filter(
-                Ticket.created_at >= start_date,
-                Ticket.created_at < end_date,
-                Ticket.resolved_at.isnot(None)
-            ).all()
-
-            if month_tickets:
-                avg_resolution_time = sum(
-                    (t.resolved_at - t.created_at).total_seconds() / 86400  # Convert to days
-                    for t in month_tickets
-                ) / len(month_tickets)
-            else:
-                avg_resolution_time = 0
-
-            resolution_labels.append(start_date.strftime('%Y-%m'))
-            resolution_values.append(round(avg_resolution_time, 1))
-
-        # Calculate age distribution
-        for ticket in tickets:
-            end_time = ticket.resolved_at if ticket.resolved_at else now
-            age_days = (end_time - ticket.created_at).total_seconds() / 86400  # Convert to days
-
-            # Find appropriate bin
-            for i, upper_bound in enumerate(age_bins[1:], 0):
-                if age_days <= upper_bound:
-                    age_counts[i] += 1
-                    break
+        if USE_STATS_ROLLUP:
+            resolution_labels, resolution_values = rollup_resolution_trend(now)
+            age_values = rollup_age_distribution(now)
+        else:
+            resolution_labels, resolution_values = resolution_time_trend(now)
+            age_values = age_distribution(now)
 
         return jsonify({
             'age_distribution': {
-                'labels': age_labels,
-                'values': age_counts
+                'labels': AGE_LABELS,
+                'values': age_values
             },
             'resolution_time': {
                 'labels': resolution_labels,
@@ -384,5 +858,140 @@ def chart_data():
         logger.error(f"Error generating chart data: {str(e)}")
         return jsonify({'error': 'Failed to generate chart data'}), 500
 
-with app.app_context():
-    db.create_all()
\ No newline at end of file
+def migrate():
+    """
+    Bring the schema, stats rollup and search index up to date
+    """
+    upgrade_schema()
+    ensure_ticket_stats()
+    setup_search_index()
+
+# With fast startup the schema is only touched by `flask migrate`, which
+# must run before the app is served
+MIGRATE_ON_STARTUP = os.environ.get("MIGRATE_ON_STARTUP", "false" if FAST_STARTUP else "true").lower() == "true"
+# Background threads poll tables the migration creates, so they default to
+# the same setting. Without them notifications are sent and queued tickets
+# analyzed inside the request, and analyses deferred while the LLM was down
+# are run by the scheduled /tasks/background request (see vercel.json).
+BACKGROUND_WORKERS = os.environ.get("BACKGROUND_WORKERS", str(MIGRATE_ON_STARTUP)).lower() == "true"
+# Bearer token the scheduler sends to /tasks/background; Vercel sends CRON_SECRET
+CRON_SECRET = os.environ.get("CRON_SECRET")
+# Analysis jobs per scheduled run, to stay within the platform's request time limit
+BACKGROUND_TASK_JOB_LIMIT = int(os.environ.get("BACKGROUND_TASK_JOB_LIMIT", "5"))
+
+if not BACKGROUND_WORKERS:
+    logger.info("Background workers disabled: notifications are sent inline and deferred "
+                "analyses wait for /tasks/background")
+    if not CRON_SECRET:
+        logger.warning("CRON_SECRET is not set, so /tasks/background is disabled and analyses "
+                       "deferred while the LLM is down will not be retried")
+
+if MIGRATE_ON_STARTUP:
+    with app.app_context():
+        migrate()
+
+# Warm the shared agent so the first ticket doesn't pay client setup;
+# with fast startup the LLM stack is loaded by the first call instead
+LLM_WARM_ON_STARTUP = os.environ.get("LLM_WARM_ON_STARTUP", "false" if FAST_STARTUP else "true").lower() == "true"
+
+if LLM_WARM_ON_STARTUP:
+    warm_support_agent()
+
+def start_background_workers():
+    """
+    Start this process's analysis workers and notification dispatcher.
+    Called by the servers (gunicorn's post_worker_init, the ASGI lifespan,
+    main.py), never on import, so CLI commands and scripts don't start
+    polling threads. Safe to call more than once and again after a fork.
+    """
+    if not BACKGROUND_WORKERS:
+        return
+    start_analysis_workers(app)
+    start_notification_dispatcher(app)
+
+@app.route('/tasks/background')
+def background_tasks():
+    """
+    Run due analysis jobs and send due notifications, for deployments
+    without background workers. Called by the scheduler.
+    """
+    authorization = request.headers.get('Authorization', '')
+    if not CRON_SECRET or not hmac.compare_digest(authorization, f"Bearer {CRON_SECRET}"):
+        return jsonify({'error': 'Forbidden'}), 403
+    try:
+        processed = run_pending_jobs(limit=BACKGROUND_TASK_JOB_LIMIT)
+        handled = drain_notifications()
+        return jsonify({'analysis_jobs': processed, 'notifications': handled})
+    except Exception as e:
+        logger.error(f"Error running background tasks: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Create missing tables, columns and indexes. Run on each deploy."""
+    with app.app_context():
+        migrate()
+    print("Database schema is up to date")
+
+@app.cli.command('analysis-worker')
+def analysis_worker_command():
+    """Process queued ticket analyses until the queue is empty."""
+    with app.app_context():
+        processed = run_pending_jobs()
+    print(f"Processed {processed} analysis jobs")
+
+@app.cli.command('send-notifications')
+def send_notifications_command():
+    """Send all pending support notifications now, ignoring the digest window."""
+    with app.app_context():
+        handled = drain_notifications(force=True)
+    print(f"Handled {handled} notifications")
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """Recompute the TicketStats rollup from the ticket and archive tables."""
+    with app.app_context():
+        rows = rebuild_ticket_stats()
+    print(f"Rebuilt ticket stats rollup with {rows} rows")
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Repopulate the SQLite full-text index from the ticket table."""
+    with app.app_context():
+        rebuild_search_index()
+        db.session.commit()
+    print("Rebuilt search index")
+
+@app.cli.command('archive-tickets')
+@click.option('--older-than-days', type=int, default=ARCHIVE_AFTER_DAYS, help='Days since resolution.')
+@click.option('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+def archive_tickets_command(older_than_days, batch_size):
+    """Move old resolved tickets into the archive table. Meant to run daily from cron."""
+    with app.app_context():
+        archived = archive_resolved_tickets(older_than_days=older_than_days, batch_size=batch_size)
+    print(f"Archived {archived} tickets")
+
+@app.cli.command('import-tickets')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'import_format', type=click.Choice(['jsonl', 'csv']), default='jsonl')
+@click.option('--resume', 'resume_id', type=int, help='Continue an interrupted import batch.')
+@click.option('--concurrency', type=int, default=IMPORT_CONCURRENCY, help='Parallel analysis requests.')
+@click.option('--no-analyze', is_flag=True, help='Only insert the tickets.')
+def import_tickets_command(path, import_format, resume_id, concurrency, no_analyze):
+    """Bulk-import tickets from a JSONL or CSV file and analyze them."""
+    with app.app_context():
+        batch = None
+        if resume_id is not None:
+            batch = db.session.get(ImportBatch, resume_id)
+            if batch is None:
+                raise click.ClickException(f"Import batch {resume_id} not found")
+        with open(path, encoding='utf-8', newline='') as stream:
+            batch = import_tickets(stream, import_format, os.path.basename(path), batch=batch,
+                                   analyze=not no_analyze)
+        print(f"Import batch {batch.id}: {batch.inserted_rows} inserted, {batch.rejected_rows} rejected")
+        batch_id = batch.id
+
+    if not no_analyze:
+        progress = run_bulk_analysis(app, batch_id, concurrency=concurrency)
+        print(f"Analysis: {progress['analysis']}")
@@ -0,0 +1,159 @@
+import os
+import json
+import zlib
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, exists, func
+
+from app import db
+from models import (Ticket, ArchivedTicket, Message, ConversationSummary, AnalysisJob,
+                    OutboundNotification)
+from render_cache import invalidate_tickets
+
+logger = logging.getLogger(__name__)
+
+# Resolved tickets are archived this many days after resolution
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+# "zlib" compresses the archived text columns, "none" stores them as UTF-8
+ARCHIVE_COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", "zlib").lower()
+
+# Tickets with work still pending stay in the ticket table until it's done
+PENDING_WORK = (
+    exists().where(AnalysisJob.ticket_id == Ticket.id, AnalysisJob.status.in_(('queued', 'running'))),
+    exists().where(OutboundNotification.ticket_id == Ticket.id,
+                   OutboundNotification.status.in_(('pending', 'sending'))),
+)
+
+COPIED_COLUMNS = ('id', 'name', 'email', 'category', 'status', 'confidence_score', 'requires_human_attention',
+                  'incident_id', 'created_at', 'updated_at', 'resolved_at')
+
+
+def encode_text(value, compression):
+    if value is None:
+        return None
+    data = value.encode('utf-8')
+    return zlib.compress(data) if compression == 'zlib' else data
+
+
+def decode_text(data, compression):
+    if data is None:
+        return None
+    return (zlib.decompress(data) if compression == 'zlib' else data).decode('utf-8')
+
+
+def _transcripts(ticket_ids):
+    transcripts = {}
+    rows = db.session.execute(
+        select(Message.ticket_id, Message.role, Message.content, Message.token_count, Message.created_at)
+        .where(Message.ticket_id.in_(ticket_ids))
+        .order_by(Message.ticket_id, Message.id)
+    )
+    for row in rows:
+        transcripts.setdefault(row.ticket_id, []).append({
+            'role': row.role,
+            'content': row.content,
+            'token_count': row.token_count,
+            'created_at': row.created_at.isoformat()
+        })
+    return transcripts
+
+
+def _archive_batch(cutoff, batch_size, compression):
+    rows = db.session.execute(
+        select(Ticket.__table__)
+        .where(Ticket.status == 'resolved', Ticket.resolved_at < cutoff,
+               *[~condition for condition in PENDING_WORK],
+               # SQLite hands out max(id) + 1 again, which must not be an archived id
+               Ticket.id < select(func.max(Ticket.id)).scalar_subquery())
+        .order_by(Ticket.id)
+        .limit(batch_size)
+    ).mappings().all()
+    if not rows:
+        return []
+
+    ticket_ids = [row['id'] for row in rows]
+    transcripts = _transcripts(ticket_ids)
+    now = datetime.utcnow()
+    db.session.execute(ArchivedTicket.__table__.insert(), [
+        {
+            **{name: row[name] for name in COPIED_COLUMNS},
+            'archived_at': now,
+            'compression': compression,
+            'description': encode_text(row['description'], compression),
+            'ai_response': encode_text(row['ai_response'], compression),
+            'resolution_notes': encode_text(row['resolution_notes'], compression),
+            'transcript': encode_text(json.dumps(transcripts[row['id']]), compression)
+                          if row['id'] in transcripts else None,
+        }
+        for row in rows
+    ])
+
+    # Core deletes bypass the session events, so the TicketStats rollup keeps
+    # counting archived tickets and the charts keep their history
+    for model in (Message, ConversationSummary, AnalysisJob, OutboundNotification):
+        db.session.execute(delete(model.__table__).where(model.__table__.c.ticket_id.in_(ticket_ids)))
+    db.session.execute(delete(Ticket.__table__).where(Ticket.__table__.c.id.in_(ticket_ids)))
+    db.session.commit()
+    return ticket_ids
+
+
+def archive_resolved_tickets(older_than_days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE,
+                             compression=ARCHIVE_COMPRESSION):
+    """
+    Move tickets resolved more than older_than_days ago, with their chat
+    messages, into the archive table, one committed batch at a time.
+    Returns the number of tickets archived.
+    """
+    if compression not in ('zlib', 'none'):
+        raise ValueError(f"Unknown archive compression: {compression}")
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    archived = 0
+    while True:
+        try:
+            ticket_ids = _archive_batch(cutoff, batch_size, compression)
+        except Exception as e:
+            logger.error(f"Error archiving tickets: {str(e)}")
+            db.session.rollback()
+            raise
+        if not ticket_ids:
+            break
+        invalidate_tickets(ticket_ids)
+        archived += len(ticket_ids)
+        logger.info(f"Archived {archived} tickets")
+    return archived
+
+
+def archived_ticket_view(archived):
+    """
+    Unsaved Ticket and Message objects rebuilt from an archived ticket, for
+    the pages and payloads that render tickets. Never add them to a session.
+    """
+    compression = archived.compression
+    ticket = Ticket(
+        **{name: getattr(archived, name) for name in COPIED_COLUMNS},
+        description=decode_text(archived.description, compression),
+        ai_response=decode_text(archived.ai_response, compression),
+        resolution_notes=decode_text(archived.resolution_notes, compression)
+    )
+    messages = [
+        Message(ticket_id=archived.id, role=m['role'], content=m['content'], token_count=m['token_count'],
+                created_at=datetime.fromisoformat(m['created_at']))
+        for m in json.loads(decode_text(archived.transcript, compression) or '[]')
+    ]
+    return ticket, messages
+
+
+def find_ticket(ticket_id):
+    """
+    Look a ticket up by id in the ticket table, then in the archive.
+    Returns (ticket, archived messages or None), or (None, None).
+    """
+    ticket = db.session.get(Ticket, ticket_id)
+    if ticket is not None:
+        return ticket, None
+    archived = db.session.get(ArchivedTicket, ticket_id)
+    if archived is None:
+        return None, None
+    return archived_ticket_view(archived)
+
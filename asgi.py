@@ -0,0 +1,263 @@
+"""
+ASGI entry point. The LLM-bound endpoints (/submit_ticket and
+/chat_message) run as async handlers on an async SQLAlchemy session and the
+async OpenAI client, so a request waiting on the model holds no thread and
+one process can keep hundreds of tickets in flight. Every other route is
+served by the Flask app through a WSGI adapter.
+
+Run with: uvicorn asgi:application --workers 4
+"""
+import os
+import time
+import logging
+from contextlib import asynccontextmanager
+from a2wsgi import WSGIMiddleware
+from itsdangerous import BadSignature
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, RedirectResponse
+from starlette.routing import Route, Mount
+
+from app import app as flask_app, update_chat_confidence, add_followup_prompts, start_background_workers
+from models import Ticket
+from agent import get_support_agent
+from notifications import notify_support_team_async
+from conversation import build_conversation_history_async, record_message
+from analysis_queue import queued_ingestion_enabled, enqueue_analysis, defer_analysis, notify_workers
+from resilience import DEGRADED_CATEGORY
+from metrics import observe_request
+from incidents import find_incident_async, join_incident
+
+logger = logging.getLogger(__name__)
+
+ASYNC_DB_POOL_SIZE = int(os.getenv("ASYNC_DB_POOL_SIZE", "10"))
+ASYNC_DB_MAX_OVERFLOW = int(os.getenv("ASYNC_DB_MAX_OVERFLOW", "20"))
+# Threads serving the Flask routes mounted behind the async ones
+WSGI_THREADS = int(os.getenv("WSGI_THREADS", "10"))
+
+ASYNC_DRIVERS = {
+    'postgres': 'postgresql+asyncpg',
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def async_database_url(url):
+    """
+    Swap the sync driver in DATABASE_URL for its async counterpart
+    """
+    scheme, _, rest = url.partition('://')
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}://{rest}"
+
+
+def _create_engine():
+    url = os.environ.get("ASYNC_DATABASE_URL") or async_database_url(os.environ.get("DATABASE_URL"))
+    if url.startswith('sqlite'):
+        return create_async_engine(url)
+    # Sessions are only held between awaits, so a small pool serves many requests
+    return create_async_engine(
+        url,
+        pool_size=ASYNC_DB_POOL_SIZE,
+        max_overflow=ASYNC_DB_MAX_OVERFLOW,
+        pool_recycle=300,
+        pool_pre_ping=True
+    )
+
+
+engine = _create_engine()
+AsyncSession = async_sessionmaker(engine, expire_on_commit=False)
+
+
+def _flash(request, response, message, category):
+    """
+    Add a flash message to the Flask session cookie so the next page
+    rendered by Flask shows it
+    """
+    interface = flask_app.session_interface
+    serializer = interface.get_signing_serializer(flask_app)
+    if serializer is None:
+        return
+    name = flask_app.config['SESSION_COOKIE_NAME']
+    max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+    try:
+        data = serializer.loads(request.cookies.get(name, ''), max_age=max_age)
+    except BadSignature:
+        data = {}
+    data.setdefault('_flashes', []).append((category, message))
+    response.set_cookie(
+        name,
+        serializer.dumps(data),
+        path=interface.get_cookie_path(flask_app),
+        domain=interface.get_cookie_domain(flask_app),
+        secure=interface.get_cookie_secure(flask_app),
+        httponly=interface.get_cookie_httponly(flask_app),
+        samesite=interface.get_cookie_samesite(flask_app)
+    )
+
+
+def _redirect(request, path, message=None, category='info'):
+    response = RedirectResponse(request.scope.get('root_path', '') + path, status_code=302)
+    if message:
+        _flash(request, response, message, category)
+    return response
+
+
+async def submit_ticket(request):
+    try:
+        form = await request.form()
+        name = form.get('name')
+        email = form.get('email')
+        description = form.get('description')
+        category = form.get('category', 'uncategorized')
+
+        if not all([name, email, description]):
+            return _redirect(request, '/', 'Please fill in all required fields.', 'error')
+
+        async with AsyncSession() as session:
+            # Persist the ticket now and let a background worker analyze it
+            if queued_ingestion_enabled():
+                ticket = Ticket(
+                    name=name,
+                    email=email,
+                    description=description,
+                    category=category,
+                    status="queued",
+                    requires_human_attention=False
+                )
+                session.add(ticket)
+                await session.flush()
+                enqueue_analysis(ticket, session=session)
+                await session.commit()
+                notify_workers()
+                return _redirect(request, f'/chat/{ticket.id}')
+
+            # Tickets about an ongoing incident share its analysis and notification
+            incident = await find_incident_async(session, description)
+            if incident is not None:
+                response, confidence, auto_category = incident.ai_response, incident.confidence_score, incident.category
+            else:
+                response, confidence, auto_category = await get_support_agent().analyze_ticket_async(description)
+
+            # The LLM is unavailable: show the general answer now and analyze
+            # the ticket once it's back, rather than escalating it
+            if auto_category == DEGRADED_CATEGORY:
+                ticket = Ticket(
+                    name=name,
+                    email=email,
+                    description=description,
+                    category=category,
+                    status="queued",
+                    ai_response=response,
+                    requires_human_attention=False
+                )
+                session.add(ticket)
+                await session.flush()
+                defer_analysis(ticket, session=session)
+                await session.commit()
+                return _redirect(request, f'/chat/{ticket.id}',
+                                 'Our AI assistant is busy right now; a full analysis of your ticket will follow shortly.')
+
+            requires_human = confidence < 0.7
+
+            ticket = Ticket(
+                name=name,
+                email=email,
+                description=description,
+                category=auto_category or category,
+                status="pending_review" if requires_human else "open",
+                ai_response=response,
+                confidence_score=confidence,
+                requires_human_attention=requires_human
+            )
+            session.add(ticket)
+            if incident is not None:
+                join_incident(incident, ticket)
+            elif requires_human:
+                await session.flush()
+                await notify_support_team_async(session, ticket)
+            await session.commit()
+
+            if incident is not None:
+                return _redirect(request, f'/chat/{ticket.id}',
+                                 'Your ticket has been linked to an ongoing incident our team is already handling.')
+            if requires_human:
+                return _redirect(request, f'/chat/{ticket.id}', 'Your ticket has been escalated to our support team.')
+            return _redirect(request, f'/chat/{ticket.id}')
+
+    except Exception as e:
+        logger.error(f"Error processing ticket: {str(e)}")
+        return _redirect(request, '/', 'An error occurred while processing your request.', 'error')
+
+
+async def chat_message(request):
+    try:
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            return JSONResponse({'error': 'Missing request body'}, status_code=400)
+        ticket_id = data.get('ticket_id')
+        user_message = data.get('message')
+
+        if not all([ticket_id, user_message]):
+            return JSONResponse({'error': 'Missing required fields'}, status_code=400)
+        try:
+            ticket_id = int(ticket_id)
+        except (TypeError, ValueError):
+            return JSONResponse({'error': 'Invalid ticket_id'}, status_code=400)
+
+        async with AsyncSession() as session:
+            ticket = await session.get(Ticket, ticket_id)
+            if ticket is None:
+                return JSONResponse({'error': 'Ticket not found'}, status_code=404)
+
+            support_agent = get_support_agent()
+            response, confidence, _, needs_followup = await support_agent.analyze_ticket_with_followup_async(
+                user_message,
+                conversation_history=await build_conversation_history_async(session, ticket, support_agent)
+            )
+
+            if update_chat_confidence(ticket, confidence):
+                await notify_support_team_async(session, ticket)
+            response = add_followup_prompts(response, user_message, needs_followup)
+
+            record_message(ticket.id, 'user', user_message, session=session)
+            record_message(ticket.id, 'assistant', response, session=session)
+            await session.commit()
+            return JSONResponse({'response': response})
+
+    except Exception as e:
+        logger.error(f"Error processing chat message: {str(e)}")
+        return JSONResponse({'error': 'Internal server error'}, status_code=500)
+
+
+def instrumented(route, handler):
+    """
+    Record request metrics for an async handler, as the Flask hooks do for
+    the mounted routes
+    """
+    async def endpoint(request):
+        started = time.perf_counter()
+        response = await handler(request)
+        observe_request(route, request.method, response.status_code, time.perf_counter() - started)
+        return response
+    return endpoint
+
+
+@asynccontextmanager
+async def lifespan(_):
+    start_background_workers()
+    yield
+    await engine.dispose()
+
+
+application = Starlette(
+    routes=[
+        Route('/submit_ticket', instrumented('/submit_ticket', submit_ticket), methods=['POST']),
+        Route('/chat_message', instrumented('/chat_message', chat_message), methods=['POST']),
+        Mount('/', app=WSGIMiddleware(flask_app, workers=WSGI_THREADS)),
+    ],
+    lifespan=lifespan
+)
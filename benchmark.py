@@ -0,0 +1,448 @@
+"""
+Offline load test for the main endpoints. ChatOpenAI is replaced by a
+deterministic fake with configurable latency and notifications go to a
+local SMTP sink, so no external service is contacted.
+
+    python benchmark.py --sizes 1000,10000,50000 --output results.json
+    python benchmark.py --compare results.json
+    python benchmark.py --cold-start 10
+
+--cold-start starts fresh interpreters with and without FAST_STARTUP and
+times the app import and the first requests to / and /dashboard.
+
+Set --database-url to benchmark against Postgres; the default is a
+throwaway SQLite file. The database is emptied and reseeded for each size.
+"""
+import os
+import sys
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import platform
+import tempfile
+import subprocess
+import threading
+import socketserver
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+ENDPOINTS = ('submit_ticket', 'chat_message', 'dashboard', 'chart_data', 'download_csv')
+CATEGORIES = ('network', 'hardware', 'software', 'access', 'other')
+STATUSES = ('open', 'pending_review', 'resolved')
+ISSUES = (
+    'VPN disconnects every few minutes when working from home',
+    'Outlook keeps asking for my password after the update',
+    'The second monitor is not detected after docking the laptop',
+    'Cannot access the shared drive for the finance team',
+    'Laptop fan is very loud and the machine gets hot',
+    'Teams calls drop audio after about ten minutes',
+    'Excel crashes when opening large spreadsheets with macros',
+    'Wifi in the meeting room is extremely slow',
+)
+
+
+class FakeChatModel:
+    """
+    Stand-in for ChatOpenAI: sleeps for the configured latency and returns a
+    canned analysis whose confidence is derived from the prompt, so runs are
+    repeatable
+    """
+    model_name = 'benchmark-fake'
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def _content(self, messages, structured):
+        prompt = messages[-1].content
+        digest = int(hashlib.sha1(prompt.encode()).hexdigest(), 16)
+        confidence = 0.5 + (digest % 50) / 100
+        category = CATEGORIES[digest % len(CATEGORIES)]
+        if structured:
+            return json.dumps({
+                'category': category,
+                'confidence': confidence,
+                'needs_followup': digest % 2 == 0,
+                'understanding': 'The user reports an IT issue.',
+                'diagnosis': 'Likely a configuration problem.',
+                'steps': ['Restart the device', 'Check the settings', 'Reinstall the client'],
+                'next_steps': 'Reply if the issue persists.'
+            })
+        if 'Respond with only' in messages[0].content:
+            return 'true' if digest % 2 == 0 else 'false'
+        return (f"CATEGORY: {category}\nCONFIDENCE: {confidence}\nFOLLOWUP: false\nRESPONSE:\n"
+                "Understanding: The user reports an IT issue.\nDiagnosis: Likely a configuration problem.\n"
+                "Steps to Resolve:\n1. Restart the device\n2. Check the settings\nNext Steps: Reply if the issue persists.")
+
+    def invoke(self, messages, **kwargs):
+        from langchain_core.messages import AIMessage
+        time.sleep(self.latency)
+        return AIMessage(content=self._content(messages, 'response_format' in kwargs))
+
+    async def ainvoke(self, messages, **kwargs):
+        import asyncio
+        from langchain_core.messages import AIMessage
+        await asyncio.sleep(self.latency)
+        return AIMessage(content=self._content(messages, 'response_format' in kwargs))
+
+    def stream(self, messages, **kwargs):
+        from langchain_core.messages import AIMessageChunk
+        time.sleep(self.latency)
+        content = self._content(messages, False)
+        for i in range(0, len(content), 16):
+            yield AIMessageChunk(content=content[i:i + 16])
+
+
+class _SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """
+    Minimal SMTP dialogue that accepts and discards every message
+    """
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.reply('220 benchmark SMTP sink')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250 benchmark')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b'.\n', b''):
+                    pass
+                self.server.messages += 1
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _SMTPSinkHandler)
+        self.messages = 0
+        threading.Thread(target=self.serve_forever, name='smtp-sink', daemon=True).start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(p / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+def seed_tickets(db, Ticket, size, seed=1234):
+    """
+    Empty the database and insert `size` synthetic tickets spread over the
+    last six months. Returns the (lowest, highest) ticket id.
+    """
+    from sqlalchemy import insert, func
+    from stats import rebuild_ticket_stats
+
+    for table in reversed(db.metadata.sorted_tables):
+        db.session.execute(table.delete())
+    db.session.commit()
+
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    batch = []
+    for i in range(size):
+        created_at = now - timedelta(minutes=rng.randint(0, 180 * 24 * 60))
+        status = rng.choice(STATUSES)
+        resolved_at = created_at + timedelta(hours=rng.randint(1, 24 * 30)) if status == 'resolved' else None
+        confidence = round(rng.uniform(0.3, 1.0), 2)
+        batch.append({
+            'name': f'User {i}',
+            'email': f'user{i}@example.com',
+            'description': f'{rng.choice(ISSUES)} (case {i})',
+            'category': rng.choice(CATEGORIES),
+            'status': status,
+            'ai_response': 'Understanding: seeded\nDiagnosis: seeded\nSteps to Resolve:\n1. Restart',
+            'confidence_score': confidence,
+            'requires_human_attention': confidence < 0.7,
+            'created_at': created_at,
+            'updated_at': resolved_at or created_at,
+            'resolved_at': resolved_at,
+        })
+        if len(batch) == 5000:
+            db.session.execute(insert(Ticket), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(Ticket), batch)
+    db.session.commit()
+    rebuild_ticket_stats()
+    return db.session.query(func.min(Ticket.id), func.max(Ticket.id)).one()
+
+
+def make_request(client, endpoint, rng, ticket_ids):
+    if endpoint == 'submit_ticket':
+        return client.post('/submit_ticket', data={
+            'name': 'Benchmark', 'email': 'bench@example.com',
+            'description': f'{rng.choice(ISSUES)} (run {rng.random():.6f})'
+        })
+    if endpoint == 'chat_message':
+        return client.post('/chat_message', json={
+            'ticket_id': rng.randint(*ticket_ids), 'message': 'It is still not working'
+        })
+    if endpoint == 'dashboard':
+        return client.get('/dashboard')
+    if endpoint == 'chart_data':
+        return client.get('/chart_data')
+    if endpoint == 'download_csv':
+        response = client.get('/download_csv')
+        response.get_data()  # drain the streamed body
+        return response
+
+
+def succeeded(endpoint, response):
+    """
+    Whether a response is a success. Form posts report failures as a
+    redirect back to the form, so they must land on the new ticket's chat.
+    """
+    if endpoint == 'submit_ticket':
+        return response.status_code == 302 and re.search(r'/chat/\d+$', response.headers.get('Location', '')) is not None
+    return response.status_code < 400
+
+
+def run_endpoint(app, endpoint, size, ticket_ids, requests, concurrency, seed):
+    """
+    Fire `requests` calls at one endpoint from `concurrency` threads and
+    return latency percentiles and throughput
+    """
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def worker(worker_id, count):
+        nonlocal errors
+        client = app.test_client()
+        rng = random.Random(seed + worker_id)
+        for _ in range(count):
+            started = time.perf_counter()
+            try:
+                response = make_request(client, endpoint, rng, ticket_ids)
+                ok = succeeded(endpoint, response)
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                errors += 0 if ok else 1
+
+    shares = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker, i, count) for i, count in enumerate(shares) if count]:
+            future.result()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'endpoint': endpoint,
+        'size': size,
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(1000 * percentile(latencies, 50), 2),
+        'p95_ms': round(1000 * percentile(latencies, 95), 2),
+        'p99_ms': round(1000 * percentile(latencies, 99), 2),
+        'mean_ms': round(1000 * sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        'rps': round(len(latencies) / wall, 2) if wall else 0.0,
+    }
+
+
+COLD_START_PATHS = ('/', '/dashboard')
+
+# Runs in a fresh interpreter so nothing is imported yet
+COLD_START_SCRIPT = """
+import sys, json, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+import main
+timings = {{'import_ms': (time.perf_counter() - started) * 1000}}
+client = main.app.test_client()
+for path in {paths!r}:
+    request_started = time.perf_counter()
+    status = client.get(path).status_code
+    timings[path + '_ms'] = (time.perf_counter() - request_started) * 1000
+    timings[path + '_status'] = status
+timings['total_ms'] = (time.perf_counter() - started) * 1000
+print(json.dumps(timings))
+"""
+
+
+def measure_cold_start(runs, fast_startup):
+    """
+    Median timings over `runs` fresh processes in one startup mode
+    """
+    env = dict(os.environ, FAST_STARTUP='true' if fast_startup else 'false')
+    env.pop('LLM_WARM_ON_STARTUP', None)
+    env.pop('MIGRATE_ON_STARTUP', None)
+    script = COLD_START_SCRIPT.format(root=os.path.dirname(os.path.abspath(__file__)), paths=COLD_START_PATHS)
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        completed = subprocess.run([sys.executable, '-c', script], env=env, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"Cold start run failed:\n{completed.stderr[-2000:]}")
+        timings = json.loads(completed.stdout.strip().splitlines()[-1])
+        timings['process_ms'] = (time.perf_counter() - started) * 1000
+        samples.append(timings)
+
+    result = {'fast_startup': fast_startup, 'runs': runs}
+    for key in samples[0]:
+        if key.endswith('_ms'):
+            result[key] = round(percentile(sorted(s[key] for s in samples), 50), 1)
+        else:
+            result[key] = samples[-1][key]
+    return result
+
+
+def run_cold_start(args):
+    # The default mode migrates the database on startup, so it runs first
+    results = [measure_cold_start(args.cold_start, fast_startup) for fast_startup in (False, True)]
+    for result in results:
+        mode = 'fast startup' if result['fast_startup'] else 'default'
+        requests = '  '.join(f"{path}={result[path + '_ms']:.1f}ms" for path in COLD_START_PATHS)
+        print(f"  {mode:<13} import={result['import_ms']:>7.1f}ms  {requests}  process={result['process_ms']:>7.1f}ms")
+    output = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'runs': args.cold_start,
+        },
+        'cold_start': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f"Wrote {args.output}")
+    return 0
+
+
+def compare(current, baseline_path):
+    """
+    Print p95 and throughput changes against an earlier results file
+    """
+    with open(baseline_path) as f:
+        baseline = {(r['size'], r['endpoint']): r for r in json.load(f)['results']}
+    print(f"\nCompared with {baseline_path}:")
+    for result in current['results']:
+        previous = baseline.get((result['size'], result['endpoint']))
+        if not previous:
+            continue
+        p95_change = (result['p95_ms'] - previous['p95_ms']) / previous['p95_ms'] * 100 if previous['p95_ms'] else 0.0
+        rps_change = (result['rps'] - previous['rps']) / previous['rps'] * 100 if previous['rps'] else 0.0
+        print(f"  {result['endpoint']:<15} size={result['size']:<7} p95 {p95_change:+6.1f}%  rps {rps_change:+6.1f}%")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='Database to benchmark (default: temporary SQLite file)')
+    parser.add_argument('--sizes', default='100,1000,10000', help='Comma-separated ticket counts to seed')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and size')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent client threads')
+    parser.add_argument('--llm-latency', type=float, default=0.2, help='Seconds the fake LLM takes per call')
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help='Comma-separated endpoints to run')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--output', default='benchmark_results.json', help='Where to write the JSON results')
+    parser.add_argument('--compare', metavar='BASELINE', help='Results file to compare against')
+    parser.add_argument('--cold-start', type=int, metavar='RUNS',
+                        help='Measure startup in RUNS fresh processes instead of the load test')
+    args = parser.parse_args(argv)
+
+    endpoints = [e.strip() for e in args.endpoints.split(',') if e.strip()]
+    unknown = [e for e in endpoints if e not in ENDPOINTS]
+    if unknown:
+        parser.error(f"Unknown endpoints: {', '.join(unknown)}")
+
+    database_url = args.database_url or f"sqlite:///{tempfile.mkdtemp(prefix='ticket-bench-')}/benchmark.db"
+    os.environ['DATABASE_URL'] = database_url
+    if args.cold_start:
+        os.environ.setdefault('SESSION_SECRET', 'benchmark')
+        os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+        return run_cold_start(args)
+
+    sink = SMTPSink()
+    os.environ.setdefault('SESSION_SECRET', 'benchmark')
+    os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+    os.environ.setdefault('LLM_WARM_ON_STARTUP', 'false')
+    # Measure the LLM path on every request rather than cache hits
+    os.environ.setdefault('RESPONSE_CACHE_ENABLED', 'false')
+    # Send escalation emails as they happen so the sink sees the SMTP load
+    os.environ.setdefault('NOTIFICATION_DIGEST_WINDOW', '0')
+    os.environ.update({
+        'SMTP_SERVER': '127.0.0.1',
+        'SMTP_PORT': str(sink.port),
+        'SMTP_STARTTLS': 'false',
+        'SMTP_AUTH': 'false',
+    })
+
+    import logging
+    from app import app, db, start_background_workers
+    from models import Ticket
+    from notifications import drain_notifications
+    import agent
+    logging.getLogger().setLevel(logging.WARNING)
+
+    agent._agent = agent.ITSupportAgent(llm=FakeChatModel(args.llm_latency), escalation_llm=None)
+    agent._agent_pid = os.getpid()
+    # The notification dispatcher delivers escalations to the sink
+    start_background_workers()
+
+    results = []
+    for size in [int(s) for s in args.sizes.split(',') if s.strip()]:
+        with app.app_context():
+            started = time.perf_counter()
+            first_id, last_id = seed_tickets(db, Ticket, size, seed=args.seed)
+            # With --sizes 0 nothing is seeded and chat_message targets ticket 1
+            ticket_ids = (first_id or 1, last_id or 1)
+            print(f"Seeded {size} tickets in {time.perf_counter() - started:.1f}s")
+        for endpoint in endpoints:
+            result = run_endpoint(app, endpoint, size, ticket_ids, args.requests, args.concurrency, args.seed)
+            results.append(result)
+            print(f"  {endpoint:<15} p50={result['p50_ms']:>8.1f}ms p95={result['p95_ms']:>8.1f}ms "
+                  f"p99={result['p99_ms']:>8.1f}ms rps={result['rps']:>8.1f} errors={result['errors']}")
+
+    # Send whatever the dispatcher hasn't picked up yet before counting emails
+    with app.app_context():
+        drain_notifications(force=True)
+
+    output = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(timespec='seconds'),
+            'database': database_url.split('://', 1)[0],
+            'python': platform.python_version(),
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'llm_latency': args.llm_latency,
+            'emails_sent': sink.messages,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.compare:
+        compare(output, args.compare)
+    sink.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,268 @@
+import os
+import csv
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+from sqlalchemy import insert, func
+
+from app import db
+from models import Ticket, AnalysisJob, ImportBatch
+from analysis_queue import claim_next_job, process_job
+from stats import record_inserted_tickets
+from changefeed import record_ticket_changes
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+IMPORT_CONCURRENCY = int(os.getenv("IMPORT_CONCURRENCY", "8"))
+# Starting request rate for bulk analysis; halved on failures, regrown on success
+IMPORT_REQUESTS_PER_MINUTE = float(os.getenv("IMPORT_REQUESTS_PER_MINUTE", "300"))
+IMPORT_MIN_REQUESTS_PER_MINUTE = float(os.getenv("IMPORT_MIN_REQUESTS_PER_MINUTE", "10"))
+
+REQUIRED_FIELDS = ('name', 'email', 'description')
+# Source statuses kept as they are; records without one are queued as new
+# tickets, or imported as open ones when they won't be analyzed
+IMPORT_STATUSES = ('open', 'pending_review', 'resolved')
+
+
+def read_records(stream, format):
+    """
+    Yield dicts from a JSONL or CSV text stream; None for a JSONL line that
+    isn't valid JSON
+    """
+    if format == 'jsonl':
+        for line in stream:
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield None
+    elif format == 'csv':
+        yield from csv.DictReader(stream)
+    else:
+        raise ValueError(f"Unsupported import format: {format}")
+
+
+def _parse_datetime(value):
+    """
+    Datetime from an ISO 8601 string; None if missing, raises ValueError if invalid
+    """
+    if not value:
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"Not a date: {value!r}")
+    return datetime.fromisoformat(value)
+
+
+def _ticket_row(record, now, analyze=True):
+    """
+    Map an import record to a ticket row, or None if it is unusable
+    """
+    if not isinstance(record, dict):
+        return None
+    if not all(isinstance(record.get(field), str) and record[field].strip() for field in REQUIRED_FIELDS):
+        return None
+    category = record.get('category')
+    if category is not None and not isinstance(category, str):
+        return None
+    status = record.get('status') or ('queued' if analyze else 'open')
+    if status != 'queued' and status not in IMPORT_STATUSES:
+        return None
+    try:
+        created_at = _parse_datetime(record.get('created_at')) or now
+        resolved_at = _parse_datetime(record.get('resolved_at'))
+    except ValueError:
+        return None
+    return {
+        'name': record['name'][:100],
+        'email': record['email'][:120],
+        'description': record['description'],
+        'category': category or 'uncategorized',
+        'status': status,
+        'requires_human_attention': status == 'pending_review',
+        'created_at': created_at,
+        'updated_at': now,
+        'resolved_at': resolved_at,
+    }
+
+
+def _insert_chunk(batch, rows, records_read, rejected, analyze=True):
+    """
+    Insert one chunk of tickets, with their analysis jobs if they are to be
+    analyzed, and advance the batch's progress in the same transaction, so a
+    resume never duplicates
+    """
+    if rows:
+        ticket_ids = db.session.scalars(insert(Ticket).returning(Ticket.id), rows).all()
+        if analyze:
+            db.session.execute(insert(AnalysisJob), [
+                {'ticket_id': ticket_id, 'import_batch_id': batch.id, 'status': 'queued'}
+                for ticket_id in ticket_ids
+            ])
+        record_inserted_tickets(db.session.connection(), rows)
+        record_ticket_changes(db.session, ticket_ids)
+
+    batch.records_read = records_read
+    batch.inserted_rows += len(rows)
+    batch.rejected_rows += rejected
+    db.session.commit()
+
+
+def import_tickets(stream, format, source, batch=None, analyze=True):
+    """
+    Insert tickets from a JSONL/CSV stream in chunks, each queued for
+    analysis unless analyze is False. Pass an existing batch to resume an
+    interrupted import. A batch the stream can't be read to the end for is
+    left 'failed' with the chunks inserted so far, ready to resume.
+    """
+    if batch is None:
+        batch = ImportBatch(source=source, format=format, status='importing')
+        db.session.add(batch)
+    else:
+        batch.status = 'importing'
+    db.session.commit()
+
+    skip = batch.records_read
+    records_read = 0
+    rows, rejected = [], 0
+    now = datetime.utcnow()
+
+    try:
+        for record in read_records(stream, format):
+            records_read += 1
+            if records_read <= skip:
+                continue
+
+            row = _ticket_row(record, now, analyze)
+            if row is None:
+                rejected += 1
+            else:
+                rows.append(row)
+
+            if len(rows) >= IMPORT_CHUNK_SIZE:
+                _insert_chunk(batch, rows, records_read, rejected, analyze)
+                rows, rejected = [], 0
+
+        if records_read > batch.records_read:
+            _insert_chunk(batch, rows, records_read, rejected, analyze)
+    except Exception:
+        db.session.rollback()
+        batch.status = 'failed'
+        db.session.commit()
+        raise
+
+    batch.status = 'analyzing' if analyze else 'done'
+    db.session.commit()
+    logger.info(f"Import batch {batch.id}: {batch.inserted_rows} tickets inserted, {batch.rejected_rows} rejected")
+    return batch
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket whose rate halves when calls fail (e.g. on rate limits)
+    and grows back gradually as calls succeed
+    """
+
+    def __init__(self, per_minute, min_per_minute=IMPORT_MIN_REQUESTS_PER_MINUTE):
+        self.max_rate = per_minute / 60.0
+        self.min_rate = min_per_minute / 60.0
+        self.rate = self.max_rate
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(1.0, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait = (1.0 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def record(self, success):
+        with self._lock:
+            if success:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 50)
+            else:
+                self.rate = max(self.min_rate, self.rate / 2)
+                logger.warning(f"Bulk analysis slowed to {self.rate * 60:.0f} requests/minute")
+
+
+def batch_progress(batch):
+    counts = dict(
+        db.session.query(AnalysisJob.status, func.count())
+        .filter(AnalysisJob.import_batch_id == batch.id)
+        .group_by(AnalysisJob.status)
+        .all()
+    )
+    return {
+        'id': batch.id,
+        'source': batch.source,
+        'status': batch.status,
+        'records_read': batch.records_read,
+        'inserted': batch.inserted_rows,
+        'rejected': batch.rejected_rows,
+        'analysis': {
+            'queued': counts.get('queued', 0),
+            'running': counts.get('running', 0),
+            'done': counts.get('done', 0),
+            'failed': counts.get('failed', 0),
+        }
+    }
+
+
+def _analysis_worker(app, batch_id, limiter):
+    while True:
+        with app.app_context():
+            job = claim_next_job(import_batch_id=batch_id)
+            if job is None:
+                return
+            limiter.acquire()
+            try:
+                limiter.record(process_job(job))
+            except Exception as e:
+                logger.error(f"Error processing analysis job {job.id}: {str(e)}")
+                db.session.rollback()
+                limiter.record(False)
+
+
+def run_bulk_analysis(app, batch_id, concurrency=IMPORT_CONCURRENCY,
+                      requests_per_minute=IMPORT_REQUESTS_PER_MINUTE):
+    """
+    Analyze an import batch's queued tickets across a bounded pool of
+    threads sharing one adaptive rate limiter. Safe to re-run to resume;
+    jobs waiting on a retry delay are picked up by later runs or by the
+    regular analysis workers.
+    """
+    limiter = AdaptiveRateLimiter(requests_per_minute)
+    workers = [
+        threading.Thread(target=_analysis_worker, args=(app, batch_id, limiter), name=f"bulk-analysis-{i}")
+        for i in range(concurrency)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    with app.app_context():
+        batch = db.session.get(ImportBatch, batch_id)
+        progress = batch_progress(batch)
+        if not progress['analysis']['queued'] and not progress['analysis']['running']:
+            batch.status = 'done'
+            db.session.commit()
+            progress['status'] = 'done'
+    return progress
+
+
+def start_bulk_analysis(app, batch_id):
+    """
+    Run bulk analysis for a batch in a background thread
+    """
+    threading.Thread(target=run_bulk_analysis, args=(app, batch_id), name=f"bulk-import-{batch_id}", daemon=True).start()
@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import queue
+import select
+import logging
+import threading
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from app import db
+from models import Ticket
+
+logger = logging.getLogger(__name__)
+
+# "auto" uses Postgres LISTEN/NOTIFY when the database is Postgres, so every
+# worker sees every change; "local" only reaches dashboards in this process
+CHANGE_FEED_BACKEND = os.getenv("CHANGE_FEED_BACKEND", "auto").lower()
+CHANGE_FEED_CHANNEL = os.getenv("CHANGE_FEED_CHANNEL", "ticket_changes")
+# Changes arriving within this many seconds are sent to dashboards together
+CHANGE_FEED_COALESCE = float(os.getenv("CHANGE_FEED_COALESCE", "0.5"))
+CHANGE_FEED_QUEUE_SIZE = int(os.getenv("CHANGE_FEED_QUEUE_SIZE", "1000"))
+
+# Keeps each NOTIFY payload well under the 8000 byte limit
+NOTIFY_CHUNK_SIZE = 500
+
+
+class Subscription:
+    """
+    One dashboard's view of the change feed
+    """
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.queue = queue.Queue(maxsize=CHANGE_FEED_QUEUE_SIZE)
+        self.overflowed = False
+
+    def get(self, timeout):
+        """
+        Wait for changes and return the set of changed ticket ids, coalescing
+        bursts. Returns None on timeout and False if changes were dropped
+        because this subscriber fell behind.
+        """
+        try:
+            ids = set(self.queue.get(timeout=timeout))
+        except queue.Empty:
+            return None
+        time.sleep(CHANGE_FEED_COALESCE)
+        while True:
+            try:
+                ids.update(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if self.overflowed:
+            self.overflowed = False
+            return False
+        return ids
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class ChangeBroker:
+    """
+    In-process fan-out of changed ticket ids to open dashboards
+    """
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        subscription = Subscription(self)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, ticket_ids):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(ticket_ids)
+            except queue.Full:
+                subscription.overflowed = True
+
+
+_broker = ChangeBroker()
+
+
+def _use_postgres(dialect_name):
+    if CHANGE_FEED_BACKEND == 'local':
+        return False
+    return dialect_name == 'postgresql'
+
+
+def record_ticket_changes(session, ticket_ids):
+    """
+    Announce changed tickets once the session's transaction commits. On
+    Postgres this is a NOTIFY in the same transaction, so nothing is sent if
+    it rolls back.
+    """
+    if not ticket_ids:
+        return
+    connection = session.connection()
+    if _use_postgres(connection.dialect.name):
+        ticket_ids = list(ticket_ids)
+        for i in range(0, len(ticket_ids), NOTIFY_CHUNK_SIZE):
+            connection.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {'channel': CHANGE_FEED_CHANNEL, 'payload': json.dumps(ticket_ids[i:i + NOTIFY_CHUNK_SIZE])}
+            )
+    else:
+        session.info.setdefault('changed_tickets', set()).update(ticket_ids)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_ticket_changes(session, flush_context):
+    ticket_ids = {
+        obj.id for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+        if isinstance(obj, Ticket) and obj.id is not None
+    }
+    record_ticket_changes(session, ticket_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_ticket_changes(session):
+    ticket_ids = session.info.pop('changed_tickets', None)
+    if ticket_ids:
+        _broker.publish(sorted(ticket_ids))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_ticket_changes(session):
+    session.info.pop('changed_tickets', None)
+
+
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+def _listen(app):
+    """
+    Relay NOTIFY payloads from Postgres to this process's dashboards,
+    reconnecting after errors
+    """
+    while True:
+        connection = None
+        try:
+            with app.app_context():
+                connection = db.engine.raw_connection()
+            # Keep this connection out of the pool; it only ever LISTENs
+            connection.detach()
+            pg = connection.driver_connection
+            pg.autocommit = True
+            pg.cursor().execute(f'LISTEN "{CHANGE_FEED_CHANNEL}"')
+            logger.info(f"Listening for ticket changes on {CHANGE_FEED_CHANNEL}")
+            while True:
+                if select.select([pg], [], [], 30) == ([], [], []):
+                    continue
+                pg.poll()
+                while pg.notifies:
+                    notification = pg.notifies.pop(0)
+                    _broker.publish(json.loads(notification.payload))
+        except Exception as e:
+            logger.error(f"Ticket change listener error: {str(e)}")
+            time.sleep(5)
+        finally:
+            if connection is not None:
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+
+
+def _ensure_listener(app):
+    global _listener_pid
+    with app.app_context():
+        if not _use_postgres(db.engine.dialect.name):
+            return
+    with _listener_lock:
+        if _listener_pid == os.getpid():
+            return
+        threading.Thread(target=_listen, args=(app,), name="ticket-change-listener", daemon=True).start()
+        _listener_pid = os.getpid()
+
+
+def subscribe_ticket_changes(app):
+    """
+    Subscribe to changed ticket ids, starting the Postgres listener for this
+    process on first use
+    """
+    _ensure_listener(app)
+    return _broker.subscribe()
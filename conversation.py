@@ -0,0 +1,154 @@
+import os
+import logging
+from sqlalchemy import select
+
+from app import db
+from models import Message, ConversationSummary
+from tokenizer import count_tokens, truncate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Token budget for the chat turns sent back to the model on each message
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+MESSAGE_PAGE_SIZE = int(os.getenv("MESSAGE_PAGE_SIZE", "20"))
+# The first analysis is repeated on every turn, so only its opening is kept
+HISTORY_ISSUE_TOKENS = int(os.getenv("HISTORY_ISSUE_TOKENS", "300"))
+HISTORY_AI_RESPONSE_TOKENS = int(os.getenv("HISTORY_AI_RESPONSE_TOKENS", "200"))
+
+
+def record_message(ticket_id, role, content, session=None):
+    """
+    Add a chat turn to the session (the Flask-SQLAlchemy one by default).
+    The caller commits.
+    """
+    message = Message(
+        ticket_id=ticket_id,
+        role=role,
+        content=content,
+        token_count=count_tokens(content)
+    )
+    (session or db.session).add(message)
+    return message
+
+
+def get_message_page(ticket_id, before_id=None, limit=MESSAGE_PAGE_SIZE):
+    """
+    Keyset-paginate a ticket's messages, newest first.
+    Returns (messages in chronological order, id to pass as before_id or None).
+    """
+    query = Message.query.filter(Message.ticket_id == ticket_id)
+    if before_id:
+        query = query.filter(Message.id < before_id)
+    rows = query.order_by(Message.id.desc()).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_before = rows[-1].id if has_more and rows else None
+    return list(reversed(rows)), next_before
+
+
+def _format_turns(messages):
+    return '\n'.join(
+        f"{'User' if message.role == 'user' else 'Assistant'}: {message.content}"
+        for message in messages
+    )
+
+
+def _split_for_summary(recent, summary_tokens, budget):
+    """
+    Return (older turns to fold into the summary, turns to keep verbatim),
+    or None when the window still fits the budget. Folds until the window
+    fits in half the budget, so the next few turns can be added without
+    another summarization call.
+    """
+    if not recent or sum(m.token_count for m in recent) + summary_tokens <= budget:
+        return None
+    keep, kept_tokens = [], 0
+    for message in reversed(recent):
+        if kept_tokens + message.token_count > budget // 2:
+            break
+        keep.append(message)
+        kept_tokens += message.token_count
+    keep.reverse()
+    return recent[:len(recent) - len(keep)], keep
+
+
+def _apply_summary(summary, content, messages):
+    """
+    Store the extended summary and advance its marker
+    """
+    summary.content = content
+    summary.token_count = count_tokens(content)
+    summary.through_message_id = messages[-1].id
+
+
+def _format_history(ticket, summary, recent):
+    sections = [
+        f"Initial Issue: {truncate_tokens(ticket.description, HISTORY_ISSUE_TOKENS, keep='middle')}",
+        f"Initial AI Response: {truncate_tokens(ticket.ai_response, HISTORY_AI_RESPONSE_TOKENS)}",
+        f"Current Status: {ticket.status}"
+    ]
+    if summary and summary.content:
+        sections.append(f"Summary of Earlier Conversation: {summary.content}")
+    if recent:
+        sections.append(f"Recent Messages:\n{_format_turns(recent)}")
+    return '\n'.join(sections)
+
+
+def _recent_messages_query(ticket_id, through_id):
+    return (select(Message)
+            .where(Message.ticket_id == ticket_id, Message.id > through_id)
+            .order_by(Message.id))
+
+
+def build_conversation_history(ticket, support_agent, budget=HISTORY_TOKEN_BUDGET):
+    """
+    Build the history sent with a chat turn. Recent turns are sent verbatim
+    within the token budget; older turns live in a cached rolling summary that
+    is only extended when the recent window outgrows the budget.
+    """
+    summary = db.session.get(ConversationSummary, ticket.id)
+    through_id = summary.through_message_id if summary else 0
+    recent = db.session.scalars(_recent_messages_query(ticket.id, through_id)).all()
+
+    split = _split_for_summary(recent, summary.token_count if summary else 0, budget)
+    if split:
+        older, keep = split
+        if older:
+            try:
+                if summary is None:
+                    summary = ConversationSummary(ticket_id=ticket.id, content='')
+                    db.session.add(summary)
+                content = support_agent.summarize_conversation(summary.content, _format_turns(older))
+                _apply_summary(summary, content, older)
+            except Exception as e:
+                logger.error(f"Error summarizing conversation for ticket #{ticket.id}: {str(e)}")
+            # Stay within budget either way; a failed fold is retried next turn
+            recent = keep
+
+    return _format_history(ticket, summary, recent)
+
+
+async def build_conversation_history_async(session, ticket, support_agent, budget=HISTORY_TOKEN_BUDGET):
+    """
+    build_conversation_history for an AsyncSession and the async LLM client
+    """
+    summary = await session.get(ConversationSummary, ticket.id)
+    through_id = summary.through_message_id if summary else 0
+    recent = (await session.scalars(_recent_messages_query(ticket.id, through_id))).all()
+
+    split = _split_for_summary(recent, summary.token_count if summary else 0, budget)
+    if split:
+        older, keep = split
+        if older:
+            try:
+                if summary is None:
+                    summary = ConversationSummary(ticket_id=ticket.id, content='')
+                    session.add(summary)
+                content = await support_agent.summarize_conversation_async(summary.content, _format_turns(older))
+                _apply_summary(summary, content, older)
+            except Exception as e:
+                logger.error(f"Error summarizing conversation for ticket #{ticket.id}: {str(e)}")
+            recent = keep
+
+    return _format_history(ticket, summary, recent)
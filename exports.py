@@ -0,0 +1,149 @@
+import io
+import csv
+import logging
+import importlib.util
+from sqlalchemy import select
+
+from app import db
+from models import Ticket
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = 1000
+
+
+def _format_datetime(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S') if value else ''
+
+
+# key -> (CSV header, column, CSV formatter, Arrow type name)
+EXPORT_COLUMNS = {
+    'id': ('ID', Ticket.id, None, 'int64'),
+    'name': ('Name', Ticket.name, None, 'string'),
+    'email': ('Email', Ticket.email, None, 'string'),
+    'category': ('Category', Ticket.category, None, 'string'),
+    'status': ('Status', Ticket.status, None, 'string'),
+    'created_at': ('Created At', Ticket.created_at, _format_datetime, 'timestamp'),
+    'resolved_at': ('Resolved At', Ticket.resolved_at, _format_datetime, 'timestamp'),
+    'updated_at': ('Updated At', Ticket.updated_at, _format_datetime, 'timestamp'),
+    'description': ('Description', Ticket.description, None, 'string'),
+    'ai_response': ('AI Response', Ticket.ai_response, None, 'string'),
+    'confidence_score': ('Confidence Score', Ticket.confidence_score, None, 'float64'),
+}
+
+
+def parse_columns(value):
+    """
+    Turn a comma-separated column list into export keys, defaulting to all
+    columns. Raises ValueError for unknown columns.
+    """
+    if not value:
+        return list(EXPORT_COLUMNS)
+    keys = [key.strip() for key in value.split(',') if key.strip()]
+    unknown = [key for key in keys if key not in EXPORT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown export columns: {', '.join(unknown)}")
+    return keys
+
+
+def _stream_rows(conditions, keys):
+    """
+    Yield batches of rows for only the requested columns using a
+    server-side cursor, so the result set is never held in memory
+    """
+    statement = (
+        select(*[EXPORT_COLUMNS[key][1] for key in keys])
+        .where(*conditions)
+        .order_by(Ticket.created_at.desc(), Ticket.id.desc())
+        .execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)
+    )
+    result = db.session.execute(statement)
+    try:
+        for batch in result.partitions():
+            yield batch
+    finally:
+        result.close()
+
+
+def stream_csv(conditions, keys):
+    """
+    Generate the CSV export one batch of rows at a time
+    """
+    output = io.StringIO()
+    writer = csv.writer(output)
+    formatters = [EXPORT_COLUMNS[key][2] for key in keys]
+
+    writer.writerow([EXPORT_COLUMNS[key][0] for key in keys])
+    for batch in _stream_rows(conditions, keys):
+        for row in batch:
+            writer.writerow([
+                formatter(value) if formatter else value
+                for formatter, value in zip(formatters, row)
+            ])
+        yield output.getvalue()
+        output.seek(0)
+        output.truncate()
+
+    if output.tell():
+        yield output.getvalue()
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file object that hands written bytes back to the generator
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parquet_available():
+    # pyarrow is optional and only imported once a Parquet export runs
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def stream_parquet(conditions, keys):
+    """
+    Generate a Parquet export with one row group per batch of rows
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    arrow_types = {
+        'int64': pa.int64(),
+        'string': pa.string(),
+        'float64': pa.float64(),
+        'timestamp': pa.timestamp('us'),
+    }
+    schema = pa.schema([(key, arrow_types[EXPORT_COLUMNS[key][3]]) for key in keys])
+
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    try:
+        for batch in _stream_rows(conditions, keys):
+            columns = list(zip(*batch))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema
+            ))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
@@ -0,0 +1,29 @@
+import os
+
+# Keep-alive lets the browser reuse connections between chat messages
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "5"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "60"))
+# Threaded workers, so open dashboard streams don't each occupy a whole worker;
+# DASHBOARD_MAX_STREAMS caps how many of a worker's threads they can hold
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+
+
+def post_fork(server, worker):
+    """
+    Warm the LLM client in each worker so pooled connections are never
+    inherited from the master process. Skipped with fast startup, as in app.py.
+    """
+    from app import LLM_WARM_ON_STARTUP
+    if LLM_WARM_ON_STARTUP:
+        from agent import warm_support_agent
+        warm_support_agent()
+
+
+def post_worker_init(worker):
+    """
+    Start this worker's background threads once the app is loaded, with or
+    without preload_app
+    """
+    from app import start_background_workers
+    start_background_workers()
@@ -0,0 +1,303 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import select
+
+from app import db
+from models import Ticket, Incident
+from response_cache import normalize_description, STOPWORDS
+
+logger = logging.getLogger(__name__)
+
+INCIDENT_DETECTION_ENABLED = os.getenv("INCIDENT_DETECTION_ENABLED", "true").lower() == "true"
+# Only tickets created within this many minutes are compared against
+INCIDENT_WINDOW_MINUTES = int(os.getenv("INCIDENT_WINDOW_MINUTES", "120"))
+# Estimated Jaccard similarity of the descriptions' shingles needed to link tickets
+INCIDENT_SIMILARITY = float(os.getenv("INCIDENT_SIMILARITY", "0.5"))
+MINHASH_PERMUTATIONS = int(os.getenv("MINHASH_PERMUTATIONS", "64"))
+# Bands of MINHASH_PERMUTATIONS / LSH_BANDS rows; 16 bands of 4 rows make
+# pairs around 0.5 similarity likely to share a bucket
+LSH_BANDS = int(os.getenv("LSH_BANDS", "16"))
+# Each refresh re-reads tickets updated this many seconds before the newest
+# one already loaded, so tickets committed late or by a server with a
+# slightly different clock are still picked up
+INCIDENT_REFRESH_OVERLAP = int(os.getenv("INCIDENT_REFRESH_OVERLAP", "60"))
+
+# Analyzed tickets that are still being worked on can start or join an incident
+ACTIVE_STATUSES = ('open', 'pending_review')
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def shingles(description):
+    """
+    Words and word pairs of the normalized description, without stopwords
+    """
+    terms = [w for w in normalize_description(description).split() if w not in STOPWORDS]
+    return set(terms) | {f"{a} {b}" for a, b in zip(terms, terms[1:])}
+
+
+class IncidentIndex:
+    """
+    MinHash signatures of recently analyzed tickets, bucketed with LSH so a
+    new description is only compared against likely matches.
+
+    The index is filled from the database incrementally: every lookup first
+    loads tickets updated since the last load (less INCIDENT_REFRESH_OVERLAP),
+    so tickets analyzed by other workers are found too, whatever order they
+    were committed in. Entries older than the window are dropped.
+    """
+
+    def __init__(self, window=INCIDENT_WINDOW_MINUTES * 60, threshold=INCIDENT_SIMILARITY,
+                 permutations=MINHASH_PERMUTATIONS, bands=LSH_BANDS):
+        self.window = window
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = permutations // bands
+        self.permutations = self.rows * bands
+
+        generator = np.random.RandomState(1)
+        self._a = generator.randint(1, 1 << 32, size=self.permutations, dtype=np.uint64)
+        self._b = generator.randint(0, 1 << 32, size=self.permutations, dtype=np.uint64)
+
+        self._lock = threading.Lock()
+        self._entries = {}  # ticket id -> (signature, created_at)
+        self._buckets = [{} for _ in range(bands)]  # band key -> ticket ids
+        self._loaded_until = None  # newest updated_at loaded so far
+
+        self._lookups = 0
+        self._matches = 0
+        self._lookup_seconds = 0.0
+
+    def signature(self, description):
+        hashes = np.array(
+            [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), 'little')
+             for s in shingles(description)],
+            dtype=np.uint64
+        )
+        if not hashes.size:
+            return None
+        # Overflow wraps around, which still gives a usable hash family
+        with np.errstate(over='ignore'):
+            permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0)
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def _add(self, ticket_id, signature, created_at):
+        if ticket_id in self._entries or signature is None:
+            return
+        self._entries[ticket_id] = (signature, created_at)
+        for band, key in self._band_keys(signature):
+            self._buckets[band].setdefault(key, set()).add(ticket_id)
+
+    def _remove(self, ticket_id):
+        signature, _ = self._entries.pop(ticket_id)
+        for band, key in self._band_keys(signature):
+            bucket = self._buckets[band].get(key)
+            if bucket is not None:
+                bucket.discard(ticket_id)
+                if not bucket:
+                    del self._buckets[band][key]
+
+    def _expire(self, now):
+        cutoff = now - timedelta(seconds=self.window)
+        for ticket_id in [t for t, (_, created_at) in self._entries.items() if created_at < cutoff]:
+            self._remove(ticket_id)
+
+    def refresh_query(self):
+        """
+        Analyzed, active tickets updated since the last load
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=self.window)
+        with self._lock:
+            loaded_until = self._loaded_until
+        updated_since = cutoff if loaded_until is None else max(
+            cutoff, loaded_until - timedelta(seconds=INCIDENT_REFRESH_OVERLAP))
+        return (select(Ticket.id, Ticket.description, Ticket.created_at, Ticket.updated_at)
+                .where(Ticket.updated_at >= updated_since,
+                       Ticket.created_at >= cutoff,
+                       Ticket.status.in_(ACTIVE_STATUSES),
+                       Ticket.ai_response.isnot(None)))
+
+    def load(self, rows):
+        # Signatures are computed outside the lock, and only for new tickets
+        entries = [(row.id, self.signature(row.description), row.created_at)
+                   for row in rows if row.id not in self._entries]
+        with self._lock:
+            for entry in entries:
+                self._add(*entry)
+            for row in rows:
+                if self._loaded_until is None or row.updated_at > self._loaded_until:
+                    self._loaded_until = row.updated_at
+            self._expire(datetime.utcnow())
+
+    def candidates(self, signature):
+        """
+        Ids of tickets that look like the signature, most similar first
+        """
+        started = time.perf_counter()
+        best = {}
+        with self._lock:
+            self._lookups += 1
+            ticket_ids = set()
+            for band, key in self._band_keys(signature):
+                ticket_ids.update(self._buckets[band].get(key, ()))
+            for ticket_id in ticket_ids:
+                other, _ = self._entries[ticket_id]
+                similarity = float(np.mean(signature == other))
+                if similarity >= self.threshold:
+                    best[ticket_id] = similarity
+            self._lookup_seconds += time.perf_counter() - started
+        return sorted(best, key=best.get, reverse=True)
+
+    def record_match(self):
+        with self._lock:
+            self._matches += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'indexed_tickets': len(self._entries),
+                'lookups': self._lookups,
+                'matches': self._matches,
+                'match_rate': round(self._matches / self._lookups, 4) if self._lookups else 0.0,
+                'avg_lookup_ms': round(self._lookup_seconds * 1000 / self._lookups, 3) if self._lookups else 0.0
+            }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_incident_index():
+    """
+    Return the process-wide incident index, or None when detection is disabled
+    """
+    global _index
+    if not INCIDENT_DETECTION_ENABLED:
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = IncidentIndex()
+    return _index
+
+
+def _leads_to_incident(ticket):
+    """
+    Whether a ticket matched by the index can start or share an incident;
+    tickets whose analysis failed for good (confidence 0) have no answer to share
+    """
+    return (ticket is not None and ticket.status in ACTIVE_STATUSES
+            and ticket.ai_response is not None and (ticket.confidence_score or 0) > 0)
+
+
+def find_incident(description):
+    """
+    Return an open incident whose tickets describe the same problem, or None.
+    The first match not yet in an incident becomes the root of a new one,
+    so incidents only exist once a second ticket arrives. The caller commits.
+    """
+    index = get_incident_index()
+    if index is None:
+        return None
+    try:
+        index.load(db.session.execute(index.refresh_query()).all())
+        signature = index.signature(description)
+        if signature is None:
+            return None
+        for ticket_id in index.candidates(signature):
+            match = db.session.get(Ticket, ticket_id)
+            if not _leads_to_incident(match):
+                continue
+            if match.incident_id is None:
+                incident = open_incident(match)
+            else:
+                incident = db.session.get(Incident, match.incident_id)
+            if incident is not None:
+                index.record_match()
+                return incident
+    except Exception as e:
+        logger.error(f"Error matching ticket to an incident: {str(e)}")
+        db.session.rollback()
+    return None
+
+
+async def find_incident_async(session, description):
+    """
+    find_incident on an AsyncSession
+    """
+    index = get_incident_index()
+    if index is None:
+        return None
+    try:
+        index.load((await session.execute(index.refresh_query())).all())
+        signature = index.signature(description)
+        if signature is None:
+            return None
+        for ticket_id in index.candidates(signature):
+            match = await session.get(Ticket, ticket_id)
+            if not _leads_to_incident(match):
+                continue
+            if match.incident_id is None:
+                incident = await open_incident_async(session, match)
+            else:
+                incident = await session.get(Incident, match.incident_id)
+            if incident is not None:
+                index.record_match()
+                return incident
+    except Exception as e:
+        logger.error(f"Error matching ticket to an incident: {str(e)}")
+        await session.rollback()
+    return None
+
+
+def _new_incident(ticket):
+    now = datetime.utcnow()
+    return Incident(
+        description=ticket.description,
+        category=ticket.category,
+        ai_response=ticket.ai_response,
+        confidence_score=ticket.confidence_score,
+        requires_human_attention=ticket.requires_human_attention,
+        ticket_count=1,
+        created_at=now,
+        last_ticket_at=now
+    )
+
+
+def open_incident(ticket):
+    """
+    Start an incident from an analyzed ticket once a second ticket like it
+    arrives; later tickets share its analysis. The caller commits.
+    """
+    incident = _new_incident(ticket)
+    db.session.add(incident)
+    db.session.flush()
+    ticket.incident_id = incident.id
+    return incident
+
+
+async def open_incident_async(session, ticket):
+    incident = _new_incident(ticket)
+    session.add(incident)
+    await session.flush()
+    ticket.incident_id = incident.id
+    return incident
+
+
+def join_incident(incident, ticket):
+    """
+    Link the ticket to the incident. The caller commits.
+    """
+    ticket.incident_id = incident.id
+    incident.ticket_count = Incident.ticket_count + 1
+    incident.last_ticket_at = datetime.utcnow()
@@ -1,7 +1,8 @@
-from app import app
+from app import app, start_background_workers
 
 # Keep this for local development
 if __name__ == "__main__":
+    start_background_workers()
     app.run(host="0.0.0.0", port=5000, debug=True)
 
 # This is what Vercel will use
@@ -0,0 +1,200 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Log requests slower than this many milliseconds with their SQL statement
+# count; 0 disables the slow-request log
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "0"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + (extra or [])
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if value != float('inf') else '+Inf'
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._series = {}  # labels -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for upper_bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labelnames, key, [('le', _format_value(upper_bound))])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Time spent handling requests', ('route', 'method', 'status'))
+REQUEST_SQL_STATEMENTS = Histogram(
+    'http_request_sql_statements', 'SQL statements executed per request', ('route',), STATEMENT_BUCKETS)
+STAGE_DURATION = Histogram(
+    'stage_duration_seconds', 'Time spent in each processing stage', ('stage',))
+LLM_TOKENS = Counter(
+    'llm_tokens_total', 'Tokens used by LLM calls, as reported by the API or estimated locally',
+    ('tier', 'kind', 'source'))
+LLM_CALLS = Counter(
+    'llm_calls_total', 'LLM calls by outcome (ok, failed, timeout, rejected, hedged, abandoned)', ('outcome',))
+
+REGISTRY = (REQUEST_DURATION, REQUEST_SQL_STATEMENTS, STAGE_DURATION, LLM_TOKENS, LLM_CALLS)
+
+
+def render_metrics():
+    """
+    All metrics of this process in the Prometheus text format. With several
+    gunicorn workers each one reports its own values.
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def span(stage):
+    """
+    Time a block as one processing stage
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if METRICS_ENABLED:
+            STAGE_DURATION.observe(time.perf_counter() - started, stage=stage)
+
+
+def record_tokens(tier, prompt_tokens, completion_tokens, estimated=False):
+    if METRICS_ENABLED:
+        source = 'estimate' if estimated else 'api'
+        LLM_TOKENS.inc(prompt_tokens, tier=tier, kind='prompt', source=source)
+        LLM_TOKENS.inc(completion_tokens, tier=tier, kind='completion', source=source)
+
+
+def record_llm_call(outcome):
+    if METRICS_ENABLED:
+        LLM_CALLS.inc(outcome=outcome)
+
+
+def observe_request(route, method, status, seconds, statements=None):
+    if not METRICS_ENABLED:
+        return
+    REQUEST_DURATION.observe(seconds, route=route, method=method, status=str(status))
+    if statements is not None:
+        REQUEST_SQL_STATEMENTS.observe(statements, route=route)
+    if SLOW_REQUEST_THRESHOLD_MS and seconds * 1000 >= SLOW_REQUEST_THRESHOLD_MS:
+        statement_info = f", {statements} SQL statements" if statements is not None else ''
+        logger.warning(f"Slow request {method} {route} -> {status}: {seconds * 1000:.0f}ms{statement_info}")
+
+
+# Statement counter for the request being handled in this context
+_statement_count = ContextVar('statement_count', default=None)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    counter = _statement_count.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+@event.listens_for(Session, 'before_commit')
+def _start_commit_timer(session):
+    session.info['commit_started'] = time.perf_counter()
+
+
+@event.listens_for(Session, 'after_commit')
+def _stop_commit_timer(session):
+    started = session.info.pop('commit_started', None)
+    if started is not None and METRICS_ENABLED:
+        STAGE_DURATION.observe(time.perf_counter() - started, stage='db_commit')
+
+
+def init_app(app):
+    """
+    Time every Flask request and count its SQL statements
+    """
+    from flask import g, request
+
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_started = time.perf_counter()
+        g.metrics_statements = [0]
+        _statement_count.set(g.metrics_statements)
+
+    @app.after_request
+    def _record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            observe_request(route, request.method, response.status_code,
+                            time.perf_counter() - started, g.metrics_statements[0])
+        return response
+
+    @app.teardown_request
+    def _stop_statement_count(exc):
+        _statement_count.set(None)
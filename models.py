@@ -16,6 +16,8 @@ class Ticket(db.Model):
     requires_human_attention = db.Column(db.Boolean, default=False)
     resolution_notes = db.Column(db.Text)
     resolved_at = db.Column(db.DateTime)
+    # Set when the ticket was grouped with others reporting the same problem
+    incident_id = db.Column(db.Integer, db.ForeignKey('incident.id'))
 
     # Indexes for commonly queried fields
     __table_args__ = (
@@ -24,6 +26,12 @@ class Ticket(db.Model):
         Index('idx_ticket_category', category),
         Index('idx_ticket_created_at', created_at),
         Index('idx_ticket_resolved_at', resolved_at),
+        # Keyset pagination on (created_at, id), alone and behind each filter
+        Index('idx_ticket_created_at_id', created_at, id),
+        Index('idx_ticket_status_created_at_id', status, created_at, id),
+        Index('idx_ticket_category_created_at_id', category, created_at, id),
+        Index('idx_ticket_incident_id', incident_id),
+        Index('idx_ticket_updated_at', updated_at),
     )
 
     def __repr__(self):
@@ -43,5 +51,218 @@ class Ticket(db.Model):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
             'requires_human_attention': self.requires_human_attention,
             'resolution_notes': self.resolution_notes,
-            'resolved_at': self.resolved_at.isoformat() if self.resolved_at else None
-        }
\ No newline at end of file
+            'resolved_at': self.resolved_at.isoformat() if self.resolved_at else None,
+            'incident_id': self.incident_id
+        }
+
+    def to_summary_dict(self, now):
+        """
+        Dashboard row without the large text columns
+        """
+        end_time = self.resolved_at or now
+        return {
+            'id': self.id,
+            'name': self.name,
+            'email': self.email,
+            'category': self.category,
+            'status': self.status,
+            'confidence_score': self.confidence_score,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M'),
+            'resolved_at': self.resolved_at.strftime('%Y-%m-%d %H:%M') if self.resolved_at else None,
+            'age_days': round((end_time - self.created_at).total_seconds() // 3600 / 24, 1)
+        }
+
+
+class ArchivedTicket(db.Model):
+    """
+    Resolved ticket moved out of the ticket table by archive.py. The text
+    columns and the chat transcript are stored encoded as named by
+    `compression`.
+    """
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(100), nullable=False)
+    email = db.Column(db.String(120), nullable=False)
+    category = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    confidence_score = db.Column(db.Float)
+    requires_human_attention = db.Column(db.Boolean, default=False)
+    incident_id = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
+    resolved_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    compression = db.Column(db.String(10), nullable=False)  # none | zlib
+    description = db.Column(db.LargeBinary, nullable=False)
+    ai_response = db.Column(db.LargeBinary)
+    resolution_notes = db.Column(db.LargeBinary)
+    # JSON list of the ticket's chat messages
+    transcript = db.Column(db.LargeBinary)
+
+    __table_args__ = (
+        Index('idx_archived_ticket_email', email),
+        Index('idx_archived_ticket_resolved_at', resolved_at),
+    )
+
+    def __repr__(self):
+        return f'<ArchivedTicket {self.id}>'
+
+
+class Incident(db.Model):
+    """
+    Tickets describing the same problem, sharing the first ticket's analysis
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    description = db.Column(db.Text, nullable=False)
+    category = db.Column(db.String(50), nullable=False)
+    ai_response = db.Column(db.Text)
+    confidence_score = db.Column(db.Float)
+    requires_human_attention = db.Column(db.Boolean, default=False)
+    ticket_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_ticket_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<Incident {self.id} tickets={self.ticket_count}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'description': self.description,
+            'category': self.category,
+            'confidence_score': self.confidence_score,
+            'requires_human_attention': self.requires_human_attention,
+            'ticket_count': self.ticket_count,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'last_ticket_at': self.last_ticket_at.isoformat() if self.last_ticket_at else None
+        }
+
+
+class ImportBatch(db.Model):
+    """
+    Progress of a bulk ticket import
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(255), nullable=False)
+    format = db.Column(db.String(10), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='importing')  # importing | analyzing | done | failed
+    # Records consumed from the source so far; a resumed import skips these
+    records_read = db.Column(db.Integer, nullable=False, default=0)
+    inserted_rows = db.Column(db.Integer, nullable=False, default=0)
+    rejected_rows = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<ImportBatch {self.id} {self.status}>'
+
+
+class AnalysisJob(db.Model):
+    """
+    DB-backed queue of tickets waiting for AI analysis
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    ticket_id = db.Column(db.Integer, db.ForeignKey('ticket.id'), nullable=False)
+    import_batch_id = db.Column(db.Integer, db.ForeignKey('import_batch.id'))
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    available_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    completed_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        Index('idx_analysis_job_status_available', status, available_at),
+        Index('idx_analysis_job_ticket_id', ticket_id),
+        Index('idx_analysis_job_import_batch_status', import_batch_id, status),
+    )
+
+    def __repr__(self):
+        return f'<AnalysisJob {self.id} ticket={self.ticket_id} {self.status}>'
+
+
+class Message(db.Model):
+    """
+    A single chat turn on a ticket
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    ticket_id = db.Column(db.Integer, db.ForeignKey('ticket.id'), nullable=False)
+    role = db.Column(db.String(20), nullable=False)  # user | assistant
+    content = db.Column(db.Text, nullable=False)
+    token_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    # Serves both per-ticket history reads and keyset pagination on id
+    __table_args__ = (
+        Index('idx_message_ticket_id_id', ticket_id, id),
+    )
+
+    def __repr__(self):
+        return f'<Message {self.id} ticket={self.ticket_id} {self.role}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'ticket_id': self.ticket_id,
+            'role': self.role,
+            'content': self.content,
+            'token_count': self.token_count,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class ConversationSummary(db.Model):
+    """
+    Rolling summary of a ticket's older chat turns
+    """
+    ticket_id = db.Column(db.Integer, db.ForeignKey('ticket.id'), primary_key=True)
+    content = db.Column(db.Text, nullable=False, default='')
+    token_count = db.Column(db.Integer, nullable=False, default=0)
+    # Messages with ids up to and including this one are folded into the summary
+    through_message_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<ConversationSummary ticket={self.ticket_id} through={self.through_message_id}>'
+
+
+class OutboundNotification(db.Model):
+    """
+    Support-team email waiting to be sent by the notification dispatcher
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    ticket_id = db.Column(db.Integer, db.ForeignKey('ticket.id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending | sending | sent | failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    claim_token = db.Column(db.String(32))
+    available_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        Index('idx_outbound_notification_status_available', status, available_at),
+        Index('idx_outbound_notification_claim_token', claim_token),
+    )
+
+    def __repr__(self):
+        return f'<OutboundNotification {self.id} ticket={self.ticket_id} {self.status}>'
+
+
+class TicketStats(db.Model):
+    """
+    Rollup of ticket counts per creation day, category, status and
+    resolution-time bin (-1 for unresolved tickets), kept current by
+    session events in stats.py
+    """
+    day = db.Column(db.Date, primary_key=True)
+    category = db.Column(db.String(50), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    resolution_bin = db.Column(db.Integer, primary_key=True, default=-1)
+    ticket_count = db.Column(db.Integer, nullable=False, default=0)
+    resolution_count = db.Column(db.Integer, nullable=False, default=0)
+    resolution_days_sum = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<TicketStats {self.day} {self.category} {self.status} {self.resolution_bin}>'
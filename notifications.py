@@ -1,52 +1,358 @@
 import os
+import uuid
+import asyncio
+import time
 import logging
 import smtplib
+import threading
+from datetime import datetime, timedelta
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from sqlalchemy import or_, and_, update
+
+from app import db
+from models import Ticket, OutboundNotification
+from metrics import span
 
 logger = logging.getLogger(__name__)
 
-def notify_support_team(ticket):
+# "background" queues notifications for the dispatcher thread, "sync" sends inline
+NOTIFICATION_DISPATCH = os.getenv("NOTIFICATION_DISPATCH", "background").lower()
+# Escalations arriving within this many seconds are sent as one digest
+NOTIFICATION_DIGEST_WINDOW = int(os.getenv("NOTIFICATION_DIGEST_WINDOW", "60"))
+NOTIFICATION_DIGEST_MAX = int(os.getenv("NOTIFICATION_DIGEST_MAX", "25"))
+NOTIFICATION_POLL_INTERVAL = float(os.getenv("NOTIFICATION_POLL_INTERVAL", "5"))
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", "5"))
+NOTIFICATION_RETRY_DELAY = int(os.getenv("NOTIFICATION_RETRY_DELAY", "30"))
+NOTIFICATION_LEASE = int(os.getenv("NOTIFICATION_LEASE", "300"))
+# Close the SMTP connection after this many idle seconds
+SMTP_IDLE_TIMEOUT = int(os.getenv("SMTP_IDLE_TIMEOUT", "120"))
+
+# For local testing against a debugging server such as
+# `python -m aiosmtpd -n -l localhost:8025`, set SMTP_SERVER=localhost,
+# SMTP_PORT=8025, SMTP_STARTTLS=false and SMTP_AUTH=false.
+
+
+def _smtp_settings():
+    return {
+        'server': os.getenv("SMTP_SERVER", "smtp.gmail.com"),
+        'port': int(os.getenv("SMTP_PORT", "587")),
+        'username': os.getenv("SMTP_USERNAME"),
+        'password': os.getenv("SMTP_PASSWORD"),
+        'support_email': os.getenv("SUPPORT_EMAIL", "support@example.com"),
+        'starttls': os.getenv("SMTP_STARTTLS", "true").lower() == "true",
+        'auth': os.getenv("SMTP_AUTH", "true").lower() == "true",
+        'timeout': float(os.getenv("SMTP_TIMEOUT", "10")),
+    }
+
+
+def _smtp_configured(settings):
+    return not settings['auth'] or all([settings['username'], settings['password']])
+
+
+_unconfigured_warned = False
+
+
+def _email_enabled():
     """
-    Notify the support team about tickets that need human intervention
+    True if SMTP is configured; otherwise warns once per process
     """
-    try:
-        smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-        smtp_port = int(os.getenv("SMTP_PORT", "587"))
-        smtp_username = os.getenv("SMTP_USERNAME")
-        smtp_password = os.getenv("SMTP_PASSWORD")
-        support_email = os.getenv("SUPPORT_EMAIL", "support@example.com")
-
-        message = MIMEMultipart()
-        message["From"] = smtp_username
-        message["To"] = support_email
-        message["Subject"] = f"Support Ticket #{ticket.id} Needs Review"
+    global _unconfigured_warned
+    if _smtp_configured(_smtp_settings()):
+        return True
+    if not _unconfigured_warned:
+        _unconfigured_warned = True
+        logger.warning("Email credentials not configured. Support notifications are disabled.")
+    return False
 
-        body = f"""
-        New support ticket requires human review:
-        
+
+def _ticket_body(ticket):
+    return f"""
         Ticket ID: {ticket.id}
         Customer: {ticket.name}
         Email: {ticket.email}
         Category: {ticket.category}
         Description: {ticket.description}
-        
+
         AI Confidence Score: {ticket.confidence_score}
         AI Response: {ticket.ai_response}
-        
+        """
+
+
+def build_message(tickets, settings):
+    """
+    Build one email for the tickets: the single-ticket format for one,
+    a digest for several
+    """
+    message = MIMEMultipart()
+    message["From"] = settings['username'] or settings['support_email']
+    message["To"] = settings['support_email']
+
+    if len(tickets) == 1:
+        ticket = tickets[0]
+        message["Subject"] = f"Support Ticket #{ticket.id} Needs Review"
+        body = f"""
+        New support ticket requires human review:
+        {_ticket_body(ticket)}
         Please review and respond to this ticket.
         """
+    else:
+        ids = ', '.join(f"#{ticket.id}" for ticket in tickets)
+        message["Subject"] = f"{len(tickets)} Support Tickets Need Review ({ids})"
+        sections = '\n        ----------------------------------------\n'.join(
+            _ticket_body(ticket) for ticket in tickets
+        )
+        body = f"""
+        {len(tickets)} support tickets require human review:
+        {sections}
+        Please review and respond to these tickets.
+        """
+
+    message.attach(MIMEText(body, "plain"))
+    return message
+
+
+class SMTPConnection:
+    """
+    Authenticated SMTP connection kept open between sends
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.server = None
+        self.last_used = 0.0
+
+    def _connect(self):
+        settings = self.settings
+        server = smtplib.SMTP(settings['server'], settings['port'], timeout=settings['timeout'])
+        if settings['starttls']:
+            server.starttls()
+        if settings['auth']:
+            server.login(settings['username'], settings['password'])
+        self.server = server
+
+    def send(self, message):
+        with span('smtp_send'):
+            if self.server is None:
+                self._connect()
+            try:
+                self.server.send_message(message)
+            except smtplib.SMTPServerDisconnected:
+                # The server dropped an idle connection; reconnect once
+                self.close()
+                self._connect()
+                self.server.send_message(message)
+        self.last_used = time.monotonic()
+
+    def close_if_idle(self):
+        if self.server is not None and time.monotonic() - self.last_used > SMTP_IDLE_TIMEOUT:
+            self.close()
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+            self.server = None
+
+
+def send_ticket_notification(ticket):
+    """
+    Send the notification for one ticket immediately on a fresh connection
+    """
+    try:
+        if not _email_enabled():
+            return
 
-        message.attach(MIMEText(body, "plain"))
+        settings = _smtp_settings()
+        connection = SMTPConnection(settings)
+        try:
+            connection.send(build_message([ticket], settings))
+        finally:
+            connection.close()
+        logger.info(f"Notification sent for ticket #{ticket.id}")
+
+    except Exception as e:
+        logger.error(f"Failed to send notification: {str(e)}")
+
+
+def _dispatch_mode():
+    # Without background workers no dispatcher would send queued notifications
+    from app import BACKGROUND_WORKERS
+    return NOTIFICATION_DISPATCH if BACKGROUND_WORKERS else "sync"
+
+
+def notify_support_team(ticket, session=None):
+    """
+    Notify the support team about a ticket that needs human intervention.
+    In background mode this adds a queued notification to the session (the
+    Flask-SQLAlchemy one by default); the ticket must have an id and the
+    caller commits. Nothing is queued while SMTP isn't configured.
+    """
+    if _dispatch_mode() == "sync":
+        send_ticket_notification(ticket)
+        return
+    if not _email_enabled():
+        return
+
+    (session or db.session).add(OutboundNotification(ticket_id=ticket.id))
+    _wakeup.set()
+
+
+async def notify_support_team_async(session, ticket):
+    """
+    notify_support_team for the async request path, on the given
+    AsyncSession. The caller commits.
+    """
+    if _dispatch_mode() == "sync":
+        await asyncio.to_thread(send_ticket_notification, ticket)
+        return
+    notify_support_team(ticket, session=session)
+
+
+def _claim_batch(force=False):
+    """
+    Claim pending notifications once the oldest has waited out the digest
+    window (or the batch is full). Returns the claimed rows.
+    """
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=NOTIFICATION_LEASE)
+    claimable = or_(
+        and_(OutboundNotification.status == 'pending', OutboundNotification.available_at <= now),
+        and_(OutboundNotification.status == 'sending', OutboundNotification.locked_at < stale_before,
+             OutboundNotification.attempts < NOTIFICATION_MAX_ATTEMPTS)
+    )
+
+    candidates = (db.session.query(OutboundNotification.id, OutboundNotification.created_at)
+                  .filter(claimable)
+                  .order_by(OutboundNotification.created_at)
+                  .limit(NOTIFICATION_DIGEST_MAX)
+                  .all())
+    if not candidates:
+        return []
+
+    window_open = now - candidates[0].created_at < timedelta(seconds=NOTIFICATION_DIGEST_WINDOW)
+    if not force and window_open and len(candidates) < NOTIFICATION_DIGEST_MAX:
+        return []
+
+    token = uuid.uuid4().hex
+    db.session.execute(
+        update(OutboundNotification)
+        .where(OutboundNotification.id.in_([c.id for c in candidates]), claimable)
+        .values(status='sending', claim_token=token, locked_at=now,
+                attempts=OutboundNotification.attempts + 1)
+    )
+    db.session.commit()
+    return OutboundNotification.query.filter_by(claim_token=token).order_by(OutboundNotification.id).all()
 
-        if all([smtp_username, smtp_password]):
-            with smtplib.SMTP(smtp_server, smtp_port) as server:
-                server.starttls()
-                server.login(smtp_username, smtp_password)
-                server.send_message(message)
-                logger.info(f"Notification sent for ticket #{ticket.id}")
-        else:
-            logger.warning("Email credentials not configured. Skipping notification.")
+
+def fail_abandoned_notifications():
+    """
+    Fail notifications left 'sending' by a worker that died during their
+    last attempt, which _claim_batch no longer reclaims. Returns the number failed.
+    """
+    stale_before = datetime.utcnow() - timedelta(seconds=NOTIFICATION_LEASE)
+    result = db.session.execute(
+        update(OutboundNotification)
+        .where(OutboundNotification.status == 'sending',
+               OutboundNotification.locked_at < stale_before,
+               OutboundNotification.attempts >= NOTIFICATION_MAX_ATTEMPTS)
+        .values(status='failed', last_error='Worker lost during the last attempt')
+    )
+    db.session.commit()
+    if result.rowcount:
+        logger.warning(f"{result.rowcount} notifications were abandoned on their last attempt")
+    return result.rowcount
+
+
+def _send_batch(batch, connection):
+    # One email per ticket even if it was escalated more than once
+    ticket_ids = list(dict.fromkeys(row.ticket_id for row in batch))
+    tickets = Ticket.query.filter(Ticket.id.in_(ticket_ids)).order_by(Ticket.id).all()
+
+    try:
+        if tickets:
+            connection.send(build_message(tickets, connection.settings))
+        now = datetime.utcnow()
+        for row in batch:
+            row.status = 'sent'
+            row.sent_at = now
+            row.last_error = None
+        logger.info(f"Notification sent for tickets {', '.join(f'#{t.id}' for t in tickets)}")
 
     except Exception as e:
+        connection.close()
         logger.error(f"Failed to send notification: {str(e)}")
+        for row in batch:
+            row.last_error = str(e)
+            if row.attempts >= NOTIFICATION_MAX_ATTEMPTS:
+                row.status = 'failed'
+            else:
+                row.status = 'pending'
+                row.available_at = datetime.utcnow() + timedelta(
+                    seconds=NOTIFICATION_RETRY_DELAY * 2 ** (row.attempts - 1)
+                )
+    db.session.commit()
+
+
+def drain_notifications(connection=None, force=False):
+    """
+    Send every notification batch that is due, after failing those
+    abandoned on their last attempt. force=True ignores the digest window.
+    Returns the number of notifications handled.
+    """
+    if not _email_enabled():
+        return 0
+
+    fail_abandoned_notifications()
+    settings = _smtp_settings()
+    own_connection = connection is None
+    connection = connection or SMTPConnection(settings)
+    handled = 0
+    try:
+        while True:
+            batch = _claim_batch(force=force)
+            if not batch:
+                break
+            _send_batch(batch, connection)
+            handled += len(batch)
+    finally:
+        if own_connection:
+            connection.close()
+    return handled
+
+
+_wakeup = threading.Event()
+_dispatcher_pid = None
+_dispatcher_lock = threading.Lock()
+
+
+def _dispatcher_loop(app):
+    connection = SMTPConnection(_smtp_settings())
+    while True:
+        with app.app_context():
+            try:
+                drain_notifications(connection)
+            except Exception as e:
+                logger.error(f"Notification dispatcher error: {str(e)}")
+                db.session.rollback()
+        connection.close_if_idle()
+        _wakeup.wait(NOTIFICATION_POLL_INTERVAL)
+        _wakeup.clear()
+
+
+def start_notification_dispatcher(app):
+    """
+    Start the background dispatcher thread for this process. Safe to call
+    more than once and again after a fork.
+    """
+    global _dispatcher_pid
+    if NOTIFICATION_DISPATCH != "background":
+        return
+    with _dispatcher_lock:
+        if _dispatcher_pid == os.getpid():
+            return
+        threading.Thread(target=_dispatcher_loop, args=(app,), name="notification-dispatcher", daemon=True).start()
+        _dispatcher_pid = os.getpid()
+        logger.info("Started notification dispatcher")
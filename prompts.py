@@ -0,0 +1,132 @@
+import os
+import textwrap
+from functools import lru_cache
+
+from tokenizer import count_tokens, truncate_tokens
+
+# Upper bound on the tokens sent with one analysis call, system prompt included
+LLM_INPUT_TOKEN_BUDGET = int(os.getenv("LLM_INPUT_TOKEN_BUDGET", "4000"))
+# Share of the remaining budget the current message may take when history
+# competes for space; history gets the rest
+PROMPT_MESSAGE_SHARE = float(os.getenv("PROMPT_MESSAGE_SHARE", "0.4"))
+
+
+def compact(template):
+    """
+    Dedent a template and drop trailing whitespace and surrounding blank
+    lines, so indentation in the source isn't paid for in tokens
+    """
+    lines = textwrap.dedent(template).strip('\n').split('\n')
+    return '\n'.join(line.rstrip() for line in lines).strip()
+
+
+GUIDELINES = compact("""
+    You are an experienced IT support professional. Your role is to:
+    1. Analyze IT support tickets thoroughly
+    2. Ask relevant follow-up questions when needed
+    3. Provide detailed troubleshooting steps
+    4. Track issue resolution progress
+    5. Always respond in english as default, unless the user asks in spanish.
+
+    Important Guidelines:
+    - Always acknowledge the user's problem first
+    - Ask follow-up questions when:
+      * The issue description is vague
+      * More technical details are needed
+      * Previous steps didn't resolve the issue
+    - For each solution:
+      * Start with simple steps
+      * Progress to more complex solutions
+      * Include expected outcomes
+      * Mention potential risks or warnings
+""")
+
+_RESPONSE_SECTIONS = """
+    RESPONSE:
+    Understanding: <brief summary of the issue>
+    Diagnosis: <likely cause based on symptoms>
+    Initial Questions: <if more information is needed>
+    Steps to Resolve:
+    1. <first step with expected outcome>
+    2. <second step with expected outcome>
+    3. <additional steps as needed>
+    Additional Notes: <warnings, alternative solutions, or escalation criteria>
+    Next Steps: <what to do if these steps don't resolve the issue>
+"""
+
+# The system prompts never contain per-request text, so every call starts
+# with the same prefix. At roughly 300 tokens that prefix is below the
+# provider's 1024-token minimum for prompt caching, so no cache hint is sent.
+SYSTEM_PROMPT = GUIDELINES + '\n\n' + compact("""
+    When responding, follow this format:
+    CATEGORY: <network|hardware|software|access|other>
+    CONFIDENCE: <score between 0 and 1>
+""" + _RESPONSE_SECTIONS)
+
+STREAMING_PROMPT = GUIDELINES + '\n\n' + compact("""
+    When responding, follow this format:
+    CATEGORY: <network|hardware|software|access|other>
+    CONFIDENCE: <score between 0 and 1>
+    FOLLOWUP: <true if follow-up questions are needed, otherwise false>
+""" + _RESPONSE_SECTIONS)
+
+STRUCTURED_PROMPT = GUIDELINES + '\n\n' + compact("""
+    Respond with a single JSON object and nothing else, using these keys:
+    "category": one of "network", "hardware", "software", "access", "other"
+    "confidence": number between 0 and 1
+    "needs_followup": true if follow-up questions are needed, otherwise false
+    "understanding": brief summary of the issue
+    "diagnosis": likely cause based on symptoms
+    "initial_questions": questions if more information is needed, otherwise ""
+    "steps": list of steps to resolve, each with its expected outcome
+    "additional_notes": warnings, alternative solutions, or escalation criteria
+    "next_steps": what to do if these steps don't resolve the issue
+""")
+
+SUMMARY_PROMPT = compact("""
+    You are an IT support analyst. Maintain a concise summary of a support
+    conversation: the problem, details the user provided, steps already tried
+    and their outcomes. Respond with the updated summary only.
+""")
+
+FOLLOWUP_PROMPT = compact("""
+    You are an IT support analyst. Determine if this issue description needs
+    follow-up questions. Respond with only 'true' or 'false'.
+""")
+
+HISTORY_TEMPLATE = compact("""
+    Previous Conversation:
+    {history}
+
+    Current Message:
+    {message}
+
+    Provide a response that takes into account the previous conversation and any steps already attempted.
+""")
+
+@lru_cache(maxsize=None)
+def _history_template_tokens():
+    # Counted on first use: loading the tokenizer doesn't belong in import time
+    return count_tokens(HISTORY_TEMPLATE.format(history='', message=''))
+
+
+def build_user_prompt(system_prompt, message, conversation_history=None, budget=LLM_INPUT_TOKEN_BUDGET):
+    """
+    Assemble the user turn so the whole call stays within the token budget.
+    The message keeps its start and end; history keeps its opening context
+    and its most recent turns.
+    """
+    available = budget - count_tokens(system_prompt)
+    if not conversation_history:
+        return truncate_tokens(message, available, keep='middle')
+
+    available -= _history_template_tokens()
+    message_tokens = count_tokens(message)
+    history_tokens = count_tokens(conversation_history)
+    if message_tokens + history_tokens > available:
+        # Let the message use whatever history leaves over, but at least its share
+        message_cap = max(int(available * PROMPT_MESSAGE_SHARE), available - history_tokens)
+        message = truncate_tokens(message, message_cap, keep='middle')
+        conversation_history = truncate_tokens(
+            conversation_history, available - count_tokens(message), keep='middle')
+    return HISTORY_TEMPLATE.format(history=conversation_history, message=message)
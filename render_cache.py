@@ -0,0 +1,245 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import Ticket, Message
+
+logger = logging.getLogger(__name__)
+
+RENDER_CACHE_ENABLED = os.getenv("RENDER_CACHE_ENABLED", "true").lower() == "true"
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "2000"))
+# Writes through this process (or any process, with Redis) invalidate
+# immediately; the TTL bounds staleness from other workers' writes when
+# each worker keeps its own cache
+RENDER_CACHE_TTL = int(os.getenv("RENDER_CACHE_TTL", "30"))
+# e.g. redis://localhost:6379/0 to share one cache between workers
+RENDER_CACHE_REDIS_URL = os.getenv("RENDER_CACHE_REDIS_URL", "")
+
+
+def make_etag(body):
+    return hashlib.sha1(body.encode()).hexdigest()
+
+
+class LocalRenderCache:
+    """
+    In-process LRU of rendered fragments per ticket. A render is stored only
+    if its ticket wasn't invalidated since the render started, so a render
+    that raced with a write is never stored.
+
+    Invalidations are stamped from one counter and the latest stamps are kept
+    for at most capacity tickets; a ticket whose stamp was evicted counts as
+    invalidated at the newest evicted stamp, which can only reject a store.
+    """
+
+    def __init__(self, capacity=RENDER_CACHE_SIZE, ttl=RENDER_CACHE_TTL):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (ticket id, fragment) -> (stored_at, etag, body)
+        self._generation = 0
+        self._invalidated = OrderedDict()  # ticket id -> generation it was last invalidated at
+        self._evicted_generation = 0
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, ticket_id, fragment):
+        key = (ticket_id, fragment)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1], entry[2]
+
+    def generation(self, ticket_id):
+        with self._lock:
+            return self._generation
+
+    def put(self, ticket_id, fragment, generation, etag, body):
+        with self._lock:
+            if self._invalidated.get(ticket_id, self._evicted_generation) > generation:
+                return
+            self._entries[(ticket_id, fragment)] = (time.monotonic(), etag, body)
+            self._entries.move_to_end((ticket_id, fragment))
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, ticket_ids):
+        with self._lock:
+            self._generation += 1
+            for ticket_id in ticket_ids:
+                self._invalidated[ticket_id] = self._generation
+                self._invalidated.move_to_end(ticket_id)
+            while len(self._invalidated) > self.capacity:
+                _, evicted = self._invalidated.popitem(last=False)
+                self._evicted_generation = max(self._evicted_generation, evicted)
+            for key in [key for key in self._entries if key[0] in ticket_ids]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'backend': 'local',
+                'entries': len(self._entries),
+                'capacity': self.capacity,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0
+            }
+
+
+class RedisRenderCache:
+    """
+    The same cache kept in Redis (or a compatible server) so every worker
+    sees each other's invalidations. One hash per ticket holds its fragments.
+    """
+
+    def __init__(self, url, ttl=RENDER_CACHE_TTL):
+        import redis  # optional; only this backend needs it
+
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self._watch_error = redis.WatchError
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+
+    def get(self, ticket_id, fragment):
+        etag, body = self.client.hmget(f"render:{ticket_id}", f"{fragment}:etag", f"{fragment}:body")
+        self._count(etag is not None)
+        return (etag, body) if etag is not None else None
+
+    def generation(self, ticket_id):
+        return self.client.get(f"render:{ticket_id}:gen")
+
+    def put(self, ticket_id, fragment, generation, etag, body):
+        key = f"render:{ticket_id}"
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(f"{key}:gen")
+                if pipe.get(f"{key}:gen") != generation:
+                    return
+                pipe.multi()
+                pipe.hset(key, mapping={f"{fragment}:etag": etag, f"{fragment}:body": body})
+                pipe.expire(key, self.ttl)
+                pipe.execute()
+            except self._watch_error:
+                pass  # invalidated while rendering
+
+    def invalidate(self, ticket_ids):
+        pipe = self.client.pipeline(transaction=False)
+        for ticket_id in ticket_ids:
+            pipe.incr(f"render:{ticket_id}:gen")
+            # Outlives any entry rendered under the previous generation
+            pipe.expire(f"render:{ticket_id}:gen", self.ttl * 2)
+            pipe.delete(f"render:{ticket_id}")
+        pipe.execute()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'backend': 'redis',
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_render_cache():
+    """
+    Return the process-wide render cache, or None when disabled
+    """
+    global _cache
+    if not RENDER_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                if RENDER_CACHE_REDIS_URL:
+                    try:
+                        _cache = RedisRenderCache(RENDER_CACHE_REDIS_URL)
+                    except ImportError:
+                        logger.warning("redis is not installed, using the in-process render cache")
+                if _cache is None:
+                    _cache = LocalRenderCache()
+    return _cache
+
+
+def cached_fragment(ticket_id, fragment, render):
+    """
+    Return (etag, body) for a ticket's fragment, calling render() to build
+    the body on a miss
+    """
+    cache = get_render_cache()
+    if cache is None:
+        body = render()
+        return make_etag(body), body
+    try:
+        cached = cache.get(ticket_id, fragment)
+        if cached is not None:
+            return cached
+        generation = cache.generation(ticket_id)
+    except Exception as e:
+        logger.error(f"Render cache read failed: {str(e)}")
+        cache = None
+
+    body = render()
+    etag = make_etag(body)
+    if cache is not None:
+        try:
+            cache.put(ticket_id, fragment, generation, etag, body)
+        except Exception as e:
+            logger.error(f"Render cache write failed: {str(e)}")
+    return etag, body
+
+
+def invalidate_tickets(ticket_ids):
+    cache = get_render_cache()
+    if cache is None or not ticket_ids:
+        return
+    try:
+        cache.invalidate(set(ticket_ids))
+    except Exception as e:
+        logger.error(f"Render cache invalidation failed: {str(e)}")
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_rendered_tickets(session, flush_context):
+    ticket_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Ticket) and obj.id is not None:
+            ticket_ids.add(obj.id)
+        elif isinstance(obj, Message):
+            ticket_ids.add(obj.ticket_id)
+    if ticket_ids:
+        session.info.setdefault('rendered_tickets', set()).update(ticket_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_rendered_tickets(session):
+    invalidate_tickets(session.info.pop('rendered_tickets', None))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rendered_tickets(session):
+    session.info.pop('rendered_tickets', None)
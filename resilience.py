@@ -0,0 +1,348 @@
+import os
+import re
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from metrics import record_llm_call
+
+logger = logging.getLogger(__name__)
+
+# Hard limit on one logical LLM call, hedges and retries included
+LLM_CALL_DEADLINE = float(os.getenv("LLM_CALL_DEADLINE", "20"))
+# Start a second, parallel attempt when the first hasn't answered after this
+# many seconds; 0 disables hedging (failed attempts are still retried)
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "8"))
+# Attempts per logical call, the first one included
+LLM_CALL_ATTEMPTS = int(os.getenv("LLM_CALL_ATTEMPTS", "2"))
+# Consecutive failed calls that open the breaker
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+# Seconds the breaker stays open before a trial call is let through
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+# Reported as retry_after while a half-open trial call is running
+HALF_OPEN_RETRY_AFTER = 1.0
+
+# Category reported for answers given without the LLM
+DEGRADED_CATEGORY = "degraded"
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    Raised instead of calling the LLM while the breaker is open
+    """
+
+
+class CircuitBreaker:
+    """
+    Stops calling the LLM after failure_threshold consecutive failed calls.
+    Once cooldown seconds have passed a single trial call is let through
+    (half-open): its success closes the breaker, its failure reopens it.
+    """
+
+    def __init__(self, failure_threshold=LLM_BREAKER_FAILURES, cooldown=LLM_BREAKER_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._times_opened = 0
+        self._rejected = 0
+
+    def _refuses(self):
+        # Called with the lock held
+        if self._state == 'open':
+            return time.monotonic() - self._opened_at < self.cooldown
+        return self._state == 'half_open' and self._trial_running
+
+    def allow(self):
+        """
+        Whether a call may go ahead now: False if refused, 'trial' for the
+        single half-open trial call, True otherwise
+        """
+        with self._lock:
+            if self._refuses():
+                self._rejected += 1
+                return False
+            if self._state == 'closed':
+                return True
+            self._state = 'half_open'
+            self._trial_running = True
+            return 'trial'
+
+    def abandon_trial(self):
+        """
+        The trial call was cancelled before it finished; it counts as neither
+        success nor failure and the next call becomes the trial
+        """
+        with self._lock:
+            if self._state == 'half_open':
+                self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            if self._state != 'closed':
+                logger.info("LLM circuit breaker closed")
+                self._state = 'closed'
+                self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == 'half_open' or (self._state == 'closed' and self._failures >= self.failure_threshold):
+                logger.warning(f"LLM circuit breaker opened after {self._failures} failed calls")
+                self._state = 'open'
+                self._opened_at = time.monotonic()
+                self._trial_running = False
+                self._times_opened += 1
+
+    @property
+    def is_open(self):
+        """
+        True while calls are being refused, i.e. the LLM is considered down
+        """
+        with self._lock:
+            return self._refuses()
+
+    def retry_after(self):
+        """
+        Seconds until the breaker lets a call through again; 0 when it
+        would let one through now
+        """
+        with self._lock:
+            if not self._refuses():
+                return 0.0
+            if self._state == 'half_open':
+                # Depends on the running trial, which ends within its deadline
+                return HALF_OPEN_RETRY_AFTER
+            return self.cooldown - (time.monotonic() - self._opened_at)
+
+    def stats(self):
+        retry_after = self.retry_after()
+        with self._lock:
+            return {
+                'state': self._state,
+                'consecutive_failures': self._failures,
+                'times_opened': self._times_opened,
+                'rejected_calls': self._rejected,
+                'retry_after_seconds': round(retry_after, 1)
+            }
+
+
+class LLMCallGuard:
+    """
+    Runs LLM calls under the breaker with a deadline. A call that hasn't
+    answered after hedge_delay gets a parallel second attempt and the first
+    answer wins; a failed attempt is retried while attempts and time remain.
+    """
+
+    def __init__(self, breaker, max_workers, deadline=LLM_CALL_DEADLINE, hedge_delay=LLM_HEDGE_DELAY,
+                 attempts=LLM_CALL_ATTEMPTS):
+        self.breaker = breaker
+        self.deadline = deadline
+        self.hedge_delay = hedge_delay
+        self.attempts = max(1, attempts)
+        # Sync attempts run here so the caller can stop waiting at the deadline;
+        # an abandoned attempt ends at the HTTP client's own timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers * self.attempts, thread_name_prefix="llm-call")
+
+    def _admit(self):
+        """
+        Raise CircuitOpenError unless the breaker lets the call through.
+        Returns True if the call is the half-open trial.
+        """
+        allowed = self.breaker.allow()
+        if not allowed:
+            record_llm_call('rejected')
+            raise CircuitOpenError(f"LLM circuit breaker is open, retry in {self.breaker.retry_after():.0f}s")
+        return allowed == 'trial'
+
+    def _abandoned(self, trial):
+        # The caller went away (cancelled request, closed stream) before the
+        # call finished; a trial must not keep the breaker half-open for good
+        record_llm_call('abandoned')
+        if trial:
+            self.breaker.abandon_trial()
+
+    def _wait_timeout(self, deadline_at, launched):
+        remaining = deadline_at - time.monotonic()
+        if self.hedge_delay > 0 and launched < self.attempts:
+            return min(remaining, self.hedge_delay)
+        return remaining
+
+    def _failed(self, pending, error):
+        self.breaker.record_failure()
+        if pending or error is None:
+            record_llm_call('timeout')
+            return TimeoutError(f"LLM call exceeded its {self.deadline:g}s deadline")
+        record_llm_call('failed')
+        return error
+
+    def _succeeded(self):
+        self.breaker.record_success()
+        record_llm_call('ok')
+
+    def call(self, fn):
+        """
+        Return fn()'s result, or raise CircuitOpenError, TimeoutError or
+        the last attempt's error
+        """
+        trial = self._admit()
+        deadline_at = time.monotonic() + self.deadline
+        pending = {self._executor.submit(fn)}
+        launched = 1
+        error = None
+        try:
+            while pending or launched < self.attempts:
+                timeout = self._wait_timeout(deadline_at, launched)
+                if timeout <= 0:
+                    break
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        self._succeeded()
+                        return future.result()
+                    error = future.exception()
+                if launched < self.attempts:
+                    if not done:
+                        record_llm_call('hedged')
+                    pending.add(self._executor.submit(fn))
+                    launched += 1
+        except BaseException:
+            self._abandoned(trial)
+            raise
+        finally:
+            for future in pending:
+                future.cancel()
+        raise self._failed(pending, error)
+
+    async def acall(self, make_call):
+        """
+        Async counterpart of call; make_call() returns a new coroutine per
+        attempt. Losing and late attempts are cancelled.
+        """
+        trial = self._admit()
+        deadline_at = time.monotonic() + self.deadline
+        pending = {asyncio.ensure_future(make_call())}
+        launched = 1
+        error = None
+        try:
+            while pending or launched < self.attempts:
+                timeout = self._wait_timeout(deadline_at, launched)
+                if timeout <= 0:
+                    break
+                done = set()
+                if pending:
+                    done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self._succeeded()
+                        return task.result()
+                    error = task.exception()
+                if launched < self.attempts:
+                    if not done:
+                        record_llm_call('hedged')
+                    pending.add(asyncio.ensure_future(make_call()))
+                    launched += 1
+        except BaseException:
+            # Includes CancelledError when the awaiting request is cancelled
+            self._abandoned(trial)
+            raise
+        finally:
+            for task in pending:
+                task.cancel()
+        raise self._failed(pending, error)
+
+    def stream(self, chunks):
+        """
+        Pass a stream through under the breaker. Streams are neither hedged
+        nor retried, since their output is already on its way to the user.
+        """
+        trial = self._admit()
+        try:
+            yield from chunks
+        except Exception:
+            self.breaker.record_failure()
+            record_llm_call('failed')
+            raise
+        except BaseException:
+            # GeneratorExit when the client disconnects mid-stream
+            self._abandoned(trial)
+            raise
+        self._succeeded()
+
+
+# Words that point at a ticket category when the LLM can't be asked
+CATEGORY_KEYWORDS = {
+    'network': {'network', 'wifi', 'wi-fi', 'wireless', 'internet', 'vpn', 'dns', 'ethernet', 'router',
+                'connection', 'connect', 'connected', 'disconnects', 'offline', 'proxy'},
+    'hardware': {'printer', 'print', 'monitor', 'screen', 'display', 'keyboard', 'mouse', 'laptop', 'battery',
+                 'dock', 'docking', 'usb', 'headset', 'webcam', 'charger', 'overheating'},
+    'software': {'install', 'installed', 'update', 'upgrade', 'crash', 'crashes', 'crashing', 'freezes',
+                 'outlook', 'excel', 'word', 'teams', 'browser', 'application', 'app', 'software', 'license'},
+    'access': {'password', 'login', 'logon', 'locked', 'lockout', 'permission', 'permissions', 'access',
+               'account', 'mfa', '2fa', 'authenticator', 'sso', 'unauthorized'},
+}
+
+GENERAL_STEPS = {
+    'network': (
+        "Disconnect and reconnect to the network (or VPN); the connection should re-establish.",
+        "Restart your computer and, if you are at home, your router; wait two minutes before testing again.",
+        "Check whether colleagues or other websites are affected and note the exact error shown.",
+    ),
+    'hardware': (
+        "Check that the device is powered on and every cable is firmly connected at both ends.",
+        "Restart the device and your computer; most transient hardware errors clear after a restart.",
+        "Try the device on another port or computer to see whether the problem moves with it.",
+    ),
+    'software': (
+        "Save your work, close the application completely and open it again.",
+        "Restart your computer so pending updates can finish installing.",
+        "Note the exact error message and what you were doing when it appeared.",
+    ),
+    'access': (
+        "Check that Caps Lock is off and the keyboard layout is correct, then sign in again.",
+        "If you are unsure of your password, use the \"Forgot password?\" link instead of retrying.",
+        "If the account is locked, wait 15 minutes before the next attempt.",
+    ),
+    'other': (
+        "Restart the affected application or device.",
+        "Note the exact error message, when the problem started and any recent changes.",
+        "Check whether colleagues see the same problem.",
+    ),
+}
+
+
+def keyword_category(description):
+    """
+    Best-guess category from keywords in the description
+    """
+    words = set(re.findall(r"[a-z0-9-]+", description.lower()))
+    scores = {category: len(words & keywords) for category, keywords in CATEGORY_KEYWORDS.items()}
+    category = max(scores, key=scores.get)
+    return category if scores[category] else 'other'
+
+
+def degraded_response(description, reanalyze=True):
+    """
+    General troubleshooting steps for when the LLM is unavailable, in the
+    same layout as an analysis
+    """
+    category = keyword_category(description)
+    lines = [
+        "Understanding: Our AI assistant is temporarily unavailable, so this is a general answer "
+        f"for {category} issues based on your description.",
+        "Steps to Resolve:",
+        *(f"{i}. {step}" for i, step in enumerate(GENERAL_STEPS[category], 1)),
+    ]
+    if reanalyze:
+        lines.append("Next Steps: Your ticket will be analyzed in full as soon as the assistant is available "
+                     "again; there is no need to submit it again.")
+    else:
+        lines.append("Next Steps: Please send your message again in a few minutes for a detailed answer.")
+    return '\n'.join(lines)
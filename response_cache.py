@@ -0,0 +1,203 @@
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1000"))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.85"))
+RESPONSE_CACHE_DIMENSIONS = int(os.getenv("RESPONSE_CACHE_DIMENSIONS", "4096"))
+# Only answers at or above this confidence are reused
+RESPONSE_CACHE_MIN_CONFIDENCE = float(os.getenv("RESPONSE_CACHE_MIN_CONFIDENCE", "0.7"))
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can could do does for from have i im is it its
+me my need needed of on or please so that the this to was we were when with
+you your
+""".split())
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize_description(description):
+    """
+    Lowercase, strip punctuation and collapse whitespace so trivially
+    different descriptions share a key
+    """
+    return ' '.join(TOKEN_RE.findall(description.lower().replace("'", "")))
+
+
+def _terms(normalized):
+    return [w for w in normalized.split() if w not in STOPWORDS]
+
+
+class ResponseCache:
+    """
+    Two-tier cache of ticket analyses.
+
+    The exact tier is keyed on a hash of the normalized description. The
+    similarity tier keeps hashed term-frequency rows in a NumPy matrix and
+    answers with the nearest stored description by TF-IDF cosine similarity.
+    Entries expire after `ttl` seconds and the least recently used entry is
+    evicted when the cache is full.
+    """
+
+    def __init__(self, capacity=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL,
+                 threshold=RESPONSE_CACHE_SIMILARITY, dimensions=RESPONSE_CACHE_DIMENSIONS):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.threshold = threshold
+        self.dimensions = dimensions
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (slot, stored_at, value)
+        self._slot_keys = [None] * capacity
+        self._free_slots = list(range(capacity - 1, -1, -1))
+        self._matrix = np.zeros((capacity, dimensions), dtype=np.float32)
+        self._doc_freq = np.zeros(dimensions, dtype=np.float32)
+
+        self._exact_hits = 0
+        self._similar_hits = 0
+        self._misses = 0
+        self._lookup_seconds = 0.0
+        self._llm_calls = 0
+        self._llm_seconds = 0.0
+
+    def _vectorize(self, normalized):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for term in _terms(normalized):
+            digest = hashlib.blake2b(term.encode(), digest_size=8).digest()
+            vector[int.from_bytes(digest, 'little') % self.dimensions] += 1.0
+        # Sublinear term frequency keeps repeated words from dominating
+        np.log1p(vector, out=vector)
+        return vector
+
+    def _key(self, normalized):
+        return hashlib.sha1(normalized.encode()).hexdigest()
+
+    def _evict(self, key):
+        slot, _, _ = self._entries.pop(key)
+        self._doc_freq -= self._matrix[slot] > 0
+        self._matrix[slot] = 0
+        self._slot_keys[slot] = None
+        self._free_slots.append(slot)
+
+    def _expire(self, now):
+        while self._entries:
+            key, (_, stored_at, _) = next(iter(self._entries.items()))
+            if now - stored_at <= self.ttl:
+                break
+            self._evict(key)
+
+    def _nearest(self, vector):
+        used = [slot for slot, key in enumerate(self._slot_keys) if key is not None]
+        if not used or not vector.any():
+            return None, 0.0
+
+        idf = np.log((1.0 + len(used)) / (1.0 + self._doc_freq)) + 1.0
+        rows = self._matrix[used] * idf
+        query = vector * idf
+        norms = np.linalg.norm(rows, axis=1) * np.linalg.norm(query)
+        norms[norms == 0] = 1.0
+        scores = rows @ query / norms
+
+        best = int(np.argmax(scores))
+        return self._slot_keys[used[best]], float(scores[best])
+
+    def get(self, description):
+        """
+        Return the cached (response, confidence, category) or None
+        """
+        started = time.perf_counter()
+        normalized = normalize_description(description)
+        key = self._key(normalized)
+        try:
+            with self._lock:
+                self._expire(time.time())
+
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self._exact_hits += 1
+                    return self._entries[key][2]
+
+                match_key, score = self._nearest(self._vectorize(normalized))
+                if match_key is not None and score >= self.threshold:
+                    self._entries.move_to_end(match_key)
+                    self._similar_hits += 1
+                    logger.debug(f"Similarity cache hit (score {score:.2f})")
+                    return self._entries[match_key][2]
+
+                self._misses += 1
+                return None
+        finally:
+            with self._lock:
+                self._lookup_seconds += time.perf_counter() - started
+
+    def record_llm_latency(self, seconds):
+        """
+        Record how long a cache miss spent in the LLM, for comparison with lookups
+        """
+        with self._lock:
+            self._llm_calls += 1
+            self._llm_seconds += seconds
+
+    def put(self, description, value):
+        normalized = normalize_description(description)
+        key = self._key(normalized)
+        vector = self._vectorize(normalized)
+        with self._lock:
+            if key in self._entries:
+                self._evict(key)
+            if not self._free_slots:
+                self._evict(next(iter(self._entries)))
+
+            slot = self._free_slots.pop()
+            self._matrix[slot] = vector
+            self._doc_freq += vector > 0
+            self._slot_keys[slot] = key
+            self._entries[key] = (slot, time.time(), value)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._evict(key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._exact_hits + self._similar_hits + self._misses
+            hits = self._exact_hits + self._similar_hits
+            return {
+                'entries': len(self._entries),
+                'capacity': self.capacity,
+                'exact_hits': self._exact_hits,
+                'similar_hits': self._similar_hits,
+                'misses': self._misses,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+                'avg_lookup_ms': round(self._lookup_seconds * 1000 / lookups, 3) if lookups else 0.0,
+                'avg_miss_llm_ms': round(self._llm_seconds * 1000 / self._llm_calls, 1) if self._llm_calls else 0.0
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    Return the process-wide response cache, or None when disabled
+    """
+    global _cache
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
@@ -0,0 +1,230 @@
+import os
+import re
+import json
+import logging
+import threading
+from functools import lru_cache
+from collections import namedtuple
+
+from tokenizer import count_tokens
+from resilience import CATEGORY_KEYWORDS
+
+logger = logging.getLogger(__name__)
+
+# Answer obvious, well-understood issues from a local playbook without an LLM call
+ROUTING_RULES_ENABLED = os.getenv("ROUTING_RULES_ENABLED", "true").lower() == "true"
+ROUTING_RULES_CONFIDENCE = float(os.getenv("ROUTING_RULES_CONFIDENCE", "0.8"))
+# Longer descriptions usually carry details a playbook can't address
+ROUTING_RULES_MAX_WORDS = int(os.getenv("ROUTING_RULES_MAX_WORDS", "40"))
+# Re-ask the escalation model below this confidence; matches the review
+# threshold used when tickets are submitted
+ROUTING_ESCALATION_THRESHOLD = float(os.getenv("ROUTING_ESCALATION_THRESHOLD", "0.7"))
+
+# USD per million (input, output) tokens; override with a JSON object in LLM_PRICES
+DEFAULT_PRICES = {
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4o': (2.50, 10.00),
+}
+LLM_PRICES = {**DEFAULT_PRICES, **{
+    model: tuple(prices) for model, prices in json.loads(os.getenv("LLM_PRICES", "{}")).items()
+}}
+
+
+# A canned answer for a common issue, used when the description matches pattern.
+# Patterns match the request itself ("I forgot my password"), not any mention
+# of the topic ("I reset my password but Outlook still rejects it").
+Playbook = namedtuple('Playbook', ['category', 'pattern', 'lines'])
+
+
+PLAYBOOKS = (
+    Playbook(
+        'access',
+        re.compile(r"\bforgot(ten)?\b.{0,20}\bpassword\b"
+                   r"|\b(need|want|request|requesting|please|help me|can you|could you|how (do|can) i)\b"
+                   r".{0,30}\b(reset|change)\b.{0,20}\bpassword\b"
+                   r"|\b(need|want|request|requesting)\b.{0,20}\bpassword reset\b"
+                   r"|\bpassword (has |is )?expired\b|\bexpired password\b"),
+        (
+            "Understanding: You need to reset a forgotten or expired password.",
+            "Diagnosis: Password resets are handled through the self-service portal.",
+            "Steps to Resolve:",
+            "1. Open the password reset page from the sign-in screen (\"Forgot password?\"); you should be asked for your username or email.",
+            "2. Follow the verification link or code sent to your registered email or phone; the link is valid for a limited time.",
+            "3. Choose a new password that meets the complexity rules and sign in with it; you should be signed in normally.",
+            "Additional Notes: Never share your new password. If you no longer have access to your recovery email or phone, reply here so an administrator can verify you.",
+            "Next Steps: If the reset link does not arrive within 10 minutes, check your spam folder and then reply to this ticket.",
+        )
+    ),
+    Playbook(
+        'access',
+        re.compile(r"\baccount (is |has been |got |was )?(locked|locked out)\b|\b(i am|i'm|i've been|i got) locked out\b"),
+        (
+            "Understanding: Your account has been locked, most likely after several failed sign-in attempts.",
+            "Diagnosis: Accounts lock automatically after repeated incorrect passwords and unlock after a waiting period.",
+            "Steps to Resolve:",
+            "1. Wait 15 minutes without attempting to sign in; the lock should clear automatically.",
+            "2. Sign in again, checking that Caps Lock is off and the keyboard layout is correct; you should be able to sign in.",
+            "3. If you are unsure of the password, use the \"Forgot password?\" link to reset it instead of retrying.",
+            "Additional Notes: Repeated lockouts can mean an old password is saved on another device (phone mail app, mapped drive); update it there.",
+            "Next Steps: If the account is still locked after 15 minutes, reply to this ticket so an administrator can unlock it.",
+        )
+    ),
+    Playbook(
+        'hardware',
+        re.compile(r"\bpaper jam\b|\bprinter\b.*\bjam(med|s)?\b|\bjam(med|s)?\b.*\bprinter\b"),
+        (
+            "Understanding: The printer is reporting or showing a paper jam.",
+            "Diagnosis: A sheet is stuck in the paper path, usually at the tray, the rear door or the fuser.",
+            "Steps to Resolve:",
+            "1. Turn the printer off and let it cool for a few minutes; the fuser area can be hot.",
+            "2. Open each tray and access door shown on the printer's display and gently pull out any paper in the direction of travel; no torn pieces should remain.",
+            "3. Reload the tray with a fresh, straight stack of paper without overfilling it, close all doors and turn the printer on; the jam message should clear.",
+            "Additional Notes: Do not use tools to remove paper. Damp or curled paper causes repeated jams.",
+            "Next Steps: If the jam message persists with no visible paper, reply to this ticket with the printer name and any error code.",
+        )
+    ),
+)
+
+
+def _mentions_other_category(text, category):
+    words = set(re.findall(r"[a-z0-9-]+", text))
+    return any(words & keywords for other, keywords in CATEGORY_KEYWORDS.items() if other != category)
+
+
+def match_playbook(description):
+    """
+    Return the playbook for an obvious, common issue, or None. Descriptions
+    that also mention another category's keywords (a password problem in
+    Outlook, a jam after an update) go to the LLM instead.
+    """
+    if not ROUTING_RULES_ENABLED or len(description.split()) > ROUTING_RULES_MAX_WORDS:
+        return None
+    text = description.lower()
+    for playbook in PLAYBOOKS:
+        if playbook.pattern.search(text):
+            if _mentions_other_category(text, playbook.category):
+                return None
+            return playbook
+    return None
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    input_price, output_price = LLM_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+
+@lru_cache(maxsize=None)
+def _usage_handler_class():
+    # langchain is imported on first use, like the rest of the LLM stack
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class TokenUsageHandler(BaseCallbackHandler):
+        run_inline = True
+
+        def __init__(self):
+            self.token_usage = None
+
+        def on_llm_end(self, response, **kwargs):
+            self.token_usage = (response.llm_output or {}).get('token_usage') or self.token_usage
+
+    return TokenUsageHandler
+
+
+def usage_handler():
+    """
+    Callback handler that keeps the token usage the API reported for a call.
+    The langchain_community ChatOpenAI only reports it in the LLM result,
+    not on the returned message.
+    """
+    return _usage_handler_class()()
+
+
+def attach_usage(response, handler):
+    """
+    Copy the usage a handler saw into the response's metadata, where
+    token_usage finds it
+    """
+    metadata = getattr(response, 'response_metadata', None)
+    if handler.token_usage and isinstance(metadata, dict):
+        metadata.setdefault('token_usage', handler.token_usage)
+    return response
+
+
+def token_usage(messages, response):
+    """
+    (prompt_tokens, completion_tokens, estimated): the counts reported by
+    the API, or estimated from the messages when it reported none
+    """
+    usage = getattr(response, 'usage_metadata', None)
+    if usage:
+        return usage.get('input_tokens', 0), usage.get('output_tokens', 0), False
+    usage = (getattr(response, 'response_metadata', None) or {}).get('token_usage')
+    if usage:
+        return usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0), False
+    prompt_tokens = sum(count_tokens(message.content) for message in messages)
+    return prompt_tokens, count_tokens(response.content), True
+
+
+class RoutingStats:
+    """
+    Per-tier call counts, latency and cost for this process
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tiers = {}
+        self._escalations = 0
+        self._escalations_resolved = 0
+
+    def record(self, tier, seconds, prompt_tokens=0, completion_tokens=0, cost=0.0, estimated=False):
+        """
+        estimated: the token counts are local estimates, not the API's
+        """
+        with self._lock:
+            stats = self._tiers.setdefault(tier, {
+                'calls': 0, 'estimated_calls': 0, 'seconds': 0.0, 'prompt_tokens': 0, 'completion_tokens': 0,
+                'cost': 0.0
+            })
+            stats['calls'] += 1
+            if estimated:
+                stats['estimated_calls'] += 1
+            stats['seconds'] += seconds
+            stats['prompt_tokens'] += prompt_tokens
+            stats['completion_tokens'] += completion_tokens
+            stats['cost'] += cost
+
+    def record_escalation(self, resolved):
+        """
+        resolved: the escalation model was confident enough to avoid human review
+        """
+        with self._lock:
+            self._escalations += 1
+            if resolved:
+                self._escalations_resolved += 1
+
+    def stats(self):
+        with self._lock:
+            tiers = {
+                tier: {
+                    'calls': stats['calls'],
+                    'estimated_calls': stats['estimated_calls'],
+                    'avg_latency_ms': round(1000 * stats['seconds'] / stats['calls'], 1),
+                    'prompt_tokens': stats['prompt_tokens'],
+                    'completion_tokens': stats['completion_tokens'],
+                    'cost_usd': round(stats['cost'], 6),
+                }
+                for tier, stats in self._tiers.items()
+            }
+            return {
+                'tiers': tiers,
+                'escalations': self._escalations,
+                'escalations_resolved': self._escalations_resolved,
+                'total_cost_usd': round(sum(stats['cost'] for stats in self._tiers.values()), 6),
+            }
+
+
+_routing_stats = RoutingStats()
+
+
+def get_routing_stats():
+    return _routing_stats
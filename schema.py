@@ -0,0 +1,38 @@
+import logging
+from sqlalchemy import inspect, text
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+def _add_missing_columns(table, existing_columns):
+    """
+    Add nullable columns defined on the model but missing from the database
+    """
+    for column in table.columns:
+        if column.name in existing_columns:
+            continue
+        if not column.nullable or column.primary_key:
+            logger.warning(f"Cannot add required column {table.name}.{column.name} automatically")
+            continue
+        column_type = column.type.compile(dialect=db.engine.dialect)
+        db.session.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+        logger.info(f"Added column {table.name}.{column.name}")
+
+
+def upgrade_schema():
+    """
+    Bring the database up to the models: create missing tables, then add
+    columns and indexes that create_all skips on tables that already exist
+    """
+    db.create_all()
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        _add_missing_columns(table, existing_columns)
+    db.session.commit()
+
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
@@ -0,0 +1,151 @@
+import os
+import logging
+from markupsafe import escape
+from sqlalchemy import text
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+SEARCH_LANGUAGE = os.getenv("SEARCH_LANGUAGE", "english")
+
+# Must match the indexed expression exactly for Postgres to use the GIN index
+PG_DOCUMENT = f"to_tsvector('{SEARCH_LANGUAGE}', coalesce(description, '') || ' ' || coalesce(ai_response, ''))"
+
+SQLITE_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS ticket_fts USING fts5(
+        description, ai_response, content='ticket', content_rowid='id'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS ticket_fts_insert AFTER INSERT ON ticket BEGIN
+        INSERT INTO ticket_fts(rowid, description, ai_response)
+        VALUES (new.id, new.description, coalesce(new.ai_response, ''));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS ticket_fts_delete AFTER DELETE ON ticket BEGIN
+        INSERT INTO ticket_fts(ticket_fts, rowid, description, ai_response)
+        VALUES ('delete', old.id, old.description, coalesce(old.ai_response, ''));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS ticket_fts_update AFTER UPDATE OF description, ai_response ON ticket BEGIN
+        INSERT INTO ticket_fts(ticket_fts, rowid, description, ai_response)
+        VALUES ('delete', old.id, old.description, coalesce(old.ai_response, ''));
+        INSERT INTO ticket_fts(rowid, description, ai_response)
+        VALUES (new.id, new.description, coalesce(new.ai_response, ''));
+    END""",
+]
+
+
+def setup_search_index():
+    """
+    Create the full-text index: a GIN expression index on Postgres, an FTS5
+    table kept in sync by triggers on SQLite
+    """
+    dialect = db.engine.dialect.name
+    try:
+        if dialect == 'postgresql':
+            db.session.execute(text(f"CREATE INDEX IF NOT EXISTS idx_ticket_fts ON ticket USING GIN ({PG_DOCUMENT})"))
+        elif dialect == 'sqlite':
+            exists = db.session.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ticket_fts'"
+            )).first()
+            for statement in SQLITE_FTS_DDL:
+                db.session.execute(text(statement))
+            if not exists:
+                rebuild_search_index()
+        db.session.commit()
+    except Exception as e:
+        logger.error(f"Error setting up search index: {str(e)}")
+        db.session.rollback()
+
+
+def rebuild_search_index():
+    """
+    Repopulate the SQLite FTS table from the ticket table. Postgres
+    expression indexes never need this.
+    """
+    if db.engine.dialect.name == 'sqlite':
+        db.session.execute(text("INSERT INTO ticket_fts(ticket_fts) VALUES ('rebuild')"))
+
+
+def _fts5_query(query):
+    # Quote every term so user input can't use FTS5 operators
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+def _highlight(snippet):
+    """
+    Escape a snippet while keeping the <mark> tags added by the database
+    """
+    escaped = str(escape(snippet or ''))
+    return escaped.replace('&lt;mark&gt;', '<mark>').replace('&lt;/mark&gt;', '</mark>')
+
+
+def _search_postgresql(query, limit, offset):
+    params = {'q': query, 'limit': limit, 'offset': offset}
+    total = db.session.execute(text(
+        f"SELECT count(*) FROM ticket WHERE {PG_DOCUMENT} @@ websearch_to_tsquery('{SEARCH_LANGUAGE}', :q)"
+    ), params).scalar()
+
+    # Rank and page first so headlines are only built for the returned rows
+    rows = db.session.execute(text(f"""
+        SELECT t.id, t.name, t.category, t.status, t.created_at, page.score,
+               ts_headline('{SEARCH_LANGUAGE}', coalesce(t.description, '') || ' ' || coalesce(t.ai_response, ''),
+                           websearch_to_tsquery('{SEARCH_LANGUAGE}', :q),
+                           'StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=20') AS snippet
+        FROM (
+            SELECT id, ts_rank({PG_DOCUMENT}, websearch_to_tsquery('{SEARCH_LANGUAGE}', :q)) AS score
+            FROM ticket
+            WHERE {PG_DOCUMENT} @@ websearch_to_tsquery('{SEARCH_LANGUAGE}', :q)
+            ORDER BY score DESC, id DESC
+            LIMIT :limit OFFSET :offset
+        ) AS page
+        JOIN ticket t ON t.id = page.id
+        ORDER BY page.score DESC, t.id DESC
+    """), params).all()
+    return total, rows
+
+
+def _search_sqlite(query, limit, offset):
+    params = {'q': _fts5_query(query), 'limit': limit, 'offset': offset}
+    total = db.session.execute(text(
+        "SELECT count(*) FROM ticket_fts WHERE ticket_fts MATCH :q"
+    ), params).scalar()
+
+    # bm25() is lower for better matches
+    rows = db.session.execute(text("""
+        SELECT t.id, t.name, t.category, t.status, t.created_at, bm25(ticket_fts) AS score,
+               snippet(ticket_fts, -1, '<mark>', '</mark>', '...', 16) AS snippet
+        FROM ticket_fts
+        JOIN ticket t ON t.id = ticket_fts.rowid
+        WHERE ticket_fts MATCH :q
+        ORDER BY score, t.id DESC
+        LIMIT :limit OFFSET :offset
+    """), params).all()
+    return total, rows
+
+
+def search_tickets(query, page=1, per_page=SEARCH_PAGE_SIZE):
+    """
+    Ranked full-text search over ticket descriptions and AI responses
+    """
+    page = max(page, 1)
+    offset = (page - 1) * per_page
+    if db.engine.dialect.name == 'postgresql':
+        total, rows = _search_postgresql(query, per_page, offset)
+    else:
+        total, rows = _search_sqlite(query, per_page, offset)
+
+    return {
+        'query': query,
+        'page': page,
+        'per_page': per_page,
+        'total': total,
+        'results': [{
+            'id': row.id,
+            'name': row.name,
+            'category': row.category,
+            'status': row.status,
+            'created_at': str(row.created_at)[:16],
+            'score': float(row.score),
+            'snippet': _highlight(row.snippet)
+        } for row in rows]
+    }
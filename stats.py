@@ -0,0 +1,241 @@
+import os
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, select, delete
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app import db
+from models import Ticket, ArchivedTicket, TicketStats
+
+logger = logging.getLogger(__name__)
+
+# Read dashboard metrics and charts from the TicketStats rollup
+USE_STATS_ROLLUP = os.getenv("USE_STATS_ROLLUP", "true").lower() == "true"
+
+AGE_BINS = [1, 2, 3, 7, 14, 30]  # upper bounds in days; the last bin is open-ended
+AGE_LABELS = ['1 day', '2 days', '3 days', '1 week', '2 weeks', '1 month', '> 1 month']
+
+TRACKED_ATTRIBUTES = ('created_at', 'category', 'status', 'resolved_at')
+STATS_KEY_COLUMNS = ('day', 'category', 'status', 'resolution_bin')
+
+
+def age_bin(age_days):
+    for i, upper_bound in enumerate(AGE_BINS):
+        if age_days <= upper_bound:
+            return i
+    return len(AGE_BINS)
+
+
+def _stats_entry(created_at, category, status, resolved_at):
+    """
+    Rollup key and (ticket_count, resolution_count, resolution_days_sum)
+    contribution of one ticket
+    """
+    if resolved_at is not None:
+        days = (resolved_at - created_at).total_seconds() / 86400
+        return (created_at.date(), category, status, age_bin(days)), (1, 1, days)
+    return (created_at.date(), category, status, -1), (1, 0, 0.0)
+
+
+def _add(deltas, entry, sign):
+    key, values = entry
+    deltas[key] = [total + sign * value for total, value in zip(deltas[key], values)]
+
+
+def _previous_values(ticket):
+    values = {}
+    for name in TRACKED_ATTRIBUTES:
+        history = get_history(ticket, name)
+        if history.deleted:
+            values[name] = history.deleted[0]
+        elif history.unchanged:
+            values[name] = history.unchanged[0]
+        else:
+            values[name] = getattr(ticket, name)
+    return values
+
+
+def upsert_stats(connection, deltas):
+    """
+    Apply rollup deltas with INSERT ... ON CONFLICT DO UPDATE
+    """
+    insert = postgresql_insert if connection.dialect.name == 'postgresql' else sqlite_insert
+    table = TicketStats.__table__
+    for key, (count, resolution_count, resolution_days) in deltas.items():
+        if not count and not resolution_count:
+            continue
+        statement = insert(table).values(
+            **dict(zip(STATS_KEY_COLUMNS, key)),
+            ticket_count=count,
+            resolution_count=resolution_count,
+            resolution_days_sum=resolution_days
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=list(STATS_KEY_COLUMNS),
+            set_={
+                'ticket_count': table.c.ticket_count + statement.excluded.ticket_count,
+                'resolution_count': table.c.resolution_count + statement.excluded.resolution_count,
+                'resolution_days_sum': table.c.resolution_days_sum + statement.excluded.resolution_days_sum,
+            }
+        )
+        connection.execute(statement)
+
+
+def record_inserted_tickets(connection, rows):
+    """
+    Apply rollup deltas for tickets inserted with Core statements, which
+    bypass the session events below
+    """
+    deltas = defaultdict(lambda: [0, 0, 0.0])
+    for row in rows:
+        _add(deltas, _stats_entry(row['created_at'], row['category'], row['status'], row.get('resolved_at')), 1)
+    upsert_stats(connection, deltas)
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_ticket_stats(session, flush_context):
+    """
+    Turn ticket inserts, deletes and status/category/resolution changes in
+    this flush into rollup deltas. Runs in the flush's transaction.
+    """
+    deltas = defaultdict(lambda: [0, 0, 0.0])
+
+    for obj in session.new:
+        if isinstance(obj, Ticket):
+            _add(deltas, _stats_entry(obj.created_at, obj.category, obj.status, obj.resolved_at), 1)
+
+    for obj in session.dirty:
+        if not isinstance(obj, Ticket):
+            continue
+        if not any(get_history(obj, name).has_changes() for name in TRACKED_ATTRIBUTES):
+            continue
+        previous = _previous_values(obj)
+        _add(deltas, _stats_entry(previous['created_at'], previous['category'],
+                                  previous['status'], previous['resolved_at']), -1)
+        _add(deltas, _stats_entry(obj.created_at, obj.category, obj.status, obj.resolved_at), 1)
+
+    for obj in session.deleted:
+        if isinstance(obj, Ticket):
+            previous = _previous_values(obj)
+            _add(deltas, _stats_entry(previous['created_at'], previous['category'],
+                                      previous['status'], previous['resolved_at']), -1)
+
+    if deltas:
+        upsert_stats(session.connection(), deltas)
+
+
+def rebuild_ticket_stats(batch_size=5000):
+    """
+    Recompute the whole rollup from the ticket and archive tables. Returns
+    the number of rollup rows written.
+    """
+    deltas = defaultdict(lambda: [0, 0, 0.0])
+    for model in (Ticket, ArchivedTicket):
+        statement = (
+            select(model.created_at, model.category, model.status, model.resolved_at)
+            .execution_options(stream_results=True, yield_per=batch_size)
+        )
+        for row in db.session.execute(statement):
+            _add(deltas, _stats_entry(*row), 1)
+
+    db.session.execute(delete(TicketStats))
+    if deltas:
+        db.session.execute(TicketStats.__table__.insert(), [
+            dict(zip(STATS_KEY_COLUMNS, key), ticket_count=count,
+                 resolution_count=resolution_count, resolution_days_sum=resolution_days)
+            for key, (count, resolution_count, resolution_days) in deltas.items()
+        ])
+    db.session.commit()
+    return len(deltas)
+
+
+def ensure_ticket_stats():
+    """
+    Backfill the rollup on startup if it is empty but tickets exist
+    """
+    if not USE_STATS_ROLLUP:
+        return
+    if db.session.query(TicketStats.day).first() is None and db.session.query(Ticket.id).first() is not None:
+        rows = rebuild_ticket_stats()
+        logger.info(f"Backfilled ticket stats rollup with {rows} rows")
+
+
+def stats_filter_conditions(args):
+    """
+    Rollup equivalent of the dashboard's ticket filters
+    """
+    conditions = []
+    status_filter = args.get('status', 'all')
+    category_filter = args.get('category', 'all')
+    if status_filter != 'all':
+        conditions.append(TicketStats.status == status_filter)
+    if category_filter != 'all':
+        conditions.append(TicketStats.category == category_filter)
+    if args.get('start_date'):
+        conditions.append(TicketStats.day >= datetime.strptime(args['start_date'], '%Y-%m-%d').date())
+    if args.get('end_date'):
+        conditions.append(TicketStats.day <= datetime.strptime(args['end_date'], '%Y-%m-%d').date())
+    return conditions
+
+
+def rollup_metrics(args):
+    """
+    Dashboard metrics from the rollup, one row per status
+    """
+    counts = dict(
+        db.session.query(TicketStats.status, func.sum(TicketStats.ticket_count))
+        .filter(*stats_filter_conditions(args))
+        .group_by(TicketStats.status)
+        .all()
+    )
+    return {
+        'total_tickets': int(sum(counts.values())),
+        'resolved_tickets': int(counts.get('resolved', 0)),
+        'pending_tickets': int(counts.get('pending_review', 0))
+    }
+
+
+def rollup_age_distribution(now):
+    """
+    Age histogram from the rollup. Resolved tickets are binned exactly; open
+    tickets are aged from the middle of their creation day.
+    """
+    counts = [0] * len(AGE_LABELS)
+    rows = (db.session.query(TicketStats.day, TicketStats.resolution_bin, func.sum(TicketStats.ticket_count))
+            .group_by(TicketStats.day, TicketStats.resolution_bin)
+            .all())
+    for day, resolution_bin, count in rows:
+        if resolution_bin >= 0:
+            counts[resolution_bin] += count
+        else:
+            midday = datetime.combine(day, datetime.min.time()) + timedelta(hours=12)
+            counts[age_bin(max((now - midday).total_seconds(), 0) / 86400)] += count
+    return counts
+
+
+def rollup_resolution_trend(now, months=6):
+    """
+    Average resolution time per 30-day window, to day granularity
+    """
+    window_starts = [now - timedelta(days=30 * (i + 1)) for i in range(months - 1, -1, -1)]
+    totals = [[0, 0.0] for _ in range(months)]
+    rows = (db.session.query(TicketStats.day,
+                             func.sum(TicketStats.resolution_count),
+                             func.sum(TicketStats.resolution_days_sum))
+            .filter(TicketStats.day >= window_starts[0].date(), TicketStats.resolution_count > 0)
+            .group_by(TicketStats.day)
+            .all())
+    for day, resolution_count, resolution_days in rows:
+        for i in range(months - 1, -1, -1):
+            if day >= window_starts[i].date():
+                totals[i][0] += resolution_count
+                totals[i][1] += resolution_days
+                break
+
+    labels = [start.strftime('%Y-%m') for start in window_starts]
+    values = [round(days / count, 1) if count else 0 for count, days in totals]
+    return labels, values
@@ -0,0 +1,61 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # listed in requirements.txt; estimate if it's missing
+    tiktoken = None
+
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logger.warning(f"Could not load tokenizer, estimating token counts: {str(e)}")
+    return _encoding
+
+
+def count_tokens(text):
+    """
+    Count the tokens in text with the model's tokenizer when available,
+    otherwise estimate roughly four characters per token
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return max(1, (len(text) + 3) // 4)
+
+
+def truncate_tokens(text, max_tokens, keep='head'):
+    """
+    Shorten text to about max_tokens tokens, keeping the start ('head'), the
+    end ('tail') or both ends ('middle') and marking the cut with an ellipsis
+    """
+    if not text or count_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ''
+
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text)
+        decode = encoding.decode
+    else:
+        # Four characters per token, matching count_tokens' estimate
+        tokens = text
+        max_tokens *= 4
+        decode = ''.join
+
+    if keep == 'tail':
+        return '…' + decode(tokens[-max_tokens:])
+    if keep == 'middle':
+        head = max_tokens // 2
+        return decode(tokens[:head]) + ' … ' + decode(tokens[len(tokens) - (max_tokens - head):])
+    return decode(tokens[:max_tokens]) + '…'